@@ -0,0 +1,132 @@
+"""Benchmark of the time it takes to import prefect-bitbucket into a fresh worker.
+
+Imports `prefect_bitbucket` with `python -X importtime` in a fresh interpreter that
+has already imported `prefect`, so that only what this package adds to a worker's
+cold start is measured. Fails when the median import time exceeds a threshold, or
+when a module that must only be imported on demand, such as the Atlassian API
+client and its `requests` and `oauthlib` dependencies, is imported eagerly.
+
+With prefect-bitbucket installed (`pip install -e ".[dev]"`), run:
+
+```bash
+python benchmarks/import_benchmarks.py
+python benchmarks/import_benchmarks.py --max-ms 150 --output before.json
+python benchmarks/import_benchmarks.py --compare before.json
+```
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+PACKAGE = "prefect_bitbucket"
+
+# Only needed by some code paths, so importing the package must not import them
+LAZY_MODULES = ("atlassian", "requests", "oauthlib", "requests_oauthlib", "dulwich")
+
+# The default regression threshold for the median import time, in milliseconds
+DEFAULT_MAX_MS = 150.0
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int]]:
+    """Parse `-X importtime` output into (module, self µs, cumulative µs) rows."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def measure_import() -> dict:
+    """Import the package in a fresh interpreter and report what it cost.
+
+    `-X importtime` lists every module after the modules it imported, so the rows
+    between the top-level `prefect` and package rows are exactly the modules the
+    package import pulled in.
+    """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import prefect; import {PACKAGE}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    rows = parse_importtime(process.stderr)
+    names = [name for name, _, _ in rows]
+    start = names.index("prefect") + 1
+    end = names.index(PACKAGE)
+    imported = rows[start : end + 1]
+    return {
+        "cumulative_ms": rows[end][2] / 1000,
+        "modules": {name: self_us / 1000 for name, self_us, _ in imported},
+    }
+
+
+def _top_level_packages(modules: Dict[str, float]) -> Dict[str, float]:
+    """Sum the self time of `modules` by top-level package."""
+    totals: Dict[str, float] = {}
+    for name, self_ms in modules.items():
+        package = name.split(".")[0]
+        totals[package] = totals.get(package, 0.0) + self_ms
+    return totals
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Measure the import time and exit with an error on a regression."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument(
+        "--max-ms",
+        type=float,
+        default=DEFAULT_MAX_MS,
+        help="Fail when the median import time exceeds this many milliseconds.",
+    )
+    parser.add_argument(
+        "--top", type=int, default=10, help="How many of the slowest packages to show."
+    )
+    parser.add_argument("--output", type=Path, help="Write the results as JSON.")
+    parser.add_argument(
+        "--compare", type=Path, help="Show changes against earlier JSON results."
+    )
+    args = parser.parse_args(argv)
+
+    # Warm the file system caches, so that the first run is not an outlier
+    measure_import()
+    runs = [measure_import() for _ in range(args.repeat)]
+    median_ms = statistics.median(run["cumulative_ms"] for run in runs)
+    packages = _top_level_packages(runs[-1]["modules"])
+    eager = sorted(set(packages) & set(LAZY_MODULES))
+    results = {
+        "median_ms": median_ms,
+        "min_ms": min(run["cumulative_ms"] for run in runs),
+        "packages": packages,
+    }
+
+    line = f"import {PACKAGE}: {median_ms:.1f} ms median of {args.repeat} runs"
+    if args.compare:
+        baseline = json.loads(args.compare.read_text())["median_ms"]
+        line += f" ({(median_ms - baseline) / baseline:+.0%} vs {baseline:.1f} ms)"
+    print(line)
+    for package, self_ms in sorted(packages.items(), key=lambda item: -item[1])[
+        : args.top
+    ]:
+        print(f"  {package:<30} {self_ms:8.1f} ms")
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2, sort_keys=True))
+
+    failures = []
+    if eager:
+        failures.append(f"modules imported eagerly: {', '.join(eager)}")
+    if median_ms > args.max_ms:
+        failures.append(f"{median_ms:.1f} ms exceeds the {args.max_ms:.0f} ms limit")
+    if failures:
+        sys.exit(f"Import time regression: {'; '.join(failures)}")
+
+
+if __name__ == "__main__":
+    main()
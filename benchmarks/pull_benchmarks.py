@@ -0,0 +1,398 @@
+"""Benchmarks of `BitBucketRepository.get_directory` against local fixture repositories.
+
+Generates bare repositories of several shapes, serves them over `file://` and over
+HTTP through `git http-backend`, and measures the latency, throughput and peak
+memory of cold and warm pulls for every backend and option combination. Each pull
+runs in a fresh Python process so that its peak RSS is measured in isolation. Git
+subprocesses are left out of the memory figures: forked processes inherit the
+resident set of their parent, which would drown out what git itself uses.
+
+With prefect-bitbucket installed (`pip install -e ".[dev]"`), run all benchmarks
+or a subset of them, and keep the results to compare a change against its
+baseline:
+
+```bash
+python benchmarks/pull_benchmarks.py --output before.json
+python benchmarks/pull_benchmarks.py --shapes monorepo --configs git mirror
+python benchmarks/pull_benchmarks.py --compare before.json --output after.json
+```
+
+Use `--scale` to shrink or grow the generated repositories.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# name -> (`BitBucketRepository` fields, transports it supports)
+CONFIGURATIONS: Dict[str, Tuple[dict, Tuple[str, ...]]] = {
+    "git": ({"backend": "git"}, ("file", "http")),
+    "git-sparse": ({"backend": "git", "sparse_checkout": True}, ("file", "http")),
+    "git-in-place": ({"backend": "git", "checkout_in_place": True}, ("file", "http")),
+    "git-skip-unchanged": (
+        {"backend": "git", "skip_unchanged": True},
+        ("file", "http"),
+    ),
+    "mirror": ({"backend": "mirror"}, ("file", "http")),
+    "mirror-auto-links": (
+        {"backend": "mirror", "materialization": "auto"},
+        ("file", "http"),
+    ),
+    "dulwich": ({"backend": "dulwich"}, ("http",)),
+}
+
+TRANSPORTS = ("file", "http")
+
+Commit = Tuple[str, Dict[str, bytes]]
+
+
+def _text(rng: random.Random, size: int) -> bytes:
+    """Return `size` bytes of compressible, source-code-like text."""
+    words = [b"def", b"return", b"flow", b"task", b"import", b"self", b"None"]
+    data = bytearray()
+    while len(data) < size:
+        data += b" ".join(rng.choice(words) for _ in range(12)) + b"\n"
+    return bytes(data[:size])
+
+
+def _many_small_files(scale: float) -> Iterable[Commit]:
+    """One commit of thousands of 1 KiB files."""
+    rng = random.Random(0)
+    count = max(1, int(5000 * scale))
+    yield "many small files", {
+        f"src/dir-{i // 100:03d}/file-{i:05d}.py": _text(rng, 1024)
+        for i in range(count)
+    }
+
+
+def _few_large_files(scale: float) -> Iterable[Commit]:
+    """One commit of a few large, incompressible files."""
+    rng = random.Random(0)
+    size = max(1024, int(32 * 1024 * 1024 * scale))
+    yield "few large files", {
+        f"data/blob-{i}.bin": rng.getrandbits(8 * size).to_bytes(size, "little")
+        for i in range(3)
+    }
+
+
+def _deep_history(scale: float) -> Iterable[Commit]:
+    """Thousands of small commits to a handful of files."""
+    for i in range(max(1, int(2000 * scale))):
+        yield f"change {i}", {f"src/module_{i % 20}.py": b"VALUE = %d\n" % i * 50}
+
+
+def _monorepo(scale: float) -> Iterable[Commit]:
+    """Many packages, of which a single one is pulled."""
+    rng = random.Random(0)
+    packages = max(2, int(40 * scale))
+    files = {}
+    for package in range(packages):
+        for i in range(100):
+            files[f"packages/pkg-{package:03d}/src/file-{i:03d}.py"] = _text(rng, 2048)
+    yield "monorepo", files
+    for i in range(max(1, int(50 * scale))):
+        package = rng.randrange(packages)
+        yield f"change {i}", {
+            f"packages/pkg-{package:03d}/src/file-000.py": _text(rng, 2048)
+        }
+
+
+# name -> (commit generator, `from_path` to pull)
+SHAPES: Dict[str, Tuple[Callable[[float], Iterable[Commit]], Optional[str]]] = {
+    "many-small-files": (_many_small_files, None),
+    "few-large-files": (_few_large_files, None),
+    "deep-history": (_deep_history, None),
+    "monorepo": (_monorepo, "packages/pkg-001"),
+}
+
+
+def create_repository(path: Path, commits: Iterable[Commit]) -> None:
+    """Create a bare repository at `path` holding `commits` on `main`."""
+    subprocess.run(
+        ["git", "init", "--quiet", "--bare", "--initial-branch=main", str(path)],
+        check=True,
+    )
+    for key, value in (
+        ("uploadpack.allowFilter", "true"),
+        ("uploadpack.allowAnySHA1InWant", "true"),
+        ("http.receivepack", "false"),
+    ):
+        subprocess.run(["git", "-C", str(path), "config", key, value], check=True)
+
+    process = subprocess.Popen(
+        ["git", "-C", str(path), "fast-import", "--quiet"], stdin=subprocess.PIPE
+    )
+    write = process.stdin.write
+    for index, (message, files) in enumerate(commits):
+        write(b"commit refs/heads/main\n")
+        write(b"committer Benchmark <bench@example.com> %d +0000\n" % (10**9 + index))
+        write(b"data %d\n%s\n" % (len(message), message.encode()))
+        for name, data in files.items():
+            write(b"M 100644 inline %s\ndata %d\n" % (name.encode(), len(data)))
+            write(data + b"\n")
+    process.stdin.close()
+    if process.wait() != 0:
+        raise RuntimeError(f"git fast-import failed for {path}")
+
+
+class _GitHTTPHandler(BaseHTTPRequestHandler):
+    """Serves the repositories below `root` through `git http-backend`."""
+
+    root = ""
+
+    def do_GET(self):
+        """Serve ref advertisements."""
+        self._run_backend()
+
+    def do_POST(self):
+        """Serve pack negotiations."""
+        self._run_backend()
+
+    def _read_body(self) -> bytes:
+        """Read the request body, which git sends chunked when it is large."""
+        if self.headers.get("Transfer-Encoding", "").lower() != "chunked":
+            return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        body = bytearray()
+        while True:
+            size = int(self.rfile.readline().split(b";")[0], 16)
+            if size == 0:
+                self.rfile.readline()
+                return bytes(body)
+            body += self.rfile.read(size)
+            self.rfile.readline()
+
+    def _run_backend(self):
+        """Run `git http-backend` as a CGI program for this request."""
+        path, _, query = self.path.partition("?")
+        body = self._read_body()
+        env = {
+            **os.environ,
+            "GIT_PROJECT_ROOT": self.root,
+            "GIT_HTTP_EXPORT_ALL": "1",
+            "PATH_INFO": path,
+            "QUERY_STRING": query,
+            "REQUEST_METHOD": self.command,
+            "CONTENT_TYPE": self.headers.get("Content-Type", ""),
+            "CONTENT_LENGTH": str(len(body)),
+            "REMOTE_ADDR": self.client_address[0],
+        }
+        for header, variable in (
+            ("Git-Protocol", "GIT_PROTOCOL"),
+            ("Content-Encoding", "HTTP_CONTENT_ENCODING"),
+        ):
+            if header in self.headers:
+                env[variable] = self.headers[header]
+        output = subprocess.run(
+            ["git", "http-backend"], input=body, env=env, capture_output=True
+        ).stdout
+
+        head, _, payload = output.partition(b"\r\n\r\n")
+        status, headers = 200, []
+        for line in head.decode().split("\r\n"):
+            name, _, value = line.partition(":")
+            if name.lower() == "status":
+                status = int(value.split()[0])
+            elif name:
+                headers.append((name, value.strip()))
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        """Keep request logs out of the benchmark output."""
+
+
+def serve_repositories(root: Path) -> Tuple[ThreadingHTTPServer, str]:
+    """Serve the repositories below `root` over HTTP; return the server and URL."""
+    handler = type("Handler", (_GitHTTPHandler,), {"root": str(root)})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def _tree_size(path: Path) -> int:
+    """Return the size in bytes of the files below `path`, ignoring `.git`."""
+    total = 0
+    for dir_path, dir_names, file_names in os.walk(path):
+        if ".git" in dir_names:
+            dir_names.remove(".git")
+        for file_name in file_names:
+            total += os.lstat(os.path.join(dir_path, file_name)).st_size
+    return total
+
+
+def _peak_rss_mib() -> float:
+    """Return the peak resident set size of this process in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kibibytes, macOS bytes
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def run_pull(spec: dict) -> dict:
+    """Pull once as described by `spec`; run in a dedicated process."""
+    from prefect_bitbucket.repository import BitBucketRepository
+
+    block = BitBucketRepository(repository=spec["url"], **spec["options"])
+    start = time.perf_counter()
+    stats = block.get_directory(
+        from_path=spec["from_path"], local_path=spec["local_path"]
+    )
+    duration = time.perf_counter() - start
+    return {
+        "duration": duration,
+        "bytes": _tree_size(Path(spec["local_path"])),
+        "rss_mib": _peak_rss_mib(),
+        "phases": stats.phases,
+        "bytes_transferred": stats.bytes_transferred,
+    }
+
+
+def _pull_in_subprocess(spec: dict) -> dict:
+    """Run `run_pull` in a fresh interpreter and return its measurements."""
+    env = {**os.environ, "PREFECT_LOGGING_LEVEL": "WARNING"}
+    result = subprocess.run(
+        [sys.executable, __file__, "--worker", json.dumps(spec)],
+        capture_output=True,
+        text=True,
+        env=env,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def _summarize(runs: List[dict]) -> dict:
+    """Combine repeated measurements: median latency, worst memory."""
+    duration = statistics.median(run["duration"] for run in runs)
+    size = runs[0]["bytes"]
+    return {
+        "seconds": round(duration, 4),
+        "mib_per_second": round(size / duration / 2**20, 2) if duration else None,
+        "mib": round(size / 2**20, 2),
+        "rss_mib": round(max(run["rss_mib"] for run in runs), 1),
+        "phases": {
+            name: round(
+                statistics.median(run["phases"].get(name, 0) for run in runs), 4
+            )
+            for name in runs[0]["phases"]
+        },
+    }
+
+
+def benchmark(
+    shape: str, transport: str, config: str, url: str, work_dir: Path, repeat: int
+) -> Dict[str, dict]:
+    """Measure a cold pull into an empty directory and a warm pull over it."""
+    options, _ = CONFIGURATIONS[config]
+    _, from_path = SHAPES[shape]
+    runs = {"cold": [], "warm": []}
+    for _ in range(repeat):
+        run_dir = Path(tempfile.mkdtemp(dir=work_dir))
+        spec = {
+            "url": url,
+            "options": {**options, "cache_dir": str(run_dir / "cache")}
+            if options["backend"] == "mirror"
+            else options,
+            "from_path": from_path,
+            "local_path": str(run_dir / "dst"),
+        }
+        runs["cold"].append(_pull_in_subprocess(spec))
+        runs["warm"].append(_pull_in_subprocess(spec))
+        shutil.rmtree(run_dir)
+    return {kind: _summarize(kind_runs) for kind, kind_runs in runs.items()}
+
+
+def _print_row(key: str, kind: str, result: dict, baseline: Optional[dict]) -> None:
+    """Print one measurement, with its change against `baseline` if given."""
+    change = ""
+    if baseline is not None:
+        change = f"{(result['seconds'] / baseline['seconds'] - 1) * 100:+7.1f}%"
+    print(
+        f"{key:<45} {kind:<5} {result['seconds']:>9.3f}s {change:>8} "
+        f"{result['mib_per_second'] or 0:>9.1f} MiB/s "
+        f"{result['rss_mib']:>7.1f} MiB peak RSS"
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Generate the fixture repositories and run the selected benchmarks."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shapes", nargs="+", choices=SHAPES, default=list(SHAPES))
+    parser.add_argument(
+        "--transports", nargs="+", choices=TRANSPORTS, default=list(TRANSPORTS)
+    )
+    parser.add_argument(
+        "--configs", nargs="+", choices=CONFIGURATIONS, default=list(CONFIGURATIONS)
+    )
+    parser.add_argument(
+        "--scale", type=float, default=1.0, help="Multiplier for repository sizes."
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", type=Path, help="Write the results as JSON.")
+    parser.add_argument(
+        "--compare", type=Path, help="Show changes against earlier JSON results."
+    )
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(run_pull(json.loads(args.worker))))
+        return
+
+    baseline = json.loads(args.compare.read_text()) if args.compare else {}
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="prefect-bitbucket-bench-") as tmp:
+        root = Path(tmp, "repos")
+        for shape in args.shapes:
+            create_repository(root / f"{shape}.git", SHAPES[shape][0](args.scale))
+        server, http_url = serve_repositories(root)
+        try:
+            for shape in args.shapes:
+                urls = {
+                    "file": (root / f"{shape}.git").as_uri(),
+                    "http": f"{http_url}/{shape}.git",
+                }
+                for transport in args.transports:
+                    for config in args.configs:
+                        if transport not in CONFIGURATIONS[config][1]:
+                            continue
+                        key = f"{shape}/{transport}/{config}"
+                        try:
+                            results[key] = benchmark(
+                                shape,
+                                transport,
+                                config,
+                                urls[transport],
+                                Path(tmp),
+                                args.repeat,
+                            )
+                        except RuntimeError as exc:
+                            print(f"{key:<45} failed: {exc}")
+                            continue
+                        for kind, result in results[key].items():
+                            _print_row(
+                                key, kind, result, baseline.get(key, {}).get(kind)
+                            )
+        finally:
+            server.shutdown()
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2, sort_keys=True))
+
+
+if __name__ == "__main__":
+    main()
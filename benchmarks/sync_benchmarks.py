@@ -0,0 +1,136 @@
+"""Benchmarks of the copy engine that writes pulled trees into their destination.
+
+Generates a tree of tens of thousands of files and measures how fast it is
+written into an empty directory (cold) and over an unchanged copy of itself
+(warm) by `sync_tree` with one thread and with its default thread pool, against
+`shutil.copytree`, which copies one file at a time like the
+`distutils.dir_util.copy_tree` that `get_directory` originally used.
+
+With prefect-bitbucket installed (`pip install -e ".[dev]"`), run:
+
+```bash
+python benchmarks/sync_benchmarks.py --output before.json
+python benchmarks/sync_benchmarks.py --files 50000 --engines sync-1 sync-pool
+python benchmarks/sync_benchmarks.py --compare before.json
+```
+
+Pass `--work-dir` to benchmark a specific file system, e.g. a network mount.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from prefect_bitbucket._sync import sync_tree
+
+# name -> function writing the first directory into the second one
+ENGINES: Dict[str, Callable[[str, str], object]] = {
+    "copytree": lambda src, dst: shutil.copytree(src, dst, dirs_exist_ok=True),
+    "sync-1": lambda src, dst: sync_tree(src, dst, workers=1),
+    "sync-pool": lambda src, dst: sync_tree(src, dst),
+}
+
+
+def _random_bytes(rng: random.Random, size: int) -> bytes:
+    """Return `size` reproducible random bytes."""
+    return rng.getrandbits(size * 8).to_bytes(size, "little")
+
+
+def create_tree(root: Path, num_files: int, num_large_files: int) -> int:
+    """Write a tree of small files and a few large ones; return its size in bytes."""
+    rng = random.Random(0)
+    total = 0
+    for i in range(num_files):
+        path = root / f"pkg-{i % 50:02d}" / f"mod-{i % 17:02d}" / f"file-{i}.py"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = _random_bytes(rng, rng.randint(256, 8192))
+        path.write_bytes(data)
+        total += len(data)
+    for i in range(num_large_files):
+        path = root / "assets" / f"blob-{i}.bin"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = _random_bytes(rng, 32 * 2**20)
+        path.write_bytes(data)
+        total += len(data)
+    return total
+
+
+def benchmark(
+    engine: str, src: Path, work_dir: Path, size: int, repeat: int
+) -> Dict[str, dict]:
+    """Measure a cold write into an empty directory and a warm one over it."""
+    runs: Dict[str, List[float]] = {"cold": [], "warm": []}
+    for _ in range(repeat):
+        dst = Path(tempfile.mkdtemp(dir=work_dir)) / "dst"
+        for kind in runs:
+            start = time.perf_counter()
+            ENGINES[engine](str(src), str(dst))
+            runs[kind].append(time.perf_counter() - start)
+        shutil.rmtree(dst.parent)
+    return {
+        kind: {
+            "seconds": round(statistics.median(durations), 4),
+            "mib_per_second": round(size / statistics.median(durations) / 2**20, 2),
+        }
+        for kind, durations in runs.items()
+    }
+
+
+def _print_row(key: str, result: dict, baseline: Optional[dict]) -> None:
+    """Print one measurement, with its change against `baseline` if given."""
+    change = ""
+    if baseline is not None:
+        change = f"{(result['seconds'] / baseline['seconds'] - 1) * 100:+7.1f}%"
+    print(
+        f"{key:<20} {result['seconds']:>9.3f}s {change:>8} "
+        f"{result['mib_per_second']:>9.1f} MiB/s"
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Generate the source tree and run the selected benchmarks."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--engines", nargs="+", choices=ENGINES, default=list(ENGINES))
+    parser.add_argument("--files", type=int, default=30000)
+    parser.add_argument("--large-files", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--work-dir", type=Path, help="Where to create the trees; defaults to /tmp."
+    )
+    parser.add_argument("--output", type=Path, help="Write the results as JSON.")
+    parser.add_argument(
+        "--compare", type=Path, help="Show changes against earlier JSON results."
+    )
+    args = parser.parse_args(argv)
+
+    baseline = json.loads(args.compare.read_text()) if args.compare else {}
+    results = {}
+    with tempfile.TemporaryDirectory(
+        prefix="prefect-bitbucket-bench-", dir=args.work_dir
+    ) as tmp:
+        src = Path(tmp, "src")
+        size = create_tree(src, args.files, args.large_files)
+        print(
+            f"{args.files + args.large_files} files, {size / 2**20:.1f} MiB, "
+            f"{os.cpu_count()} CPUs"
+        )
+        for engine in args.engines:
+            for kind, result in benchmark(
+                engine, src, Path(tmp), size, args.repeat
+            ).items():
+                key = f"{engine}/{kind}"
+                results[key] = result
+                _print_row(key, result, baseline.get(key))
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2, sort_keys=True))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,391 @@
+"""Download repository snapshots as archives through the BitBucket REST API.
+
+This lets `BitBucketRepository` pull a single reference without a git
+installation. Archives are streamed from the server and extracted file by file
+as they arrive, so they are never held in memory or written to disk as a whole.
+"""
+import os
+import posixpath
+import shutil
+import tarfile
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from urllib.parse import quote, urlparse
+
+import httpx
+
+CLOUD_HOSTS = ("bitbucket.org", "www.bitbucket.org")
+CLOUD_API_URL = "https://api.bitbucket.org/2.0"
+
+
+@dataclass
+class ArchiveRequest:
+    """Where to download an archive from and how to read it.
+
+    Attributes:
+        url: The archive endpoint.
+        params: Query parameters for the archive endpoint.
+        strip_components: How many leading path components to drop from every
+            member of the archive.
+
+    """
+
+    url: str
+    params: Dict[str, str] = field(default_factory=dict)
+    strip_components: int = 0
+
+
+def _split_repository(repository: str) -> Tuple[str, str, str]:
+    """Return `(base_url, owner, slug)` for a BitBucket HTTPS repository URL.
+
+    For BitBucket Cloud the owner is the workspace; for BitBucket Server it is
+    the project key (or `~user` for personal repositories) and the base URL
+    includes any context path in front of `/scm/`.
+    """
+    url_components = urlparse(repository)
+    if url_components.scheme not in ("http", "https"):
+        raise ValueError(
+            "Archive downloads require a BitBucket repository URL in the "
+            f"'HTTPS' format, got {repository!r}."
+        )
+    netloc = url_components.hostname or ""
+    if url_components.port:
+        netloc = f"{netloc}:{url_components.port}"
+    path = url_components.path.rstrip("/")
+    if path.endswith(".git"):
+        path = path[: -len(".git")]
+
+    context, scm, rest = path.rpartition("/scm/")
+    if not scm:
+        context, rest = "", path.lstrip("/")
+    parts = rest.split("/")
+    if len(parts) != 2 or not all(parts):
+        raise ValueError(
+            f"Could not determine the owner and name of repository {repository!r}."
+        )
+    base_url = f"{url_components.scheme}://{netloc}{context}"
+    return base_url, parts[0], parts[1]
+
+
+def is_cloud(repository: str) -> bool:
+    """Whether `repository` is hosted on BitBucket Cloud."""
+    return (urlparse(repository).hostname or "").lower() in CLOUD_HOSTS
+
+
+def _get_cloud_main_branch(client: httpx.Client, owner: str, slug: str) -> str:
+    """Look up the name of the default branch of a BitBucket Cloud repository."""
+    response = client.get(f"{CLOUD_API_URL}/repositories/{owner}/{slug}")
+    response.raise_for_status()
+    return response.json()["mainbranch"]["name"]
+
+
+def get_archive_request(
+    repository: str,
+    reference: Optional[str],
+    client: httpx.Client,
+    sub_directory: Optional[str] = None,
+) -> ArchiveRequest:
+    """Work out the archive download for `reference` of `repository`.
+
+    Without a reference, BitBucket Server archives the default branch on its own,
+    while BitBucket Cloud needs an extra API call to find it. BitBucket Server
+    can also restrict the archive to `sub_directory` so the rest of the
+    repository is never sent; Cloud archives always hold the whole repository.
+    """
+    base_url, owner, slug = _split_repository(repository)
+    if is_cloud(repository):
+        if reference is None:
+            reference = _get_cloud_main_branch(client, owner, slug)
+        # Cloud archives wrap everything in a `<owner>-<slug>-<sha>/` directory
+        return ArchiveRequest(
+            url=f"https://bitbucket.org/{owner}/{slug}/get/"
+            f"{quote(reference, safe='')}.tar.gz",
+            strip_components=1,
+        )
+
+    params = {"format": "tgz"}
+    if reference is not None:
+        params["at"] = reference
+    if sub_directory:
+        # Members keep their repository-relative paths
+        params["path"] = sub_directory
+    return ArchiveRequest(
+        url=f"{base_url}/rest/api/latest/projects/{owner}/repos/{slug}/archive",
+        params=params,
+    )
+
+
+class _ResponseReader:
+    """A minimal file-like view of a streamed HTTP response body."""
+
+    def __init__(self, chunks: Iterator[bytes]):
+        """Read from the given iterator of body chunks."""
+        self._chunks = chunks
+        self._buffer = b""
+
+    def read(self, size: int = -1) -> bytes:
+        """Return up to `size` bytes, or everything that is left if negative."""
+        while size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer += next(self._chunks)
+            except StopIteration:
+                break
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def _member_path(
+    name: str, strip_components: int, sub_directory: Optional[str]
+) -> Optional[str]:
+    """Return where an archive member goes relative to the destination.
+
+    Returns `None` for members that are outside `sub_directory` or that would
+    escape the destination.
+    """
+    parts = [part for part in name.split("/") if part not in ("", ".")]
+    parts = parts[strip_components:]
+    if not parts or ".." in parts or os.path.isabs(name):
+        return None
+    path = "/".join(parts)
+    if sub_directory:
+        if path != sub_directory and not path.startswith(f"{sub_directory}/"):
+            return None
+        path = posixpath.relpath(path, sub_directory)
+    return path
+
+
+def _is_within(path: str, root: str) -> bool:
+    """Check whether the real path `path` is `root` or below it."""
+    return path == root or path.startswith(os.path.join(root, ""))
+
+
+def _write_member(tar: tarfile.TarFile, member: tarfile.TarInfo, path: str) -> None:
+    """Write a regular file member to `path`, replacing it atomically."""
+    tmp_path = os.path.join(
+        os.path.dirname(path), f".{os.path.basename(path)}.{uuid.uuid4().hex}.tmp"
+    )
+    source = tar.extractfile(member)
+    try:
+        with open(tmp_path, "wb") as destination:
+            shutil.copyfileobj(source, destination)
+        os.chmod(tmp_path, 0o755 if member.mode & 0o111 else 0o644)
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.lexists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def extract_stream(
+    chunks: Iterator[bytes],
+    destination: str,
+    strip_components: int = 0,
+    sub_directory: Optional[str] = None,
+    ignore: Optional[Callable[[str, bool], bool]] = None,
+) -> Set[str]:
+    """Extract a gzipped tar stream into `destination` as it is read.
+
+    Args:
+        chunks: The compressed archive, in chunks.
+        destination: The directory to extract into; created if needed.
+        strip_components: How many leading path components to drop from members.
+        sub_directory: If given, only members below this repository-relative
+            directory are extracted, relative to it.
+        ignore: If given, members for which it returns true when called with
+            their path relative to `destination` and whether they are a
+            directory are skipped.
+
+    Returns:
+        The paths that were extracted, relative to `destination`.
+
+    """
+    extracted = set()
+    os.makedirs(destination, exist_ok=True)
+    root = os.path.realpath(destination)
+    with tarfile.open(fileobj=_ResponseReader(chunks), mode="r|gz") as tar:
+        for member in tar:
+            rel_path = _member_path(member.name, strip_components, sub_directory)
+            if rel_path is None or rel_path == ".":
+                continue
+            if ignore is not None and ignore(rel_path, member.isdir()):
+                continue
+            path = os.path.join(root, *rel_path.split("/"))
+            # Never write through a symlink, which links created earlier in the
+            # same archive could make point anywhere
+            if os.path.realpath(os.path.dirname(path)) != os.path.dirname(path):
+                continue
+
+            if member.isdir():
+                if os.path.lexists(path) and (
+                    os.path.islink(path) or not os.path.isdir(path)
+                ):
+                    os.unlink(path)
+                os.makedirs(path, exist_ok=True)
+            elif member.isfile():
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                _write_member(tar, member, path)
+            elif member.issym():
+                target = os.path.realpath(
+                    os.path.join(os.path.dirname(path), member.linkname)
+                )
+                if os.path.isabs(member.linkname) or not _is_within(target, root):
+                    # Never create links pointing outside the destination
+                    continue
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                if os.path.lexists(path):
+                    if os.path.isdir(path) and not os.path.islink(path):
+                        shutil.rmtree(path)
+                    else:
+                        os.unlink(path)
+                os.symlink(member.linkname, path)
+            else:
+                continue
+            extracted.add(rel_path)
+    return extracted
+
+
+def remove_unlisted(destination: str, keep: Set[str]) -> Set[str]:
+    """Delete everything below `destination` that is not in `keep`.
+
+    Directories that contain a kept path are preserved. Returns the paths that
+    were deleted, relative to `destination`.
+    """
+    kept_dirs = set()
+    for path in keep:
+        parent = posixpath.dirname(path)
+        while parent:
+            kept_dirs.add(parent)
+            parent = posixpath.dirname(parent)
+
+    deleted = set()
+    for dir_path, dir_names, file_names in os.walk(destination):
+        rel_dir = os.path.relpath(dir_path, destination).replace(os.sep, "/")
+        for name in list(dir_names) + file_names:
+            rel_path = name if rel_dir == "." else f"{rel_dir}/{name}"
+            if rel_path in keep or rel_path in kept_dirs:
+                continue
+            path = os.path.join(dir_path, name)
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path)
+                dir_names.remove(name)
+            else:
+                os.unlink(path)
+            deleted.add(rel_path)
+    return deleted
+
+
+def _count_bytes(chunks: Iterator[bytes], counter: List[int]) -> Iterator[bytes]:
+    """Pass `chunks` through, adding their total length to `counter[0]`."""
+    for chunk in chunks:
+        counter[0] += len(chunk)
+        yield chunk
+
+
+@contextmanager
+def _raise_pull_errors() -> Iterator[None]:
+    """Turn HTTP errors into the `OSError` that failed pulls raise."""
+    try:
+        yield
+    except httpx.HTTPStatusError as exc:
+        url = exc.request.url.copy_with(query=None)
+        raise OSError(
+            "Failed to pull from remote:\n "
+            f"HTTP {exc.response.status_code} from {url}"
+        ) from exc
+    except httpx.HTTPError as exc:
+        raise OSError(f"Failed to pull from remote:\n {exc}") from exc
+
+
+def _resolve_revision(
+    client: httpx.Client, repository: str, reference: str
+) -> Optional[str]:
+    """Return the commit SHA `reference` points at, or `None` if it is missing."""
+    base_url, owner, slug = _split_repository(repository)
+    if is_cloud(repository):
+        if reference == "HEAD":
+            reference = _get_cloud_main_branch(client, owner, slug)
+        response = client.get(
+            f"{CLOUD_API_URL}/repositories/{owner}/{slug}/commit/"
+            f"{quote(reference, safe='')}"
+        )
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json()["hash"]
+
+    # Without `until`, BitBucket Server lists the commits of the default branch
+    params = {"limit": "1"}
+    if reference != "HEAD":
+        params["until"] = reference
+    response = client.get(
+        f"{base_url}/rest/api/latest/projects/{owner}/repos/{slug}/commits",
+        params=params,
+    )
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    commits = response.json()["values"]
+    return commits[0]["id"] if commits else None
+
+
+def resolve_revisions(
+    repository: str,
+    references: Iterable[str],
+    auth: Optional[httpx.Auth] = None,
+    headers: Optional[Dict[str, str]] = None,
+) -> Dict[str, str]:
+    """Resolve branches and tags of `repository` to commit SHAs.
+
+    Takes one REST API request per reference, over a single connection. `HEAD`
+    is the default branch, and references that do not exist are left out.
+    """
+    resolved = {}
+    with _raise_pull_errors(), httpx.Client(
+        auth=auth, headers=headers, follow_redirects=True, timeout=60
+    ) as client:
+        for reference in references:
+            sha = _resolve_revision(client, repository, reference)
+            if sha is not None:
+                resolved[reference] = sha
+    return resolved
+
+
+def download_archive(
+    repository: str,
+    reference: Optional[str],
+    destination: str,
+    auth: Optional[httpx.Auth] = None,
+    headers: Optional[Dict[str, str]] = None,
+    sub_directory: Optional[str] = None,
+    ignore: Optional[Callable[[str, bool], bool]] = None,
+) -> Tuple[Set[str], int]:
+    """Download `reference` of `repository` and extract it into `destination`.
+
+    Returns the paths that were extracted, relative to `destination`, and the
+    number of compressed bytes that were downloaded. Paths for which `ignore`
+    returns true are not extracted; see `extract_stream`.
+    """
+    downloaded = [0]
+    with _raise_pull_errors():
+        with httpx.Client(
+            auth=auth, headers=headers, follow_redirects=True, timeout=60
+        ) as client:
+            request = get_archive_request(
+                repository, reference, client, sub_directory=sub_directory
+            )
+            with client.stream("GET", request.url, params=request.params) as response:
+                response.raise_for_status()
+                extracted = extract_stream(
+                    _count_bytes(response.iter_bytes(), downloaded),
+                    destination,
+                    strip_components=request.strip_components,
+                    sub_directory=sub_directory,
+                    ignore=ignore,
+                )
+                return extracted, downloaded[0]
@@ -0,0 +1,381 @@
+"""On-disk caches shared by every `BitBucketRepository` pointing at a cache directory.
+
+All structures in this module are safe to use from several worker processes at
+once: entries are written to a staging location and atomically renamed into place,
+and anything that removes entries does so while holding an exclusive file lock.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager, suppress
+from pathlib import Path
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Hashable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+import anyio
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+    import msvcrt
+
+T = TypeVar("T")
+
+
+def _try_lock(fd: int, shared: bool, blocking: bool) -> bool:
+    """Lock the open file `fd`, returning whether the lock was acquired."""
+    if fcntl is not None:
+        operation = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+        if not blocking:
+            operation |= fcntl.LOCK_NB
+        try:
+            fcntl.flock(fd, operation)
+        except BlockingIOError:
+            return False
+        return True
+    else:  # pragma: no cover - Windows
+        try:
+            msvcrt.locking(fd, msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+        except OSError:
+            if blocking:
+                raise
+            return False
+        return True
+
+
+def _unlock(fd: int) -> None:
+    """Release the lock held on the open file `fd`."""
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:  # pragma: no cover - Windows
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+def _open_lock_file(path: Path) -> int:
+    """Open (creating it if needed) the file backing a lock."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return os.open(str(path), os.O_RDWR | os.O_CREAT, 0o644)
+
+
+@contextmanager
+def file_lock(path: Path, shared: bool = False) -> Iterator[None]:
+    """Hold an advisory lock on `path` for the duration of the context.
+
+    Shared locks may be held by several processes at once; exclusive locks wait for
+    every other holder to release. Platforms without `fcntl` only support exclusive
+    locks, so `shared` is ignored there.
+    """
+    fd = _open_lock_file(path)
+    try:
+        _try_lock(fd, shared=shared, blocking=True)
+        try:
+            yield
+        finally:
+            _unlock(fd)
+    finally:
+        os.close(fd)
+
+
+@asynccontextmanager
+async def async_file_lock(
+    path: Path, shared: bool = False, poll_interval: float = 0.05
+) -> AsyncIterator[None]:
+    """Hold an advisory lock on `path` without blocking the event loop.
+
+    The lock is polled for rather than waited on in a thread, so cancelling the
+    waiting task never leaves a lock acquired behind its back. Separate opens of
+    the same file conflict, so an exclusive lock also excludes other tasks and
+    threads of the current process. As with `file_lock`, `shared` is ignored on
+    platforms without `fcntl`.
+    """
+    fd = _open_lock_file(path)
+    try:
+        delay = poll_interval
+        while not _try_lock(fd, shared=shared, blocking=False):
+            await anyio.sleep(delay)
+            delay = min(delay * 2, 1.0)
+        try:
+            yield
+        finally:
+            _unlock(fd)
+    finally:
+        os.close(fd)
+
+
+class SingleFlight:
+    """Collapses concurrent calls for the same key into one.
+
+    While a call for a key is in flight, other callers for that key wait for it
+    and receive its result (or exception) instead of doing the work again. Calls
+    are only shared between tasks of the same event loop.
+    """
+
+    def __init__(self):
+        """Start without any calls in flight."""
+        self._calls: Dict[Tuple[int, Hashable], "asyncio.Future"] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """Return the result of `fn()`, sharing it with concurrent callers."""
+        loop = asyncio.get_running_loop()
+        call_key = (id(loop), key)
+        future = self._calls.get(call_key)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = loop.create_future()
+        self._calls[call_key] = future
+        try:
+            result = await fn()
+        except BaseException as exc:
+            future.set_exception(exc)
+            # Mark the exception as retrieved in case nobody else was waiting
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[call_key]
+
+
+class ReferenceCache:
+    """Commit SHAs that references were resolved to, trusted for a limited time.
+
+    Resolutions are kept in memory and, when a `root` directory is given, in one
+    small JSON file per reference below it, so that every process sharing the
+    directory benefits from them. Callers say how old a resolution they accept,
+    so blocks with different time-to-live settings can share the same entries.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        """Start empty; `clock` returns the current time as a POSIX timestamp."""
+        self._entries: Dict[Tuple[str, str], Tuple[str, float]] = {}
+        self._clock = clock
+
+    @staticmethod
+    def _path(root: Path, repository: str, reference: str) -> Path:
+        """Return the file storing the resolution of `reference` below `root`."""
+        key = hashlib.sha256(f"{repository}\0{reference}".encode()).hexdigest()
+        return root / f"{key}.json"
+
+    @staticmethod
+    def _read(path: Path) -> Optional[Tuple[str, float]]:
+        """Return the `(sha, resolved_at)` stored in `path`, if it holds any."""
+        try:
+            data = json.loads(path.read_text())
+            return data["sha"], float(data["resolved_at"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _is_fresh(self, entry: Optional[Tuple[str, float]], max_age: float) -> bool:
+        """Check whether `entry` was resolved at most `max_age` seconds ago."""
+        return entry is not None and 0 <= self._clock() - entry[1] < max_age
+
+    def get(
+        self,
+        repository: str,
+        reference: str,
+        max_age: float,
+        root: Optional[Path] = None,
+    ) -> Optional[str]:
+        """Return the SHA `reference` resolved to at most `max_age` seconds ago."""
+        key = (repository, reference)
+        entry = self._entries.get(key)
+        if root is not None and not self._is_fresh(entry, max_age):
+            stored = self._read(self._path(root, repository, reference))
+            if stored is not None and (entry is None or stored[1] > entry[1]):
+                entry = self._entries[key] = stored
+        return entry[0] if self._is_fresh(entry, max_age) else None
+
+    def put(
+        self, repository: str, reference: str, sha: str, root: Optional[Path] = None
+    ) -> None:
+        """Remember that `reference` resolves to `sha` as of now."""
+        resolved_at = self._clock()
+        self._entries[(repository, reference)] = (sha, resolved_at)
+        if root is None:
+            return
+
+        staging = root / f".staging-{uuid.uuid4().hex}"
+        try:
+            root.mkdir(parents=True, exist_ok=True)
+            staging.write_text(
+                json.dumps(
+                    {
+                        "repository": repository,
+                        "reference": reference,
+                        "sha": sha,
+                        "resolved_at": resolved_at,
+                    }
+                )
+            )
+            os.replace(staging, self._path(root, repository, reference))
+        except OSError:
+            # Resolutions are cheap to redo, so failing to share one is no error
+            with suppress(OSError):
+                staging.unlink()
+
+
+def _remove_tree(path: Path) -> None:
+    """Remove the directory at `path`.
+
+    The directory is first moved out of the way so readers never see a partially
+    deleted directory under its original name.
+    """
+    trash = path.with_name(f".trash-{uuid.uuid4().hex}")
+    try:
+        os.replace(path, trash)
+    except FileNotFoundError:
+        return
+    shutil.rmtree(trash, ignore_errors=True)
+
+
+def _tree_size(path: Path) -> int:
+    """Return the total size in bytes of the files below `path`."""
+    total = 0
+    for dir_path, _, file_names in os.walk(path):
+        for file_name in file_names:
+            try:
+                total += os.lstat(os.path.join(dir_path, file_name)).st_size
+            except FileNotFoundError:
+                pass
+    return total
+
+
+class SnapshotCache:
+    """Fully materialized repository trees keyed by commit SHA and sub-directory.
+
+    Each entry is a directory `<root>/<key>/` holding the snapshot in `tree/`, its
+    size in bytes in `size` and a `last-used` file whose modification time drives
+    least-recently-used eviction once the cache grows beyond `max_size` bytes.
+    """
+
+    def __init__(self, root: Path, max_size: int):
+        """Manage the snapshots stored below `root`."""
+        self.root = root
+        self.max_size = max_size
+        self._lock_path = root / ".lock"
+
+    @staticmethod
+    def _key(sha: str, from_path: Optional[str]) -> str:
+        """Return the directory name of the entry for `sha` and `from_path`."""
+        sub_directory = Path(from_path).as_posix().strip("/") if from_path else ""
+        if not sub_directory or sub_directory == ".":
+            return sha
+        suffix = hashlib.sha256(sub_directory.encode()).hexdigest()[:16]
+        return f"{sha}-{suffix}"
+
+    @contextmanager
+    def open(self, sha: str, from_path: Optional[str]) -> Iterator[Optional[Path]]:
+        """Yield the snapshot tree for `sha` and `from_path`, or `None` on a miss.
+
+        The snapshot is guaranteed not to be evicted until the context exits.
+        """
+        with file_lock(self._lock_path, shared=True):
+            yield self._use(sha, from_path)
+
+    @asynccontextmanager
+    async def open_async(
+        self, sha: str, from_path: Optional[str]
+    ) -> AsyncIterator[Optional[Path]]:
+        """Like `open`, but waits for an eviction in progress without blocking."""
+        async with async_file_lock(self._lock_path, shared=True):
+            yield self._use(sha, from_path)
+
+    def _use(self, sha: str, from_path: Optional[str]) -> Optional[Path]:
+        """Return the snapshot tree for `sha` and `from_path` and mark it used."""
+        entry = self.root / self._key(sha, from_path)
+        tree = entry / "tree"
+        if not tree.is_dir():
+            return None
+        os.utime(entry / "last-used")
+        return tree
+
+    def put(self, sha: str, from_path: Optional[str], source: Path) -> None:
+        """Store a copy of `source` as the snapshot for `sha` and `from_path`.
+
+        Git metadata is left out of the snapshot. Old snapshots are evicted
+        afterwards if the cache is over budget.
+        """
+        entry = self.root / self._key(sha, from_path)
+        if (entry / "tree").is_dir():
+            return
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        staging = self.root / f".staging-{uuid.uuid4().hex}"
+        try:
+            shutil.copytree(
+                source,
+                staging / "tree",
+                symlinks=True,
+                ignore=shutil.ignore_patterns(".git"),
+            )
+            (staging / "size").write_text(str(_tree_size(staging / "tree")))
+            (staging / "last-used").touch()
+            try:
+                os.replace(staging, entry)
+            except OSError:
+                # Another process stored the same snapshot first
+                pass
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+        self.evict(keep=entry.name)
+
+    def _entries(self) -> List[Tuple[float, int, Path]]:
+        """Return `(last_used, size, path)` for every complete snapshot."""
+        entries = []
+        for entry in self.root.iterdir():
+            if entry.name.startswith("."):
+                continue
+            try:
+                last_used = (entry / "last-used").stat().st_mtime
+                size = int((entry / "size").read_text())
+            except (OSError, ValueError):
+                continue
+            entries.append((last_used, size, entry))
+        return entries
+
+    def evict(self, keep: Optional[str] = None) -> None:
+        """Remove least recently used snapshots until the cache fits in `max_size`.
+
+        Args:
+            keep: The name of an entry that must survive, e.g. the one just added.
+
+        """
+        with file_lock(self._lock_path):
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, entry in entries:
+                if total <= self.max_size:
+                    break
+                if entry.name == keep:
+                    continue
+                _remove_tree(entry)
+                total -= size
+
+            # Clean up after processes that died while staging or removing
+            cutoff = time.time() - 3600
+            for pattern in (".staging-*", ".trash-*"):
+                for leftover in self.root.glob(pattern):
+                    try:
+                        if leftover.stat().st_mtime < cutoff:
+                            shutil.rmtree(leftover, ignore_errors=True)
+                    except FileNotFoundError:
+                        pass
@@ -0,0 +1,57 @@
+"""Bounded capture of subprocess output."""
+import io
+from collections import deque
+from typing import Deque
+
+# Enough for any error message git prints, while a chatty or long-running
+# command cannot make the capture grow without bound
+DEFAULT_MAX_CHARS = 64 * 1024
+
+
+class TailBuffer(io.TextIOBase):
+    """A text sink that keeps only the last `max_chars` characters written to it.
+
+    It can be used in place of an `io.StringIO` as a `run_process` output sink when
+    only the end of the output is of interest, such as for error messages. It is a
+    `io.TextIOBase` because older versions of prefect only accept sinks that are.
+    """
+
+    def __init__(self, max_chars: int = DEFAULT_MAX_CHARS):
+        """Keep at most `max_chars` characters."""
+        if max_chars < 1:
+            raise ValueError("max_chars must be at least 1.")
+        super().__init__()
+        self.max_chars = max_chars
+        self.truncated = False
+        self._chunks: Deque[str] = deque()
+        self._size = 0
+
+    def write(self, text: str) -> int:
+        """Append `text`, dropping the oldest output beyond `max_chars`."""
+        self._chunks.append(text)
+        self._size += len(text)
+
+        excess = self._size - self.max_chars
+        while excess > 0:
+            self.truncated = True
+            first = self._chunks[0]
+            if len(first) <= excess:
+                self._chunks.popleft()
+                self._size -= len(first)
+                excess -= len(first)
+            else:
+                self._chunks[0] = first[excess:]
+                self._size -= excess
+                excess = 0
+        return len(text)
+
+    def writable(self) -> bool:
+        """Return `True`; the buffer accepts writes."""
+        return True
+
+    def getvalue(self) -> str:
+        """Return the retained output, marking where earlier output was dropped."""
+        text = "".join(self._chunks)
+        if self.truncated:
+            return f"[... earlier output truncated ...]\n{text}"
+        return text
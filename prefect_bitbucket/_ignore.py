@@ -0,0 +1,75 @@
+"""Exclusion of files from pulls with `.gitignore` style patterns.
+
+Patterns follow the `.gitignore` syntax, including `!` to re-include what an
+earlier pattern excluded, and are relative to the root of the pulled directory.
+They come from the block's `ignore_patterns` and from an ignore file, such as a
+`.prefectignore`, in that directory, which Prefect's own storage also reads.
+"""
+import posixpath
+from typing import Callable, Iterable, List, Optional
+
+import pathspec
+
+# Decides whether a path relative to the pulled directory is excluded, given
+# whether it is a directory
+IgnoreFunction = Callable[[str, bool], bool]
+
+
+def read_ignore_file(path: str) -> List[str]:
+    """Return the patterns in the ignore file at `path`, or none if it is missing."""
+    try:
+        with open(path, encoding="utf-8") as ignore_file:
+            return ignore_file.read().splitlines()
+    except FileNotFoundError:
+        return []
+
+
+def compile_ignore_patterns(patterns: Iterable[str]) -> Optional[IgnoreFunction]:
+    """Return a function telling whether a path is excluded by `patterns`.
+
+    Returns `None` when the patterns exclude nothing.
+    """
+    patterns = [pattern for pattern in patterns if _is_pattern(pattern)]
+    if not patterns:
+        return None
+    # `GitIgnoreSpec` was added in pathspec 0.10 and follows git more closely
+    spec_class = getattr(pathspec, "GitIgnoreSpec", None)
+    if spec_class is not None:
+        spec = spec_class.from_lines(patterns)
+    else:  # pragma: no cover
+        spec = pathspec.PathSpec.from_lines("gitwildmatch", patterns)
+
+    def is_ignored(rel_path: str, is_dir: bool = False) -> bool:
+        return spec.match_file(f"{rel_path}/" if is_dir else rel_path)
+
+    return is_ignored
+
+
+def to_sparse_patterns(patterns: Iterable[str], base: Optional[str]) -> List[str]:
+    """Translate ignore patterns into patterns for a non-cone sparse checkout.
+
+    Sparse checkout patterns use the same syntax, but select what is checked out
+    rather than what is excluded, and are relative to the repository root, so
+    every pattern is negated and moved below `base`, the repository-relative
+    directory that is pulled.
+    """
+    prefix = f"/{base}/" if base else "/"
+    sparse_patterns = [prefix if base else "/*"]
+    for pattern in patterns:
+        if not _is_pattern(pattern):
+            continue
+        negated = pattern.startswith("!")
+        pattern = pattern[1:] if negated else pattern
+        # A pattern with a slash other than a trailing one only matches relative
+        # to the pulled directory, others match at any depth below it
+        if "/" in pattern.rstrip("/"):
+            pattern = posixpath.join(prefix, pattern.lstrip("/"))
+        else:
+            pattern = posixpath.join(prefix, "**", pattern)
+        sparse_patterns.append(pattern if negated else f"!{pattern}")
+    return sparse_patterns
+
+
+def _is_pattern(line: str) -> bool:
+    """Check whether a line of an ignore file holds a pattern."""
+    return bool(line.strip()) and not line.startswith("#")
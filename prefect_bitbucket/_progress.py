@@ -0,0 +1,127 @@
+"""Live reporting of the progress git prints while it transfers objects.
+
+Git only prints progress to a terminal unless it is run with `--progress`, and then
+rewrites the same line with carriage returns as the transfer proceeds. The stream
+in this module picks those lines out of git's stderr as they arrive, so that slow
+or stalled pulls become visible while they happen.
+"""
+import re
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from prefect_bitbucket._capture import DEFAULT_MAX_CHARS, TailBuffer
+
+_PROGRESS_PATTERN = re.compile(
+    r"^(?:remote: )?(?P<phase>[A-Z][A-Za-z ]*?):\s+(?P<percent>\d+)% "
+    r"\((?P<done>\d+)/(?P<total>\d+)\)"
+    r"(?:, (?P<size>\d+(?:\.\d+)? [KMGT]?i?B))?"
+    r"(?: \| (?P<rate>\d+(?:\.\d+)? [KMGT]?i?B)/s)?"
+)
+
+_UNITS = {"B": 1, "KiB": 2**10, "MiB": 2**20, "GiB": 2**30, "TiB": 2**40}
+
+
+def _parse_size(text: Optional[str]) -> Optional[int]:
+    """Convert a size printed by git, like `1.50 MiB`, to bytes."""
+    if text is None:
+        return None
+    value, unit = text.split()
+    return int(float(value) * _UNITS.get(unit, 1))
+
+
+@dataclass
+class GitProgress:
+    """A progress update printed by git.
+
+    Attributes:
+        phase: What git is doing, e.g. `Receiving objects` or `Resolving deltas`.
+        percent: How far along the phase is.
+        done: The number of objects (or files) processed so far.
+        total: The number of objects (or files) to process.
+        bytes_received: The amount of data received so far, for phases that
+            transfer data.
+        rate: The transfer rate in bytes per second, for phases that transfer
+            data.
+
+    """
+
+    phase: str
+    percent: int
+    done: int
+    total: int
+    bytes_received: Optional[int] = None
+    rate: Optional[float] = None
+
+    def __str__(self) -> str:
+        """Format the update like git does."""
+        text = f"{self.phase}: {self.percent}% ({self.done}/{self.total})"
+        if self.bytes_received is not None:
+            text += f", {self.bytes_received / 2**20:.2f} MiB"
+        if self.rate is not None:
+            text += f" at {self.rate / 2**20:.2f} MiB/s"
+        return text
+
+
+def parse_progress(line: str) -> Optional[GitProgress]:
+    """Parse a line of git's progress output, or return `None` for other lines."""
+    match = _PROGRESS_PATTERN.match(line.strip())
+    if match is None:
+        return None
+    return GitProgress(
+        phase=match["phase"],
+        percent=int(match["percent"]),
+        done=int(match["done"]),
+        total=int(match["total"]),
+        bytes_received=_parse_size(match["size"]),
+        rate=_parse_size(match["rate"]),
+    )
+
+
+class ProgressStream(TailBuffer):
+    """Collects git's stderr while reporting the progress lines in it as they arrive.
+
+    Progress lines are handed to `report`, together with the seconds elapsed since
+    the stream was created, at most once every `interval` seconds. They are left
+    out of the collected text, so it only holds the tail of git's other messages.
+    """
+
+    def __init__(
+        self,
+        report: Callable[[GitProgress, float], None],
+        interval: float = 5.0,
+        clock: Callable[[], float] = time.monotonic,
+        max_chars: int = DEFAULT_MAX_CHARS,
+    ):
+        """Report progress through `report`, throttled to once every `interval`."""
+        super().__init__(max_chars=max_chars)
+        self._report = report
+        self._interval = interval
+        self._clock = clock
+        self._start = self._last_report = clock()
+        self._partial_line = ""
+
+    def write(self, text: str) -> int:
+        """Process `text`, which may hold any number of complete or partial lines."""
+        *lines, partial_line = re.split(r"[\r\n]", self._partial_line + text)
+        self._partial_line = partial_line[-self.max_chars :]
+        for line in lines:
+            progress = parse_progress(line)
+            if progress is None:
+                if line:
+                    super().write(line + "\n")
+                continue
+            if progress.rate is None and progress.bytes_received is not None:
+                elapsed = self._clock() - self._start
+                progress.rate = progress.bytes_received / elapsed if elapsed else None
+            now = self._clock()
+            if now - self._last_report >= self._interval:
+                self._last_report = now
+                self._report(progress, now - self._start)
+        return len(text)
+
+    def getvalue(self) -> str:
+        """Return the collected text other than progress lines."""
+        if self._partial_line and parse_progress(self._partial_line) is None:
+            return super().getvalue() + self._partial_line
+        return super().getvalue()
@@ -0,0 +1,5 @@
+"""Git references shared by the repository block and its fetch backends."""
+import re
+
+# A full commit SHA, which is fetched directly instead of being resolved
+COMMIT_SHA_PATTERN = re.compile(r"[0-9a-fA-F]{40}")
@@ -0,0 +1,86 @@
+"""Tell transient pull failures from permanent ones, and back off between retries."""
+import random
+import re
+from typing import Callable
+
+import httpx
+
+# Failures that say nothing about the request itself, so trying again may work
+_TRANSIENT_PATTERN = re.compile(
+    "|".join(
+        [
+            r"Could not resolve host",
+            r"Temporary failure in name resolution",
+            r"timed out",
+            r"Connection (?:reset|refused|aborted)",
+            r"Failed to connect",
+            r"remote end hung up unexpectedly",
+            r"unexpectedly closed the connection",
+            r"early EOF",
+            r"unexpected disconnect",
+            r"RPC failed",
+            r"transfer closed with outstanding read data",
+            r"Empty reply from server",
+            r"SSL_read|SSL_ERROR_SYSCALL|GnuTLS recv error",
+            r"HTTP/2 stream \d+ was not closed cleanly",
+            r"Max retries exceeded",
+            r"returned error: (?:5\d\d|408|429)",
+            r"HTTP (?:5\d\d|408|429) from",
+        ]
+    ),
+    re.IGNORECASE,
+)
+
+# Failures that will happen again no matter how often the pull is retried; these
+# take precedence, as git often follows them with a generic hang-up message
+_PERMANENT_PATTERN = re.compile(
+    "|".join(
+        [
+            r"Authentication failed",
+            r"could not read (?:Username|Password)",
+            r"Permission denied",
+            r"returned error: (?:401|403|404)",
+            r"HTTP (?:401|403|404) from",
+            r"not found",
+            r"does not appear to be a git repository",
+        ]
+    ),
+    re.IGNORECASE,
+)
+
+# Upper bound of the delay between two attempts, in seconds
+MAX_RETRY_DELAY = 60.0
+
+
+def is_transient_error(exc: BaseException) -> bool:
+    """Check whether a failed pull may succeed when tried again.
+
+    Timeouts, dropped connections and server errors are transient; failed
+    authentication, missing repositories or references and anything unrecognized
+    are not.
+    """
+    cause = exc.__cause__
+    if isinstance(cause, httpx.HTTPStatusError):
+        status_code = cause.response.status_code
+        return status_code >= 500 or status_code in (408, 429)
+    if isinstance(cause, httpx.TransportError) or isinstance(
+        exc, (TimeoutError, ConnectionError)
+    ):
+        return True
+    message = str(exc)
+    if _PERMANENT_PATTERN.search(message):
+        return False
+    return bool(_TRANSIENT_PATTERN.search(message))
+
+
+def get_retry_delay(
+    attempt: int, base_delay: float, random_factor: Callable[[], float] = random.random
+) -> float:
+    """Return how long to wait before retry number `attempt`, counted from 0.
+
+    The delay doubles with every attempt, starting at `base_delay`, and is scaled
+    by a random factor between 0.5 and 1.5 so that workers that failed together
+    do not all retry at the same moment. No delay exceeds `MAX_RETRY_DELAY`.
+    """
+    delay = min(base_delay * 2**attempt, MAX_RETRY_DELAY)
+    return min(delay * (0.5 + random_factor()), MAX_RETRY_DELAY)
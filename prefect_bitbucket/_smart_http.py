@@ -0,0 +1,337 @@
+"""Fetch repository snapshots over git's smart HTTP protocol, inside the process.
+
+Built on the optional `dulwich` dependency, so pulling needs neither a git
+installation nor a subprocess. HTTP connections are pooled per server and
+credentials and reused across pulls. Only the requested commit is fetched, as a
+shallow pack held in memory, and its files are written straight into the
+destination without an intermediate working copy.
+"""
+import os
+import posixpath
+import shutil
+import stat
+import threading
+import uuid
+from typing import Dict, Iterable, Optional, Tuple
+
+import urllib3
+from dulwich.client import (
+    HTTPUnauthorized,
+    default_urllib3_manager,
+    get_transport_and_path,
+)
+from dulwich.errors import GitProtocolError, NotGitRepository
+from dulwich.object_store import tree_lookup_path
+from dulwich.objects import Tag
+from dulwich.repo import MemoryRepo
+
+from prefect_bitbucket._ignore import compile_ignore_patterns
+from prefect_bitbucket._refs import COMMIT_SHA_PATTERN
+from prefect_bitbucket._sync import SyncReport
+
+try:
+    from dulwich.object_store import iter_tree_contents
+except ImportError:  # pragma: no cover - dulwich < 0.21
+
+    def iter_tree_contents(store, tree_id):
+        """Yield the entries of the tree `tree_id`, recursing into sub-trees."""
+        return store.iter_tree_contents(tree_id)
+
+
+_pool_managers: Dict[Tuple, urllib3.PoolManager] = {}
+_pool_managers_lock = threading.Lock()
+
+
+def _get_pool_manager(
+    url: str, username: Optional[str] = None, password: Optional[str] = None
+) -> urllib3.PoolManager:
+    """Return the connection pool for pulls from `url` with the given credentials.
+
+    Many dulwich versions add the credentials to the default headers of the pool
+    they are given, so pools are never shared between servers or credentials.
+    """
+    parsed = urllib3.util.parse_url(url)
+    key = (parsed.scheme, parsed.host, parsed.port, username, password)
+    with _pool_managers_lock:
+        if key not in _pool_managers:
+            _pool_managers[key] = default_urllib3_manager(None)
+        return _pool_managers[key]
+
+
+# Failures of dulwich's HTTP client that mean the pull failed
+_FETCH_ERRORS = (
+    GitProtocolError,
+    HTTPUnauthorized,
+    NotGitRepository,
+    urllib3.exceptions.HTTPError,
+)
+
+
+def _get_client(url: str, username: Optional[str], password: Optional[str]):
+    """Return a client for `url` on its shared connection pool, and its path."""
+    if not url.startswith(("http://", "https://")):
+        raise ValueError(
+            f"In-process fetches require an HTTP(S) repository URL, got {url!r}."
+        )
+    return get_transport_and_path(
+        url,
+        pool_manager=_get_pool_manager(url, username, password),
+        username=username,
+        password=password,
+    )
+
+
+def _find_reference(refs: Dict[bytes, bytes], reference: Optional[str]) -> bytes:
+    """Return the object `reference` points to among the advertised `refs`.
+
+    Branches take precedence over tags of the same name, like `git clone -b`.
+    Full commit SHAs that are not advertised are requested as they are.
+    """
+    if reference is None:
+        candidates = [b"HEAD"]
+    else:
+        name = reference.encode()
+        candidates = [b"refs/heads/" + name, b"refs/tags/" + name, name]
+    for candidate in candidates:
+        if candidate in refs:
+            return refs[candidate]
+    if reference is not None and COMMIT_SHA_PATTERN.fullmatch(reference):
+        return reference.lower().encode()
+    raise OSError(f"Failed to pull from remote:\n reference {reference!r} not found")
+
+
+def _is_safe_path(rel_path: str) -> bool:
+    """Check that the tree path `rel_path` stays below the directory it is in."""
+    return not posixpath.isabs(rel_path) and all(
+        part not in ("", ".", "..") for part in rel_path.split("/")
+    )
+
+
+def _is_within(path: str, root: str) -> bool:
+    """Check whether the real path `path` is `root` or below it."""
+    return path == root or path.startswith(os.path.join(root, ""))
+
+
+def _make_dirs(destination: str, rel_dir: str) -> str:
+    """Create `rel_dir` below `destination`, replacing files in its way."""
+    path = destination
+    for part in rel_dir.split("/") if rel_dir else []:
+        path = os.path.join(path, part)
+        if os.path.lexists(path) and (os.path.islink(path) or not os.path.isdir(path)):
+            os.unlink(path)
+        if not os.path.isdir(path):
+            os.mkdir(path)
+    return path
+
+
+def _write_file(path: str, data: bytes, executable: bool) -> bool:
+    """Write `data` to `path` unless it already holds it; return whether it wrote.
+
+    Files are replaced atomically, so readers never see partial contents.
+    """
+    mode = 0o755 if executable else 0o644
+    try:
+        current = os.lstat(path)
+    except FileNotFoundError:
+        pass
+    else:
+        if (
+            stat.S_ISREG(current.st_mode)
+            and current.st_size == len(data)
+            and stat.S_IMODE(current.st_mode) == mode
+        ):
+            with open(path, "rb") as existing:
+                if existing.read() == data:
+                    return False
+
+    tmp_path = os.path.join(
+        os.path.dirname(path), f".{os.path.basename(path)}.{uuid.uuid4().hex}.tmp"
+    )
+    try:
+        with open(tmp_path, "wb") as file:
+            file.write(data)
+        os.chmod(tmp_path, mode)
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.lexists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return True
+
+
+def _write_link(path: str, target: str) -> bool:
+    """Make `path` a symbolic link to `target`; return whether it changed."""
+    if os.path.islink(path) and os.readlink(path) == target:
+        return False
+    if os.path.lexists(path):
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path)
+        else:
+            os.unlink(path)
+    os.symlink(target, path)
+    return True
+
+
+def resolve_references(
+    url: str,
+    references: Iterable[str],
+    username: Optional[str] = None,
+    password: Optional[str] = None,
+) -> Dict[str, str]:
+    """Resolve branches and tags of the repository at `url` to commit SHAs.
+
+    Like `git ls-remote`, a single request lists the remote's references.
+    Branches take precedence over tags of the same name, annotated tags resolve
+    to the commit they point at and `HEAD` is the default branch. References
+    that do not exist are left out.
+    """
+    client, path = _get_client(url, username, password)
+    try:
+        result = client.get_refs(path)
+    except _FETCH_ERRORS as exc:
+        raise OSError(f"Failed to pull from remote:\n {exc}") from exc
+    # Older dulwich versions return the references themselves
+    refs = getattr(result, "refs", result)
+
+    resolved = {}
+    for reference in references:
+        name = reference.encode()
+        for candidate in (
+            b"refs/heads/" + name,
+            b"refs/tags/" + name + b"^{}",
+            b"refs/tags/" + name,
+            name,
+        ):
+            if candidate in refs:
+                resolved[reference] = refs[candidate].decode()
+                break
+    return resolved
+
+
+def fetch_snapshot(
+    url: str,
+    reference: Optional[str],
+    destination: str,
+    sub_directory: Optional[str] = None,
+    username: Optional[str] = None,
+    password: Optional[str] = None,
+    ignore_patterns: Iterable[str] = (),
+    ignore_file: Optional[str] = None,
+) -> Tuple[str, SyncReport]:
+    """Fetch `reference` of the repository at `url` and write it to `destination`.
+
+    Args:
+        url: The HTTP(S) URL of the repository, without credentials.
+        reference: The branch, tag or commit SHA to fetch; defaults to the
+            remote's default branch.
+        destination: The directory to write the files to; created if needed.
+        sub_directory: If given, only files below this repository-relative
+            directory are written, relative to it.
+        username: The username to authenticate with.
+        password: The password or token to authenticate with.
+        ignore_patterns: Patterns in `.gitignore` syntax, relative to
+            `sub_directory`, of files not to write.
+        ignore_file: The name of a file in `sub_directory` holding further
+            ignore patterns, which apply before `ignore_patterns`.
+
+    Returns:
+        The SHA of the fetched commit and a report of the files that were
+        created, updated or already up to date.
+
+    """
+    client, path = _get_client(url, username, password)
+    repo = MemoryRepo()
+    wanted = []
+
+    def determine_wants(refs, depth=None):
+        wanted.append(_find_reference(refs, reference))
+        return wanted
+
+    try:
+        client.fetch(path, repo, determine_wants=determine_wants, depth=1)
+    except _FETCH_ERRORS as exc:
+        raise OSError(f"Failed to pull from remote:\n {exc}") from exc
+
+    store = repo.object_store
+    commit = store[wanted[0]]
+    while isinstance(commit, Tag):
+        commit = store[commit.object[1]]
+    tree_id = commit.tree
+    if sub_directory:
+        try:
+            mode, tree_id = tree_lookup_path(
+                store.__getitem__, tree_id, sub_directory.encode()
+            )
+        except KeyError:
+            mode = None
+        if mode is None or not stat.S_ISDIR(mode):
+            raise OSError(
+                f"Failed to pull from remote:\n {sub_directory!r} is not a "
+                "directory of the repository"
+            )
+
+    patterns = list(ignore_patterns)
+    if ignore_file is not None:
+        try:
+            mode, ignore_file_id = tree_lookup_path(
+                store.__getitem__, tree_id, ignore_file.encode()
+            )
+        except KeyError:
+            mode = None
+        if mode is not None and stat.S_ISREG(mode):
+            patterns = store[ignore_file_id].data.decode().splitlines() + patterns
+    ignore = compile_ignore_patterns(patterns)
+
+    report = SyncReport()
+    os.makedirs(destination, exist_ok=True)
+    root = os.path.realpath(destination)
+    links = []
+    for entry in iter_tree_contents(store, tree_id):
+        if stat.S_ISDIR(entry.mode) or entry.mode & 0o170000 == 0o160000:
+            # Submodules are not fetched, like with a plain `git clone`
+            continue
+        rel_path = entry.path.decode()
+        if not _is_safe_path(rel_path):
+            # Never write outside the destination
+            continue
+        if ignore is not None and ignore(rel_path, False):
+            continue
+        rel_dir, name = posixpath.split(rel_path)
+        path = os.path.join(_make_dirs(root, rel_dir), name)
+        data = store[entry.sha].data
+        existed = os.path.lexists(path)
+        if stat.S_ISLNK(entry.mode):
+            target = data.decode()
+            if not os.path.isabs(target):
+                links.append((rel_path, path, target, existed))
+            continue
+        changed = _write_file(path, data, executable=bool(entry.mode & 0o111))
+        if changed:
+            report.bytes_written += len(data)
+            (report.updated if existed else report.created).append(rel_path)
+        else:
+            report.unchanged.append(rel_path)
+
+    # Links can point through each other, so they are only checked once they all
+    # exist; those resolving outside the destination are removed until none do
+    changed = {
+        rel_path: _write_link(path, target) for rel_path, path, target, _ in links
+    }
+    escaping = True
+    while escaping:
+        escaping = [
+            (rel_path, path, target, existed)
+            for rel_path, path, target, existed in links
+            if not _is_within(os.path.realpath(path), root)
+        ]
+        for link in escaping:
+            os.unlink(link[1])
+            links.remove(link)
+    for rel_path, _, _, existed in links:
+        if changed[rel_path]:
+            (report.updated if existed else report.created).append(rel_path)
+        else:
+            report.unchanged.append(rel_path)
+    return commit.id.decode(), report
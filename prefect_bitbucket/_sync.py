@@ -0,0 +1,466 @@
+"""Incremental synchronization of a pulled tree into its destination.
+
+Unlike `distutils.dir_util.copy_tree`, which rewrites every file on every pull,
+`sync_tree` only writes files whose contents actually differ and can optionally
+remove files that no longer exist in the source. Files can be written as copies,
+hard links or copy-on-write clones (reflinks); see `MATERIALIZATION_STRATEGIES`.
+
+The source is walked with `os.scandir` on the calling thread while a pool of
+worker threads compares and writes files as they are found, so that large trees
+are not copied one file at a time. Copies are made with `os.copy_file_range`
+where available, which keeps the data in the kernel, and `shutil.copy2` (which
+uses `os.sendfile` on Linux) otherwise.
+"""
+import errno
+import filecmp
+import os
+import shutil
+import stat
+import threading
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+# `copy` always copies file contents, `hardlink` and `reflink` link or clone the
+# source where the file systems allow it and copy otherwise, and `auto` tries a
+# reflink first, then a hard link, then a copy.
+MATERIALIZATION_STRATEGIES = ("copy", "hardlink", "reflink", "auto")
+
+# ioctl request cloning one file into another on Linux (btrfs, XFS, ...)
+_FICLONE = 0x40049409
+
+# The number of files queued per worker thread; bounds the memory used by the
+# walk of the source, which usually runs ahead of the writes
+_QUEUED_FILES_PER_WORKER = 64
+
+# Errors meaning a link or clone is not possible between two locations, in which
+# case the file is copied instead
+_UNSUPPORTED_ERRNOS = {
+    errno.EXDEV,
+    errno.EPERM,
+    errno.EINVAL,
+    errno.ENOTTY,
+    errno.EMLINK,
+    errno.ENOSYS,
+    getattr(errno, "EOPNOTSUPP", errno.EINVAL),
+    getattr(errno, "ENOTSUP", errno.EINVAL),
+}
+
+
+@dataclass
+class SyncReport:
+    """What `sync_tree` did, as paths relative to the destination."""
+
+    created: List[str] = field(default_factory=list)
+    updated: List[str] = field(default_factory=list)
+    deleted: List[str] = field(default_factory=list)
+    unchanged: List[str] = field(default_factory=list)
+    bytes_written: int = 0
+
+    def __str__(self) -> str:
+        """Summarize the report in a single line."""
+        return (
+            f"{len(self.created)} created, {len(self.updated)} updated, "
+            f"{len(self.deleted)} deleted, {len(self.unchanged)} unchanged "
+            f"({self.bytes_written} bytes written)"
+        )
+
+
+def _same_metadata(
+    src_stat: os.stat_result,
+    dst_stat: Optional[os.stat_result],
+    links_allowed: bool = True,
+) -> Optional[bool]:
+    """Tell from their metadata whether a regular file and its destination match.
+
+    Files with matching size and modification time are assumed to be equal.
+    Unless `links_allowed` is set, a destination that is a hard link to the
+    source never matches, so that it gets replaced by a copy. Returns `None` when
+    only comparing the contents byte for byte can tell.
+    """
+    if (
+        dst_stat is None
+        or not stat.S_ISREG(dst_stat.st_mode)
+        or dst_stat.st_size != src_stat.st_size
+    ):
+        return False
+    if (dst_stat.st_dev, dst_stat.st_ino) == (src_stat.st_dev, src_stat.st_ino):
+        # Hard link to the source
+        return links_allowed
+    if dst_stat.st_mtime_ns == src_stat.st_mtime_ns:
+        return True
+    return None
+
+
+def _lstat(path: str) -> Optional[os.stat_result]:
+    """Return the status of `path` without following links, or `None` if missing."""
+    try:
+        return os.lstat(path)
+    except FileNotFoundError:
+        return None
+
+
+def _remove(path: str) -> None:
+    """Remove the file, symlink or directory at `path`."""
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    else:
+        os.unlink(path)
+
+
+def _get_default_workers() -> int:
+    """Return the number of copy threads to use, like `ThreadPoolExecutor` does."""
+    return min(32, (os.cpu_count() or 1) + 4)
+
+
+def _reflink(src: str, dst: str) -> None:
+    """Create `dst` as a copy-on-write clone of `src`."""
+    if fcntl is None or not hasattr(fcntl, "ioctl"):  # pragma: no cover
+        raise OSError(errno.EOPNOTSUPP, "reflinks are not supported", dst)
+    src_fd = os.open(src, os.O_RDONLY)
+    try:
+        dst_fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        try:
+            fcntl.ioctl(dst_fd, _FICLONE, src_fd)
+        except OSError:
+            os.close(dst_fd)
+            os.unlink(dst)
+            raise
+        os.close(dst_fd)
+    finally:
+        os.close(src_fd)
+    shutil.copystat(src, dst)
+
+
+def _copy_file_range(src: str, dst: str) -> None:
+    """Create `dst` as a copy of `src` made by the kernel with `copy_file_range`.
+
+    The data never passes through user space, and file systems that support it
+    share or clone the extents instead of copying them.
+    """
+    with open(src, "rb") as src_file, open(dst, "xb") as dst_file:
+        try:
+            size = os.fstat(src_file.fileno()).st_size
+            copied = 0
+            while True:
+                num_bytes = os.copy_file_range(
+                    src_file.fileno(), dst_file.fileno(), 2**30
+                )
+                if not num_bytes:
+                    break
+                copied += num_bytes
+            if copied != size:
+                # Some file systems report success without copying anything
+                raise OSError(errno.EINVAL, "incomplete copy_file_range", dst)
+        except OSError:
+            dst_file.close()
+            os.unlink(dst)
+            raise
+    shutil.copystat(src, dst)
+
+
+class _Materializer:
+    """Writes files with the chosen materialization strategy.
+
+    Device pairs that turn out not to support linking, cloning or kernel copies
+    are remembered, so a failing system call is only tried once per pair, even
+    when several threads write files at the same time.
+    """
+
+    def __init__(self, strategy: str):
+        if strategy not in MATERIALIZATION_STRATEGIES:
+            raise ValueError(
+                f"Unknown materialization strategy {strategy!r}; expected one of "
+                f"{', '.join(MATERIALIZATION_STRATEGIES)}."
+            )
+        self._methods = {
+            "copy": [],
+            "hardlink": [os.link],
+            "reflink": [_reflink],
+            "auto": [_reflink, os.link],
+        }[strategy]
+        if hasattr(os, "copy_file_range"):
+            self._methods.append(_copy_file_range)
+        self._supported: Dict[Tuple[int, int], set] = {}
+        self._unsupported: Dict[Tuple[int, int], set] = {}
+        self._probe_lock = threading.Lock()
+
+    def _try(self, method, src: str, tmp_dst: str, devices: Tuple[int, int]) -> bool:
+        """Write `src` to `tmp_dst` with `method`, if the devices support it.
+
+        The first attempt for each pair of devices runs on one thread at a time,
+        so that an unsupported method fails only once.
+        """
+        if method in self._unsupported.get(devices, ()):
+            return False
+        if method in self._supported.get(devices, ()):
+            try:
+                method(src, tmp_dst)
+            except OSError as exc:
+                if exc.errno not in _UNSUPPORTED_ERRNOS:
+                    raise
+                return False
+            return True
+
+        with self._probe_lock:
+            probed = self._supported.get(devices, set()) | self._unsupported.get(
+                devices, set()
+            )
+            if method in probed:
+                # Another thread finished probing while this one waited
+                return self._try(method, src, tmp_dst, devices)
+            try:
+                method(src, tmp_dst)
+            except OSError as exc:
+                if exc.errno not in _UNSUPPORTED_ERRNOS:
+                    raise
+                self._unsupported.setdefault(devices, set()).add(method)
+                return False
+            self._supported.setdefault(devices, set()).add(method)
+            return True
+
+    def _write(self, src: str, src_dev: int, tmp_dst: str, dst_dev: int) -> None:
+        """Write `src` to the not yet existing path `tmp_dst`."""
+        for method in self._methods:
+            if self._try(method, src, tmp_dst, (src_dev, dst_dev)):
+                return
+        shutil.copy2(src, tmp_dst, follow_symlinks=False)
+
+    def write(self, src: str, src_stat: os.stat_result, dst: str) -> None:
+        """Write `src` over `dst`, replacing it atomically.
+
+        Processes that still have the old file open keep seeing its old contents.
+        """
+        dst_dir = os.path.dirname(dst)
+        tmp_dst = os.path.join(
+            dst_dir, f".{os.path.basename(dst)}.{uuid.uuid4().hex}.tmp"
+        )
+        try:
+            self._write(src, src_stat.st_dev, tmp_dst, os.stat(dst_dir).st_dev)
+            if os.path.isdir(dst) and not os.path.islink(dst):
+                shutil.rmtree(dst)
+            os.replace(tmp_dst, dst)
+        except BaseException:
+            if os.path.lexists(tmp_dst):
+                os.unlink(tmp_dst)
+            raise
+
+
+def _to_relative(rel_dir: str, name: str) -> str:
+    """Join `rel_dir` and `name` into a `/` separated path relative to the root."""
+    return os.path.normpath(os.path.join(rel_dir, name)).replace(os.sep, "/")
+
+
+def _walk(
+    src: str, dst: str, ignore: Optional[Callable[[str, bool], bool]] = None
+) -> Iterator[Tuple[str, str, List[os.DirEntry], Set[str]]]:
+    """Walk `src` top-down, creating each of its directories in `dst`.
+
+    Yields the relative path of every directory, its path in `dst`, the files
+    and symbolic links in it, and the names of all of its entries. Symbolic links
+    to directories are yielded as files and not descended into. Entries for
+    which `ignore` returns true are skipped as if they did not exist.
+    """
+    pending = [(src, ".")]
+    while pending:
+        src_dir, rel_dir = pending.pop()
+        dst_dir = dst if rel_dir == "." else os.path.join(dst, rel_dir)
+        files = []
+        names = set()
+        with os.scandir(src_dir) as entries:
+            for entry in entries:
+                is_dir = entry.is_dir(follow_symlinks=False)
+                if ignore is not None and ignore(
+                    _to_relative(rel_dir, entry.name), is_dir
+                ):
+                    continue
+                names.add(entry.name)
+                if not is_dir:
+                    files.append(entry)
+                    continue
+                dst_path = os.path.join(dst_dir, entry.name)
+                if os.path.lexists(dst_path) and (
+                    os.path.islink(dst_path) or not os.path.isdir(dst_path)
+                ):
+                    os.unlink(dst_path)
+                os.makedirs(dst_path, exist_ok=True)
+                pending.append((entry.path, os.path.join(rel_dir, entry.name)))
+        yield rel_dir, dst_dir, files, names
+
+
+class _TreeSync:
+    """The state of one `sync_tree` call, shared by its worker threads.
+
+    Files are first triaged on the walking thread, where links and files whose
+    metadata match their destination are settled right away. Only the files that
+    need to be read or written are handed to the worker threads.
+    """
+
+    def __init__(self, strategy: str):
+        self.report = SyncReport()
+        self.materializer = _Materializer(strategy)
+        self._links_allowed = strategy in ("hardlink", "auto")
+        self._lock = threading.Lock()
+
+    def triage(
+        self, entry: os.DirEntry, dst_path: str, rel_path: str
+    ) -> Optional[Tuple[os.stat_result, Optional[os.stat_result]]]:
+        """Sync `entry` to `dst_path` if that is cheap.
+
+        Returns the status of the source and destination files when the file
+        still needs to be compared or written with `write`.
+        """
+        src_stat = entry.stat(follow_symlinks=False)
+        dst_stat = _lstat(dst_path)
+
+        if stat.S_ISLNK(src_stat.st_mode):
+            target = os.readlink(entry.path)
+            if dst_stat is not None and stat.S_ISLNK(dst_stat.st_mode):
+                if os.readlink(dst_path) == target:
+                    self._record("unchanged", rel_path)
+                    return None
+            if dst_stat is not None:
+                _remove(dst_path)
+            os.symlink(target, dst_path)
+            self._record("created" if dst_stat is None else "updated", rel_path)
+            return None
+
+        if _same_metadata(src_stat, dst_stat, self._links_allowed):
+            self._record("unchanged", rel_path)
+            return None
+        return src_stat, dst_stat
+
+    def write(
+        self,
+        entry: os.DirEntry,
+        src_stat: os.stat_result,
+        dst_stat: Optional[os.stat_result],
+        dst_path: str,
+        rel_path: str,
+    ) -> None:
+        """Write the file `entry` to `dst_path` unless its contents are there."""
+        if _same_metadata(
+            src_stat, dst_stat, self._links_allowed
+        ) is None and filecmp.cmp(entry.path, dst_path, shallow=False):
+            self._record("unchanged", rel_path)
+            return
+        self.materializer.write(entry.path, src_stat, dst_path)
+        self._record(
+            "created" if dst_stat is None else "updated", rel_path, src_stat.st_size
+        )
+
+    def _record(self, outcome: str, rel_path: str, num_bytes: int = 0) -> None:
+        """Add a file to the report."""
+        with self._lock:
+            getattr(self.report, outcome).append(rel_path)
+            self.report.bytes_written += num_bytes
+
+
+def sync_tree(
+    src: str,
+    dst: str,
+    delete: bool = False,
+    keep: Iterable[str] = (),
+    strategy: str = "copy",
+    workers: Optional[int] = None,
+    ignore: Optional[Callable[[str, bool], bool]] = None,
+) -> SyncReport:
+    """Make the directory `dst` hold the same files as `src`.
+
+    Only files that are missing or differ are written. Symbolic links are
+    recreated as links rather than followed.
+
+    Args:
+        src: The directory to copy from.
+        dst: The directory to copy to; created if it does not exist.
+        delete: Whether to remove files and directories in `dst` that do not
+            exist in `src`.
+        keep: Paths relative to `dst`, using `/` as separator, that must never
+            be deleted.
+        strategy: How files are written; one of `MATERIALIZATION_STRATEGIES`.
+            Hard links share their contents with `src`, so only use them when
+            `src` is not modified afterwards. With other strategies, files in
+            `dst` that are hard links to `src` are replaced by copies.
+        workers: The number of threads comparing and writing files; defaults to
+            the number of CPUs plus four, up to 32. With 1, files are written on
+            the calling thread.
+        ignore: Called with the path of each file and directory in `src`,
+            relative to `src` and using `/` as separator, and whether it is a
+            directory; paths for which it returns true are treated as if they
+            did not exist in `src`.
+
+    Returns:
+        A report of the files that were created, updated, deleted or left as is,
+        each sorted by path.
+
+    """
+    workers = workers or _get_default_workers()
+    tree_sync = _TreeSync(strategy)
+    report = tree_sync.report
+    keep = set(keep)
+    os.makedirs(dst, exist_ok=True)
+
+    # Files are only deleted once all writes are done, as writes create
+    # temporary files next to their destination
+    src_names: Dict[str, Tuple[str, Set[str]]] = {}
+
+    if workers == 1:
+        for rel_dir, dst_dir, files, names in _walk(src, dst, ignore):
+            for entry in files:
+                dst_path = os.path.join(dst_dir, entry.name)
+                rel_path = _to_relative(rel_dir, entry.name)
+                pending = tree_sync.triage(entry, dst_path, rel_path)
+                if pending is not None:
+                    tree_sync.write(entry, *pending, dst_path, rel_path)
+            if delete:
+                src_names[rel_dir] = (dst_dir, names)
+    else:
+        slots = threading.BoundedSemaphore(workers * _QUEUED_FILES_PER_WORKER)
+        errors: List[BaseException] = []
+
+        def done(future: Future) -> None:
+            slots.release()
+            if future.exception() is not None:
+                errors.append(future.exception())
+
+        with ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="prefect-bitbucket-sync"
+        ) as executor:
+            for rel_dir, dst_dir, files, names in _walk(src, dst, ignore):
+                for entry in files:
+                    dst_path = os.path.join(dst_dir, entry.name)
+                    rel_path = _to_relative(rel_dir, entry.name)
+                    pending = tree_sync.triage(entry, dst_path, rel_path)
+                    if pending is None:
+                        continue
+                    slots.acquire()
+                    if errors:
+                        slots.release()
+                        break
+                    executor.submit(
+                        tree_sync.write, entry, *pending, dst_path, rel_path
+                    ).add_done_callback(done)
+                if errors:
+                    break
+                if delete:
+                    src_names[rel_dir] = (dst_dir, names)
+        if errors:
+            raise errors[0]
+
+    for rel_dir, (dst_dir, names) in src_names.items():
+        for name in sorted(os.listdir(dst_dir)):
+            rel_path = _to_relative(rel_dir, name)
+            if name in names or rel_path in keep:
+                continue
+            _remove(os.path.join(dst_dir, name))
+            report.deleted.append(rel_path)
+
+    for paths in (report.created, report.updated, report.deleted, report.unchanged):
+        paths.sort()
+    return report
@@ -1,7 +1,7 @@
 """Module to enable authenticate interactions with BitBucket."""
 import re
 from enum import Enum
-from typing import Optional, Union
+from typing import TYPE_CHECKING, Optional, Union
 
 from prefect.blocks.abstract import CredentialsBlock
 from pydantic import VERSION as PYDANTIC_VERSION
@@ -11,10 +11,8 @@ if PYDANTIC_VERSION.startswith("2."):
 else:
     from pydantic import Field, SecretStr, validator
 
-try:
+if TYPE_CHECKING:
     from atlassian.bitbucket import Bitbucket, Cloud
-except ImportError:
-    pass
 
 
 class ClientType(Enum):
@@ -83,7 +81,7 @@ class BitBucketCredentials(CredentialsBlock):
 
     def get_client(
         self, client_type: Union[str, ClientType], **client_kwargs
-    ) -> Union[Cloud, Bitbucket]:
+    ) -> Union["Cloud", "Bitbucket"]:
         """Get an authenticated local or cloud Bitbucket client.
 
         Args:
@@ -94,6 +92,9 @@ class BitBucketCredentials(CredentialsBlock):
 
         """
         # ref: https://atlassian-python-api.readthedocs.io/
+        # Imported here as it is slow to import and only needed for API clients
+        from atlassian.bitbucket import Bitbucket, Cloud
+
         if isinstance(client_type, str):
             client_type = ClientType(client_type.lower())
 
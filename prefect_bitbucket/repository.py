@@ -25,6 +25,14 @@ branch_bitbucket_block = BitBucketRepository(
 
 branch_bitbucket_block.save(name="my-bitbucket-block")
 
+# exact commit, fetched on its own without resolving any reference
+pinned_bitbucket_block = BitBucketRepository(
+    reference="0123456789abcdef0123456789abcdef01234567",
+    repository="https://bitbucket.com/my-project/my-repository.git"
+)
+
+pinned_bitbucket_block.save(name="my-pinned-bitbucket-block")
+
 # private BitBucket repository
 private_bitbucket_block = BitBucketRepository(
     repository="https://bitbucket.com/my-project/my-repository.git",
@@ -33,18 +41,62 @@ private_bitbucket_block = BitBucketRepository(
 
 private_bitbucket_block.save(name="my-private-bitbucket-block")
 
+# keep a persistent bare mirror so later pulls only fetch what changed
+cached_bitbucket_block = BitBucketRepository(
+    repository="https://bitbucket.com/my-project/my-repository.git",
+    cache_dir="~/.prefect/bitbucket-cache"
+)
+
+cached_bitbucket_block.save(name="my-cached-bitbucket-block")
+
+# serve the commit pulled last at once and look for a newer one in the background
+stale_bitbucket_block = BitBucketRepository(
+    repository="https://bitbucket.com/my-project/my-repository.git",
+    cache_dir="~/.prefect/bitbucket-cache",
+    max_staleness=300
+)
+
+stale_bitbucket_block.save(name="my-stale-bitbucket-block")
+
 """
 
+import abc
+import hashlib
+import importlib.util
 import io
-from distutils.dir_util import copy_tree
+import json
+import logging
+import os
+import posixpath
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
 from pathlib import Path
 from tempfile import TemporaryDirectory
-from typing import Optional, Tuple, Union
+from typing import (
+    ClassVar,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Type,
+    Union,
+)
 from urllib.parse import urlparse, urlunparse
 
-from prefect.exceptions import InvalidRepositoryURLError
+import anyio
+import httpx
+from prefect.events import emit_event
+from prefect.exceptions import InvalidRepositoryURLError, MissingContextError
 from prefect.filesystems import ReadableDeploymentStorage
-from prefect.utilities.asyncutils import sync_compatible
+from prefect.logging import get_logger, get_run_logger
+from prefect.utilities.asyncutils import run_sync_in_worker_thread, sync_compatible
 from prefect.utilities.processutils import run_process
 from pydantic import VERSION as PYDANTIC_VERSION
 
@@ -53,8 +105,148 @@ if PYDANTIC_VERSION.startswith("2."):
 else:
     from pydantic import Field, validator
 
+from prefect_bitbucket._archive import (
+    download_archive,
+    remove_unlisted,
+    resolve_revisions,
+)
+from prefect_bitbucket._cache import (
+    ReferenceCache,
+    SingleFlight,
+    SnapshotCache,
+    async_file_lock,
+)
+from prefect_bitbucket._capture import TailBuffer
+from prefect_bitbucket._ignore import (
+    IgnoreFunction,
+    compile_ignore_patterns,
+    read_ignore_file,
+    to_sparse_patterns,
+)
+from prefect_bitbucket._progress import GitProgress, ProgressStream
+from prefect_bitbucket._refs import COMMIT_SHA_PATTERN
+from prefect_bitbucket._retry import get_retry_delay, is_transient_error
+from prefect_bitbucket._sync import MATERIALIZATION_STRATEGIES, SyncReport, sync_tree
 from prefect_bitbucket.credentials import BitBucketCredentials
 
+# Written to `local_path` by `get_directory` when `skip_unchanged` is enabled
+PULL_MARKER_FILENAME = ".prefect-bitbucket.json"
+
+# The git configuration identifying a checkout made by `get_directory`
+MANAGED_CONFIG_KEYS = r"^(remote\.origin\.url|prefect-bitbucket\.managed)$"
+
+# Minimum number of seconds between two progress logs of the same git command
+PROGRESS_LOG_INTERVAL = 5.0
+
+# Snapshot cache population currently in flight in this process
+_populate_snapshot_calls = SingleFlight()
+
+# Reference resolutions currently in flight in this process
+_resolve_references_calls = SingleFlight()
+
+# Commit SHAs that references resolved to, shared by every block of this process
+_resolved_references = ReferenceCache()
+
+# Background refreshes of stale pulls currently running in this process
+_revalidations: Set[Tuple[Optional[str], ...]] = set()
+_revalidations_lock = threading.Lock()
+
+
+def _get_logger() -> logging.Logger:
+    """Return the run logger when called from a flow or task, else a module logger."""
+    try:
+        return get_run_logger()
+    except MissingContextError:
+        return get_logger("prefect_bitbucket")
+
+
+def _get_pack_size(git_dir: Path) -> int:
+    """Return the size in bytes of the packs in `git_dir`.
+
+    Right after a clone this is about the amount of data received from the remote.
+    """
+    pack_dir = git_dir / "objects" / "pack"
+    if not pack_dir.is_dir():
+        return 0
+    return sum(path.stat().st_size for path in pack_dir.glob("*.pack"))
+
+
+@dataclass
+class PullStats:
+    """Where the time of a `BitBucketRepository.get_directory` call went.
+
+    Attributes:
+        repository: The repository URL, without credentials.
+        reference: The reference that was pulled; `None` for the default branch.
+        backend: The name of the fetch backend that pulled the repository.
+        sha: The SHA of the commit that was pulled, if known.
+        phases: Seconds spent in each phase of the pull: `resolve` (finding the
+            commit the reference points at), `fetch` (receiving objects or
+            archives from the remote), `checkout` (writing a working tree out of
+            fetched objects), `snapshot` (storing it in the snapshot cache) and
+            `materialize` (syncing files into the local path). Phases a pull
+            does not go through are left out.
+        duration: Seconds the whole pull took.
+        bytes_transferred: Bytes received from the remote, or `None` if the
+            backend cannot tell.
+        files_written: Files created or updated in the local path.
+        files_unchanged: Files that were already up to date in the local path.
+        files_deleted: Stale files removed from the local path.
+        cache_hit: Whether the snapshot cache held the commit, or `None` if no
+            cache was used.
+        skipped: Whether the pull was skipped because the local path already
+            held the commit.
+        stale: Whether the commit was served from what the reference resolved
+            to earlier, within `max_staleness`, while the reference is resolved
+            again in the background.
+        attempts: How many times the pull was tried; phases and counters add
+            up all attempts.
+
+    """
+
+    repository: str
+    reference: Optional[str]
+    backend: str
+    sha: Optional[str] = None
+    phases: Dict[str, float] = field(default_factory=dict)
+    duration: float = 0.0
+    bytes_transferred: Optional[int] = None
+    files_written: int = 0
+    files_unchanged: int = 0
+    files_deleted: int = 0
+    cache_hit: Optional[bool] = None
+    skipped: bool = False
+    stale: bool = False
+    attempts: int = 1
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Add the time spent in the context to the phase `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def add_bytes_transferred(self, num_bytes: int) -> None:
+        """Count `num_bytes` more bytes as received from the remote."""
+        self.bytes_transferred = (self.bytes_transferred or 0) + num_bytes
+
+    def add_sync_report(self, report: SyncReport) -> None:
+        """Count the files written, left alone and deleted by a sync."""
+        self.files_written += len(report.created) + len(report.updated)
+        self.files_unchanged += len(report.unchanged)
+        self.files_deleted += len(report.deleted)
+
+    def __str__(self) -> str:
+        """Summarize the pull in a single line."""
+        phases = ", ".join(f"{name} {secs:.2f}s" for name, secs in self.phases.items())
+        return (
+            f"{self.files_written} files written, {self.files_unchanged} unchanged, "
+            f"{self.files_deleted} deleted in {self.duration:.2f}s"
+            + (f" ({phases})" if phases else "")
+        )
+
 
 class BitBucketRepository(ReadableDeploymentStorage):
     """Interact with files stored in BitBucket repositories.
@@ -73,7 +265,12 @@ class BitBucketRepository(ReadableDeploymentStorage):
     )
     reference: Optional[str] = Field(
         default=None,
-        description="An optional reference to pin to; can be a branch or tag.",
+        description=(
+            "An optional reference to pin to; can be a branch, a tag or a full "
+            "40 character commit SHA. A commit SHA is fetched on its own at depth "
+            "1 and never needs to be resolved, so with `cache_dir` set, pulls of a "
+            "commit that was pulled before make no network call at all."
+        ),
     )
     bitbucket_credentials: Optional[BitBucketCredentials] = Field(
         default=None,
@@ -82,6 +279,156 @@ class BitBucketRepository(ReadableDeploymentStorage):
             "private BitBucket repos."
         ),
     )
+    backend: str = Field(
+        default="auto",
+        description=(
+            "How the repository is fetched: `git` shallow clones it with the git "
+            "CLI, `mirror` pulls through a persistent mirror and snapshot cache in "
+            "`cache_dir`, and `archive` downloads a tar.gz snapshot of the "
+            "reference through the BitBucket Cloud or Server REST API without "
+            "needing git; on BitBucket Server, only the `from_path` sub-directory "
+            "is requested. The archive backend ignores `cache_dir`, "
+            "`checkout_in_place`, `sparse_checkout` and `materialization`. `dulwich` "
+            "fetches over git's smart HTTP protocol inside the Python process, "
+            "reusing pooled connections across pulls; it requires the optional "
+            "`dulwich` package and ignores the same fields. `auto` uses `mirror` "
+            "when `cache_dir` is set, else `git`, or `archive` when git is not "
+            "installed."
+        ),
+    )
+    skip_unchanged: bool = Field(
+        default=False,
+        description=(
+            "Whether to skip pulling when the local path already holds the commit "
+            "the reference points at. The reference is resolved with a single "
+            "call to the remote and compared against a marker file written to "
+            "the local path by the previous pull."
+        ),
+    )
+    remove_stale_files: bool = Field(
+        default=False,
+        description=(
+            "Whether to delete files in the local path that no longer exist in "
+            "the repository. Files that are unchanged are never rewritten."
+        ),
+    )
+    materialization: str = Field(
+        default="copy",
+        description=(
+            "How pulled files are written to the local path: `copy`, `hardlink`, "
+            "`reflink` (copy-on-write clone) or `auto`, which uses a reflink "
+            "where the file system supports it, then a hard link where source and "
+            "destination share a file system, and copies otherwise. Files served "
+            "from `cache_dir` are never hard linked, even in `hardlink` mode, so "
+            "that the cache cannot be modified through the local path; they are "
+            "cloned where possible and copied otherwise."
+        ),
+    )
+    checkout_in_place: bool = Field(
+        default=False,
+        description=(
+            "Whether to clone straight into the local path instead of cloning to "
+            "a temporary directory and copying, when the whole repository is "
+            "requested and the local path is empty. A checkout made this way is "
+            "always updated in place by later pulls of the whole repository, with "
+            "a shallow fetch and a hard reset that only rewrite the files that "
+            "changed; with `remove_stale_files`, untracked files are also cleaned "
+            "up, while ignored files are kept."
+        ),
+    )
+    sparse_checkout: bool = Field(
+        default=False,
+        description=(
+            "Whether to only download and check out the directory requested with "
+            "`from_path`, using a partial clone and a cone-mode sparse checkout. "
+            "Requires git 2.25 or later, or 2.35 or later together with "
+            "`ignore_patterns` or `ignore_file`, whose excluded files are then not "
+            "downloaded either."
+        ),
+    )
+    ignore_patterns: List[str] = Field(
+        default_factory=list,
+        description=(
+            "Patterns in `.gitignore` syntax of files that are not written to the "
+            "local path, such as docs, fixtures or notebooks that flows do not "
+            "need; `!` re-includes files excluded by an earlier pattern. Patterns "
+            "are relative to the pulled directory, i.e. `from_path` or the "
+            "repository root, and are applied after those of `ignore_file`. "
+            "Files are never checked out in place while patterns apply."
+        ),
+    )
+    ignore_file: Optional[str] = Field(
+        default=None,
+        description=(
+            "The name of a file with further `ignore_patterns`, one per line, "
+            "read from the root of the pulled directory when it exists there, "
+            "e.g. `.prefectignore`."
+        ),
+    )
+    cache_dir: Optional[str] = Field(
+        default=None,
+        description=(
+            "An optional local directory used to keep a persistent bare mirror of "
+            "the repository. When set, the first pull creates the mirror and later "
+            "pulls only fetch new objects from BitBucket. Checked out trees are "
+            "also kept per commit, so pulling an already seen commit again needs "
+            "neither a fetch nor a checkout. The directory may be shared by "
+            "several worker processes; concurrent pulls of the same reference "
+            "fetch it only once."
+        ),
+    )
+    cache_max_size: int = Field(
+        default=2 * 1024**3,
+        description=(
+            "The maximum size in bytes of the checked out trees kept in `cache_dir`. "
+            "The least recently used trees are evicted first."
+        ),
+    )
+    reference_cache_ttl: float = Field(
+        default=0,
+        ge=0,
+        description=(
+            "How many seconds the commit SHA a branch or tag resolved to is reused "
+            "before the remote is asked again. Resolutions are shared by every "
+            "block of the worker process and, with `cache_dir` set, by every "
+            "process using that directory, so that a burst of flow runs asks the "
+            "remote only once. A reference that moves is only picked up "
+            "once its resolution expires; `0` disables the cache."
+        ),
+    )
+    max_staleness: float = Field(
+        default=0,
+        ge=0,
+        description=(
+            "How many seconds old the commit served for a branch or tag may be. "
+            "When the reference was resolved within this window and its commit is "
+            "still in the snapshot cache, or with `skip_unchanged` already in the "
+            "local path, the pull is served at once without asking the remote. The "
+            "reference is then resolved again in the background, and with "
+            "`cache_dir` set its new commit is fetched into the snapshot cache, "
+            "ready for the next pull. `0` always waits for the remote."
+        ),
+    )
+    retries: int = Field(
+        default=0,
+        ge=0,
+        description=(
+            "How many times to retry a pull that failed with a transient error, "
+            "such as a timeout, a dropped connection or a server error. Failed "
+            "authentication and missing repositories or references are never "
+            "retried. With `cache_dir` set, retries build on the objects already "
+            "fetched into the mirror instead of starting over."
+        ),
+    )
+    retry_delay_seconds: float = Field(
+        default=1.0,
+        ge=0,
+        description=(
+            "How long to wait before the first retry. The delay doubles with every "
+            "further retry, up to a minute, and is randomized by up to 50% either "
+            "way so that workers do not all retry at once."
+        ),
+    )
 
     @validator("bitbucket_credentials")
     def _ensure_credentials_go_with_https(cls, v: str, values: dict) -> str:
@@ -136,6 +483,572 @@ class BitBucketRepository(ReadableDeploymentStorage):
 
         return full_url
 
+    @staticmethod
+    def _normalize_repo_url(repository: str) -> str:
+        """Return `repository` with credentials removed and its spelling normalized.
+
+        The result identifies the repository independently of who is accessing it,
+        so it is safe to persist and to use as a cache key.
+        """
+        url_components = urlparse(repository)
+        if url_components.scheme and url_components.hostname:
+            netloc = url_components.hostname.lower()
+            if url_components.port:
+                netloc = f"{netloc}:{url_components.port}"
+            path = url_components.path.rstrip("/")
+            if path.endswith(".git"):
+                path = path[: -len(".git")]
+            return urlunparse((url_components.scheme.lower(), netloc, path, "", "", ""))
+
+        # scp-like syntax, e.g. git@bitbucket.org:my-project/my-repository.git
+        repository = repository.rstrip("/")
+        if repository.endswith(".git"):
+            repository = repository[: -len(".git")]
+        return repository
+
+    def _get_mirror_path(self) -> Path:
+        """Return the location of the bare mirror for this repository."""
+        key = hashlib.sha256(
+            self._normalize_repo_url(self.repository).encode()
+        ).hexdigest()
+        return Path(self.cache_dir).expanduser().absolute() / "mirrors" / f"{key}.git"
+
+    @staticmethod
+    async def _run_git(
+        cmd: List[str],
+        progress_label: Optional[str] = None,
+        capture_stdout: bool = False,
+    ) -> str:
+        """Run a git command.
+
+        Raises an `OSError` with the tail of the command's stderr if it fails. For
+        commands run with `--progress`, pass a `progress_label` to have the
+        transfer progress logged while the command runs.
+
+        Returns:
+            The command's stdout if `capture_stdout` is set, else an empty string;
+            other output is discarded as it arrives.
+
+        """
+        if progress_label is None:
+            err_stream = TailBuffer()
+        else:
+
+            def log_progress(progress: GitProgress, elapsed: float) -> None:
+                _get_logger().info(
+                    "Pulling %s: %s (%.0fs elapsed)",
+                    progress_label,
+                    progress,
+                    elapsed,
+                    extra={"git_progress": {**asdict(progress), "elapsed": elapsed}},
+                )
+
+            err_stream = ProgressStream(log_progress, interval=PROGRESS_LOG_INTERVAL)
+        out_stream = io.StringIO() if capture_stdout else None
+        process = await run_process(cmd, stream_output=(out_stream, err_stream))
+        if process.returncode != 0:
+            raise OSError(f"Failed to pull from remote:\n {err_stream.getvalue()}")
+        return out_stream.getvalue() if capture_stdout else ""
+
+    def _get_pinned_sha(self) -> Optional[str]:
+        """Return the commit SHA the reference pins to, if it is one."""
+        if self.reference is not None and COMMIT_SHA_PATTERN.fullmatch(self.reference):
+            return self.reference.lower()
+        return None
+
+    async def _resolve_reference(self) -> str:
+        """Resolve the configured reference to a commit SHA.
+
+        A reference that is a commit SHA already is returned without asking the
+        remote.
+        """
+        reference = self.reference or "HEAD"
+        return (await self.resolve_references([reference]))[reference]
+
+    @sync_compatible
+    async def resolve_references(self, references: Iterable[str]) -> Dict[str, str]:
+        """Resolve branches, tags and commit SHAs of the repository to commit SHAs.
+
+        Branches take precedence over tags of the same name, annotated tags are
+        resolved to the commit they point at and `HEAD` is the default branch.
+        References resolved less than `reference_cache_ttl` seconds ago are
+        answered from the cache; all others are resolved together by the fetch
+        backend, with a single `git ls-remote` call unless the backend works
+        without git.
+
+        Args:
+            references: The references to resolve.
+
+        Returns:
+            The commit SHA of each reference.
+
+        Raises:
+            OSError: If the remote cannot be reached or a reference does not
+                exist.
+
+        """
+        references = list(dict.fromkeys(references))
+        resolved = await self._resolve_references(references)
+        missing = [reference for reference in references if reference not in resolved]
+        if missing:
+            raise OSError(
+                f"Failed to pull from remote:\n "
+                f"reference{'s' if len(missing) > 1 else ''} "
+                f"{', '.join(map(repr, missing))} not found in "
+                f"{self._normalize_repo_url(self.repository)}"
+            )
+        return resolved
+
+    async def _resolve_references(self, references: List[str]) -> Dict[str, str]:
+        """Resolve `references`, leaving out those that do not exist."""
+        resolved = self._get_cached_shas(references)
+        missing = [reference for reference in references if reference not in resolved]
+        if missing and self.reference_cache_ttl and self.cache_dir is not None:
+            # Of a burst of processes sharing `cache_dir`, only the first asks the
+            # remote; the others find its resolutions once they get the lock
+            async with async_file_lock(self._get_lock_path("references")):
+                resolved.update(self._get_cached_shas(missing))
+                missing = [ref for ref in missing if ref not in resolved]
+                if missing:
+                    resolved.update(await self._ask_remote(missing))
+        elif missing:
+            resolved.update(await self._ask_remote(missing))
+        return resolved
+
+    def _get_reference_cache_root(self) -> Optional[Path]:
+        """Return where resolutions are shared with other processes, if anywhere."""
+        if self.cache_dir is None:
+            return None
+        return Path(self.cache_dir).expanduser().absolute() / "references"
+
+    def _get_cached_shas(self, references: List[str]) -> Dict[str, str]:
+        """Return the SHAs of the `references` that need not be resolved again."""
+        resolved = {}
+        for reference in references:
+            if COMMIT_SHA_PATTERN.fullmatch(reference):
+                resolved[reference] = reference.lower()
+            elif self.reference_cache_ttl:
+                sha = _resolved_references.get(
+                    self._normalize_repo_url(self.repository),
+                    reference,
+                    max_age=self.reference_cache_ttl,
+                    root=self._get_reference_cache_root(),
+                )
+                if sha is not None:
+                    resolved[reference] = sha
+        return resolved
+
+    async def _ask_remote(self, references: List[str]) -> Dict[str, str]:
+        """Resolve `references` through the fetch backend and cache the results.
+
+        With the reference cache or stale pulls enabled, concurrent calls for the
+        same references share a single request.
+        """
+        backend = self._get_backend_class()(self)
+        if not (self.reference_cache_ttl or self.max_staleness):
+            return await backend.resolve_references(references)
+
+        resolved = await _resolve_references_calls.do(
+            (self._create_repo_url(), tuple(references)),
+            lambda: backend.resolve_references(references),
+        )
+        for reference, sha in resolved.items():
+            _resolved_references.put(
+                self._normalize_repo_url(self.repository),
+                reference,
+                sha,
+                root=self._get_reference_cache_root(),
+            )
+        return resolved
+
+    def _get_stale_sha(self) -> Optional[str]:
+        """Return the SHA the reference resolved to within `max_staleness` seconds."""
+        if not self.max_staleness or self._get_pinned_sha() is not None:
+            return None
+        return _resolved_references.get(
+            self._normalize_repo_url(self.repository),
+            self.reference or "HEAD",
+            max_age=self.max_staleness,
+            root=self._get_reference_cache_root(),
+        )
+
+    def _revalidate_in_background(self, from_path: Optional[str]) -> bool:
+        """Resolve the reference again in a background thread, unless still fresh.
+
+        Only one refresh per reference and sub-directory runs at a time in this
+        process. The thread is not a daemon, so an exiting process waits for it
+        rather than abandon a half-written snapshot. Returns whether the served
+        commit was stale, i.e. whether a refresh was needed.
+        """
+        reference = self.reference or "HEAD"
+        if reference in self._get_cached_shas([reference]):
+            return False
+
+        key = (
+            self._create_repo_url(),
+            reference,
+            self._get_sparse_path(from_path),
+            self.cache_dir and os.path.realpath(os.path.expanduser(self.cache_dir)),
+        )
+        with _revalidations_lock:
+            if key in _revalidations:
+                return True
+            _revalidations.add(key)
+
+        def revalidate() -> None:
+            try:
+                anyio.run(self._revalidate, from_path)
+            except Exception:
+                _get_logger().warning(
+                    "Background refresh of %s at %s failed",
+                    self._normalize_repo_url(self.repository),
+                    reference,
+                    exc_info=True,
+                )
+            finally:
+                with _revalidations_lock:
+                    _revalidations.discard(key)
+
+        threading.Thread(
+            target=revalidate, name="prefect-bitbucket-revalidate", daemon=False
+        ).start()
+        return True
+
+    async def _revalidate(self, from_path: Optional[str]) -> None:
+        """Resolve the reference again and snapshot its commit for the next pull."""
+        reference = self.reference or "HEAD"
+        sha = (await self._ask_remote([reference])).get(reference)
+        if sha is not None and self._get_backend_class() is MirrorBackend:
+            await MirrorBackend(self)._populate_snapshot(sha, from_path)
+        _get_logger().debug(
+            "Refreshed %s at %s: %s",
+            self._normalize_repo_url(self.repository),
+            reference,
+            sha,
+        )
+
+    async def _run_ls_remote(self, url: str, references: List[str]) -> Dict[str, str]:
+        """Resolve `references` with one `git ls-remote` call against `url`."""
+        patterns = []
+        for reference in references:
+            patterns += [reference, f"{reference}^{{}}"]
+        output = await self._run_git(
+            ["git", "ls-remote", url, *patterns], capture_stdout=True
+        )
+        refs = {}
+        for line in output.splitlines():
+            sha, _, name = line.partition("\t")
+            refs[name.strip()] = sha.strip()
+
+        resolved = {}
+        for reference in references:
+            for candidate in (
+                f"refs/heads/{reference}",
+                f"refs/tags/{reference}^{{}}",
+                f"refs/tags/{reference}",
+                reference,
+            ):
+                if candidate in refs:
+                    resolved[reference] = refs[candidate]
+                    break
+        return resolved
+
+    def _get_snapshot_cache(self) -> SnapshotCache:
+        """Return the cache of materialized snapshots under `cache_dir`."""
+        return SnapshotCache(
+            root=Path(self.cache_dir).expanduser().absolute() / "snapshots",
+            max_size=self.cache_max_size,
+        )
+
+    async def _update_mirror(self, sha: Optional[str] = None) -> Path:
+        """Create the bare mirror for this repository or fetch new objects into it.
+
+        Credentials are only ever passed on the command line; the mirror's stored
+        remote URL has them stripped. Concurrent updates of the same mirror, from
+        this or other processes, run one after another.
+        """
+        async with async_file_lock(self._get_lock_path("mirror")):
+            return await self._update_mirror_locked(sha)
+
+    async def _update_mirror_locked(self, sha: Optional[str] = None) -> Path:
+        """Create or update the bare mirror while holding its lock.
+
+        A mirror that already holds the commit `sha`, or the pinned commit, is
+        left as it is, and a pinned commit that is not on any branch or tag is
+        fetched on its own.
+        """
+        mirror_path = self._get_mirror_path()
+        pinned_sha = self._get_pinned_sha()
+        wanted_sha = sha or pinned_sha
+        if wanted_sha is not None and await self._has_commit(mirror_path, wanted_sha):
+            return mirror_path
+
+        await self._fetch_into_mirror(mirror_path)
+        if pinned_sha is not None and not await self._has_commit(
+            mirror_path, pinned_sha
+        ):
+            await self._run_git(
+                [
+                    "git",
+                    "-C",
+                    str(mirror_path),
+                    "fetch",
+                    "--progress",
+                    self._create_repo_url(),
+                    pinned_sha,
+                ],
+                progress_label=self._normalize_repo_url(self.repository),
+            )
+        return mirror_path
+
+    async def _has_commit(self, git_dir: Path, sha: str) -> bool:
+        """Check whether the repository at `git_dir` holds the commit `sha`."""
+        if not (git_dir / "HEAD").exists():
+            return False
+        try:
+            await self._run_git(
+                ["git", "-C", str(git_dir), "cat-file", "-e", f"{sha}^{{commit}}"]
+            )
+        except OSError:
+            return False
+        return True
+
+    async def _get_mirror_tip(self, mirror_path: Path) -> str:
+        """Return the commit the configured reference points to in the mirror.
+
+        Without a reference, that is the tip of the remote's current default
+        branch; the mirror's HEAD stays at the default branch the remote had when
+        the mirror was created.
+        """
+        reference = self.reference or "HEAD"
+        if self.reference is None:
+            output = await self._run_git(
+                ["git", "ls-remote", "--symref", self._create_repo_url(), "HEAD"],
+                capture_stdout=True,
+            )
+            for line in output.splitlines():
+                if line.startswith("ref: "):
+                    reference = line[len("ref: ") :].partition("\t")[0]
+                    break
+        sha = (await self._run_ls_remote(mirror_path.as_uri(), [reference])).get(
+            reference
+        )
+        if sha is None:
+            raise OSError(
+                f"Failed to pull from remote:\n reference {reference!r} not found"
+            )
+        return sha
+
+    async def _fetch_into_mirror(self, mirror_path: Path) -> None:
+        """Create the bare mirror at `mirror_path` or fetch new objects into it."""
+        if (mirror_path / "HEAD").exists():
+            await self._run_git(
+                [
+                    "git",
+                    "-C",
+                    str(mirror_path),
+                    "fetch",
+                    "--prune",
+                    "--force",
+                    "--progress",
+                    self._create_repo_url(),
+                    "+refs/heads/*:refs/heads/*",
+                    "+refs/tags/*:refs/tags/*",
+                ],
+                progress_label=self._normalize_repo_url(self.repository),
+            )
+            return
+
+        mirror_path.parent.mkdir(parents=True, exist_ok=True)
+        # Clone next to the final location so a failed or interrupted clone never
+        # leaves a half-populated mirror behind
+        staging_path = mirror_path.with_name(
+            f"{mirror_path.name}.{uuid.uuid4().hex}.tmp"
+        )
+        try:
+            await self._run_git(
+                [
+                    "git",
+                    "clone",
+                    "--bare",
+                    self._create_repo_url(),
+                    "--progress",
+                    str(staging_path),
+                ],
+                progress_label=self._normalize_repo_url(self.repository),
+            )
+            await self._run_git(
+                [
+                    "git",
+                    "-C",
+                    str(staging_path),
+                    "remote",
+                    "set-url",
+                    "origin",
+                    self._normalize_repo_url(self.repository),
+                ]
+            )
+            os.replace(staging_path, mirror_path)
+        finally:
+            shutil.rmtree(staging_path, ignore_errors=True)
+
+    @staticmethod
+    def _get_sparse_path(from_path: Optional[str]) -> Optional[str]:
+        """Return `from_path` as a repository-relative POSIX path.
+
+        Returns `None` when `from_path` refers to the whole repository.
+        """
+        if not from_path:
+            return None
+        sparse_path = Path(from_path).as_posix().strip("/")
+        if sparse_path in ("", "."):
+            return None
+        return sparse_path
+
+    def _has_ignore_rules(self) -> bool:
+        """Check whether files may be excluded from pulls."""
+        return bool(self.ignore_patterns) or self.ignore_file is not None
+
+    def _get_ignore_function(self, content_source: str) -> Optional[IgnoreFunction]:
+        """Return what excludes files of the pulled directory at `content_source`."""
+        patterns = list(self.ignore_patterns)
+        if self.ignore_file is not None:
+            patterns = (
+                read_ignore_file(os.path.join(content_source, self.ignore_file))
+                + patterns
+            )
+        return compile_ignore_patterns(patterns)
+
+    def _uses_sparse_checkout(
+        self, from_path: Optional[str], apply_ignore_rules: bool
+    ) -> bool:
+        """Check whether a clone should only check out part of the repository."""
+        return self.sparse_checkout and (
+            self._get_sparse_path(from_path) is not None
+            or (apply_ignore_rules and self._has_ignore_rules())
+        )
+
+    async def _set_sparse_checkout(
+        self,
+        dst_dir: str,
+        from_path: Optional[str],
+        revision: str,
+        apply_ignore_rules: bool,
+    ) -> None:
+        """Restrict the checkout in `dst_dir` to `from_path`, less ignored files.
+
+        Ignore rules need a non-cone sparse checkout. The ignore file is read from
+        `revision` without checking it out; if it cannot be read, ignored files
+        are still left out when the checkout is synced into place.
+        """
+        sparse_path = self._get_sparse_path(from_path)
+        patterns = list(self.ignore_patterns) if apply_ignore_rules else []
+        if apply_ignore_rules and self.ignore_file is not None:
+            ignore_file_path = posixpath.join(
+                sparse_path or "", Path(self.ignore_file).as_posix()
+            )
+            try:
+                contents = await self._run_git(
+                    ["git", "-C", dst_dir, "show", f"{revision}:{ignore_file_path}"],
+                    capture_stdout=True,
+                )
+            except OSError:
+                contents = ""
+            patterns = contents.splitlines() + patterns
+
+        sparse_patterns = to_sparse_patterns(patterns, sparse_path)
+        if len(sparse_patterns) > 1:
+            cmd = ["sparse-checkout", "set", "--no-cone", *sparse_patterns]
+        elif sparse_path is not None:
+            cmd = ["sparse-checkout", "set", "--cone", sparse_path]
+        else:
+            cmd = ["sparse-checkout", "disable"]
+        await self._run_git(["git", "-C", dst_dir, *cmd])
+
+    async def _clone(
+        self,
+        source_url: str,
+        dst_dir: str,
+        from_path: Optional[str] = None,
+        apply_ignore_rules: bool = True,
+    ) -> None:
+        """Shallow clone the configured reference of `source_url` into `dst_dir`.
+
+        With `sparse_checkout` enabled and a `from_path` given, only the blobs
+        below `from_path` (and files at the repository root) are downloaded and
+        written. Unless `apply_ignore_rules` is unset, the blobs of ignored files
+        are not downloaded either.
+        """
+        if self._get_pinned_sha() is not None:
+            await self._clone_commit(
+                source_url,
+                dst_dir,
+                from_path=from_path,
+                apply_ignore_rules=apply_ignore_rules,
+            )
+            return
+
+        # Construct command
+        cmd = ["git", "clone", source_url]
+        if self.reference:
+            cmd += ["-b", self.reference]
+
+        # Limit git history
+        cmd += ["--depth", "1"]
+
+        sparse = self._uses_sparse_checkout(from_path, apply_ignore_rules)
+        if sparse:
+            # Defer blob downloads until checkout, which the sparse checkout then
+            # restricts
+            cmd += ["--filter=blob:none", "--sparse"]
+
+        cmd += ["--progress", dst_dir]
+        await self._run_git(
+            cmd, progress_label=self._normalize_repo_url(self.repository)
+        )
+
+        if sparse:
+            await self._set_sparse_checkout(
+                dst_dir, from_path, "HEAD", apply_ignore_rules=apply_ignore_rules
+            )
+
+    async def _clone_commit(
+        self,
+        source_url: str,
+        dst_dir: str,
+        from_path: Optional[str] = None,
+        apply_ignore_rules: bool = True,
+        sha: Optional[str] = None,
+    ) -> None:
+        """Fetch only the commit `sha` of `source_url` and check it out in `dst_dir`.
+
+        `sha` defaults to the pinned commit. `git clone` can only check out
+        branches and tags, so the repository is initialized empty and the commit
+        fetched by its SHA, which BitBucket and any git server speaking protocol
+        version 2 allow.
+        """
+        sparse = self._uses_sparse_checkout(from_path, apply_ignore_rules)
+
+        await self._run_git(["git", "init", "--quiet", dst_dir])
+        await self._run_git(
+            ["git", "-C", dst_dir, "remote", "add", "origin", source_url]
+        )
+
+        cmd = ["git", "-C", dst_dir, "fetch", "--depth", "1"]
+        if sparse:
+            cmd += ["--filter=blob:none"]
+        cmd += ["--progress", "origin", sha or self._get_pinned_sha()]
+        await self._run_git(
+            cmd, progress_label=self._normalize_repo_url(self.repository)
+        )
+        if sparse:
+            await self._set_sparse_checkout(
+                dst_dir, from_path, "FETCH_HEAD", apply_ignore_rules=apply_ignore_rules
+            )
+        await self._run_git(
+            ["git", "-C", dst_dir, "checkout", "--quiet", "--detach", "FETCH_HEAD"]
+        )
+
     @staticmethod
     def _get_paths(
         dst_dir: Union[str, None], src_dir: str, sub_directory: Optional[str]
@@ -158,42 +1071,1069 @@ class BitBucketRepository(ReadableDeploymentStorage):
 
         return str(content_source), str(content_destination)
 
+    @validator("backend")
+    def _validate_backend(cls, value: str) -> str:
+        """Ensure the fetch backend is one that is supported."""
+        choices = ["auto", *FETCH_BACKENDS]
+        if value not in choices:
+            raise ValueError(f"Backend must be one of {', '.join(choices)}.")
+        return value
+
+    @validator("cache_dir", always=True)
+    def _ensure_mirror_has_cache_dir(
+        cls, value: Optional[str], values: dict
+    ) -> Optional[str]:
+        """Ensure the mirror backend is given a directory to keep the mirror in."""
+        if value is None and values.get("backend") == "mirror":
+            raise ValueError("The mirror backend requires `cache_dir` to be set.")
+        return value
+
+    @validator("materialization")
+    def _validate_materialization(cls, value: str) -> str:
+        """Ensure the materialization strategy is one that is supported."""
+        if value not in MATERIALIZATION_STRATEGIES:
+            raise ValueError(
+                "Materialization must be one of "
+                f"{', '.join(MATERIALIZATION_STRATEGIES)}."
+            )
+        return value
+
+    def _get_staging_dir(self, local_path: Optional[str]) -> Optional[str]:
+        """Return where temporary clones should be made.
+
+        Linking files requires the clone to live on the same file system as the
+        destination, so unless files are always copied the clone is made next to
+        `local_path` when possible.
+        """
+        if self.materialization == "copy":
+            return None
+        parent = Path(local_path or ".").absolute().parent
+        if parent.is_dir() and os.access(parent, os.W_OK):
+            return str(parent)
+        return None
+
+    async def _sync(
+        self, content_source: str, content_destination: str, shared: bool = False
+    ) -> SyncReport:
+        """Bring `content_destination` in line with `content_source`.
+
+        Set `shared` when `content_source` outlives the pull, e.g. when it is in
+        the snapshot cache; its files are then never hard linked, whatever the
+        materialization strategy, so that it cannot be modified through
+        `content_destination`.
+        """
+        strategy = self.materialization
+        if shared and strategy in ("hardlink", "auto"):
+            strategy = "reflink"
+        report = await run_sync_in_worker_thread(
+            sync_tree,
+            src=content_source,
+            dst=content_destination,
+            delete=self.remove_stale_files,
+            keep=(PULL_MARKER_FILENAME,),
+            strategy=strategy,
+            ignore=self._get_ignore_function(content_source),
+        )
+        _get_logger().debug("Synced %s: %s", content_destination, report)
+        return report
+
     @sync_compatible
     async def get_directory(
         self, from_path: Optional[str] = None, local_path: Optional[str] = None
-    ) -> None:
+    ) -> PullStats:
         """Clones a BitBucket project within `from_path` to the provided `local_path`.
 
         This defaults to cloning the repository reference configured on the
-        Block to the present working directory.
+        Block to the present working directory. When `cache_dir` is set, the
+        contents are served from the snapshot cache whenever the reference still
+        points at a commit that was pulled before.
 
         Args:
             from_path: If provided, interpreted as a subdirectory of the underlying
                 repository that will be copied to the provided local path.
             local_path: A local path to clone to; defaults to present working directory.
 
+        Returns:
+            Timings and counters of the pull, which are also logged and emitted
+            as a Prefect event.
+
         """
-        # Construct command
-        cmd = ["git", "clone", self._create_repo_url()]
-        if self.reference:
-            cmd += ["-b", self.reference]
+        backend_class = self._get_backend_class()
+        stats = PullStats(
+            repository=self._normalize_repo_url(self.repository),
+            reference=self.reference,
+            backend=backend_class.name,
+        )
+        start = time.perf_counter()
+        try:
+            await self._pull_with_retries(
+                backend_class(self, stats), from_path, local_path
+            )
+        except Exception as exc:
+            stats.duration = time.perf_counter() - start
+            self._report_pull(stats, exception=exc)
+            raise
+        stats.duration = time.perf_counter() - start
+        self._report_pull(stats)
+        return stats
 
-        # Limit git history
-        cmd += ["--depth", "1"]
+    async def _pull_with_retries(
+        self,
+        backend: "FetchBackend",
+        from_path: Optional[str],
+        local_path: Optional[str],
+    ) -> None:
+        """Pull with `backend`, retrying transient failures up to `retries` times."""
+        for attempt in range(self.retries + 1):
+            backend.stats.attempts = attempt + 1
+            try:
+                return await self._pull(backend, from_path, local_path)
+            except OSError as exc:
+                if attempt == self.retries or not is_transient_error(exc):
+                    raise
+                delay = get_retry_delay(attempt, self.retry_delay_seconds)
+                _get_logger().warning(
+                    "Pull of %s failed with a transient error; retrying in %.1fs "
+                    "(retry %d of %d): %s",
+                    backend.stats.repository,
+                    delay,
+                    attempt + 1,
+                    self.retries,
+                    exc,
+                )
+                await anyio.sleep(delay)
 
-        # Clone to a temporary directory and move the subdirectory over
-        with TemporaryDirectory(suffix="prefect") as tmp_dir:
-            cmd.append(tmp_dir)
+    async def _pull(
+        self,
+        backend: "FetchBackend",
+        from_path: Optional[str],
+        local_path: Optional[str],
+    ) -> None:
+        """Pull with `backend`, unless `local_path` already holds the commit."""
+        stats = backend.stats
+        if self.skip_unchanged:
+            stale_sha = self._get_stale_sha()
+            if stale_sha is not None and self._is_up_to_date(
+                stale_sha, from_path=from_path, local_path=local_path
+            ):
+                stats.sha = stale_sha
+                stats.skipped = True
+                stats.stale = self._revalidate_in_background(from_path)
+                return
+            # The mirror serves the snapshot of the stale commit by itself
+            if stale_sha is None or not isinstance(backend, MirrorBackend):
+                with stats.phase("resolve"):
+                    stats.sha = await self._resolve_reference()
+                if self._is_up_to_date(
+                    stats.sha, from_path=from_path, local_path=local_path
+                ):
+                    stats.skipped = True
+                    return
+
+        stats.sha = await backend.pull(
+            from_path=from_path,
+            local_path=local_path,
+            sha=stats.sha or self._get_pinned_sha(),
+        )
+
+        if self.skip_unchanged:
+            self._write_marker(stats.sha, from_path=from_path, local_path=local_path)
+
+    def _report_pull(
+        self, stats: PullStats, exception: Optional[BaseException] = None
+    ) -> None:
+        """Log `stats` as a structured record and emit them as a Prefect event."""
+        payload = asdict(stats)
+        logger = _get_logger()
+        if exception is None:
+            logger.info(
+                "Pulled %s at %s: %s",
+                stats.repository,
+                stats.sha or stats.reference or "HEAD",
+                stats,
+                extra={"pull_stats": payload},
+            )
+        else:
+            payload["error"] = f"{type(exception).__name__}: {exception}"
+            logger.warning(
+                "Pull of %s failed after %.2fs",
+                stats.repository,
+                stats.duration,
+                extra={"pull_stats": payload},
+            )
+
+        try:
+            emit_event(
+                event=(
+                    "prefect-bitbucket.repository.pulled"
+                    if exception is None
+                    else "prefect-bitbucket.repository.pull-failed"
+                ),
+                resource={
+                    "prefect.resource.id": (
+                        f"prefect-bitbucket.repository.{stats.repository}"
+                    ),
+                    "prefect.resource.name": stats.repository,
+                },
+                payload=payload,
+            )
+        except Exception:
+            # Metrics must never fail a pull
+            logger.debug("Could not emit pull event", exc_info=True)
+
+    async def _is_managed_checkout(self, path: Path) -> bool:
+        """Check whether `path` is a checkout of this repository made by a pull."""
+        if not (path / ".git").is_dir():
+            return False
+        # Spare a git call for the many checkouts that were not made by a pull
+        try:
+            if "[prefect-bitbucket]" not in (path / ".git" / "config").read_text():
+                return False
+        except (OSError, UnicodeDecodeError):
+            return False
+        try:
+            config = await self._run_git(
+                ["git", "-C", str(path), "config", "--get-regexp", MANAGED_CONFIG_KEYS],
+                capture_stdout=True,
+            )
+        except OSError:
+            return False
+        return set(config.splitlines()) == {
+            f"remote.origin.url {self._normalize_repo_url(self.repository)}",
+            "prefect-bitbucket.managed true",
+        }
+
+    async def _can_checkout_in_place(
+        self, from_path: Optional[str], local_path: Optional[str]
+    ) -> bool:
+        """Check whether the whole repository can be checked out at `local_path`.
+
+        That is the case when no sub-directory is requested, no files are to be
+        ignored and `local_path` is a checkout of this repository made by a
+        previous pull, or, with `checkout_in_place` enabled, when it is empty.
+        """
+        if self._get_sparse_path(from_path) is not None or self._has_ignore_rules():
+            return False
+        destination = Path(local_path or ".").absolute()
+        if not destination.exists():
+            return self.checkout_in_place
+        if destination.is_dir() and not any(destination.iterdir()):
+            return self.checkout_in_place
+        return await self._is_managed_checkout(destination)
 
-            err_stream = io.StringIO()
-            out_stream = io.StringIO()
-            process = await run_process(cmd, stream_output=(out_stream, err_stream))
-            if process.returncode != 0:
-                err_stream.seek(0)
-                raise OSError(f"Failed to pull from remote:\n {err_stream.read()}")
+    async def _checkout_in_place(
+        self, source_url: str, local_path: Optional[str], sha: Optional[str] = None
+    ) -> None:
+        """Check the repository out at `local_path` without an intermediate copy.
+
+        An empty `local_path` is cloned into from `source_url`, while a checkout
+        left there by a previous pull is updated from it: only the new objects
+        are fetched, and only the files that changed are rewritten. The commit
+        `sha` is checked out if given, else the configured reference.
+        """
+        destination = Path(local_path or ".").absolute()
 
-            content_source, content_destination = self._get_paths(
+        if (destination / ".git").is_dir():
+            await self._run_git(
+                [
+                    "git",
+                    "-C",
+                    str(destination),
+                    "fetch",
+                    "--depth",
+                    "1",
+                    "--progress",
+                    source_url,
+                    sha or self.reference or "HEAD",
+                ],
+                progress_label=self._normalize_repo_url(self.repository),
+            )
+            await self._run_git(
+                [
+                    "git",
+                    "-C",
+                    str(destination),
+                    "reset",
+                    "--hard",
+                    "--quiet",
+                    "FETCH_HEAD",
+                ]
+            )
+            if self.remove_stale_files:
+                await self._run_git(
+                    [
+                        "git",
+                        "-C",
+                        str(destination),
+                        "clean",
+                        "-d",
+                        "--force",
+                        "--force",
+                        "--quiet",
+                        "--exclude",
+                        f"/{PULL_MARKER_FILENAME}",
+                    ]
+                )
+            return
+
+        destination.mkdir(parents=True, exist_ok=True)
+        if sha is not None:
+            await self._clone_commit(source_url, str(destination), sha=sha)
+        else:
+            await self._clone(source_url, str(destination))
+        # Never persist credentials, and mark the checkout as ours so later pulls
+        # may update it
+        await self._run_git(
+            [
+                "git",
+                "-C",
+                str(destination),
+                "remote",
+                "set-url",
+                "origin",
+                self._normalize_repo_url(self.repository),
+            ]
+        )
+        await self._run_git(
+            [
+                "git",
+                "-C",
+                str(destination),
+                "config",
+                "prefect-bitbucket.managed",
+                "true",
+            ]
+        )
+
+    def _get_marker_contents(self, sha: str, from_path: Optional[str]) -> dict:
+        """Return what the marker should hold after pulling `sha` and `from_path`."""
+        return {
+            "repository": self._normalize_repo_url(self.repository),
+            "from_path": self._get_sparse_path(from_path),
+            "sha": sha,
+        }
+
+    def _is_up_to_date(
+        self, sha: str, from_path: Optional[str], local_path: Optional[str]
+    ) -> bool:
+        """Check whether a previous pull already placed `sha` at `local_path`."""
+        _, content_destination = self._get_paths(
+            dst_dir=local_path, src_dir=".", sub_directory=from_path
+        )
+        marker_path = Path(local_path or ".").absolute() / PULL_MARKER_FILENAME
+        try:
+            marker = json.loads(marker_path.read_text())
+        except (OSError, ValueError):
+            return False
+        return marker == self._get_marker_contents(sha, from_path) and os.path.isdir(
+            content_destination
+        )
+
+    def _write_marker(
+        self, sha: str, from_path: Optional[str], local_path: Optional[str]
+    ) -> None:
+        """Record in `local_path` which commit and sub-directory were pulled."""
+        marker_path = Path(local_path or ".").absolute() / PULL_MARKER_FILENAME
+        marker_path.parent.mkdir(parents=True, exist_ok=True)
+        marker_path.write_text(json.dumps(self._get_marker_contents(sha, from_path)))
+
+    def _get_lock_path(self, *parts: Optional[str]) -> Path:
+        """Return the lock file coordinating work on this repository and `parts`."""
+        key = hashlib.sha256(
+            "\0".join(
+                [self._normalize_repo_url(self.repository)]
+                + [part or "" for part in parts]
+            ).encode()
+        ).hexdigest()
+        return Path(self.cache_dir).expanduser().absolute() / "locks" / f"{key}.lock"
+
+    def _resolves_through_cache(self) -> bool:
+        """Check whether pulls resolve the reference through the reference cache."""
+        return (
+            bool(self.reference_cache_ttl)
+            and self._get_pinned_sha() is None
+            and (self.skip_unchanged or self._get_backend_class() is MirrorBackend)
+        )
+
+    def _get_backend_class(self) -> Type["FetchBackend"]:
+        """Return the fetch backend to pull with.
+
+        With `backend` set to `auto`, repositories with a `cache_dir` are pulled
+        through the mirror, since a warm mirror only transfers what changed and a
+        cold one pays off from the second pull on. Without a cache the git CLI is
+        used, or the REST archive API when git is not installed.
+        """
+        if self.backend != "auto":
+            return FETCH_BACKENDS[self.backend]
+        if self.cache_dir is not None:
+            return MirrorBackend
+        if not GitBackend.is_available():
+            return ArchiveBackend
+        return GitBackend
+
+
+class FetchBackend(abc.ABC):
+    """Fetches a repository's contents for `BitBucketRepository.get_directory`.
+
+    Subclasses registered with `register_fetch_backend` can be selected by their
+    `name` through the block's `backend` field.
+
+    Attributes:
+        name: The value of the `backend` field selecting this backend.
+        block: The block being pulled.
+        stats: Where the backend records phase timings and counters.
+
+    """
+
+    name: ClassVar[str]
+
+    def __init__(self, block: BitBucketRepository, stats: Optional[PullStats] = None):
+        """Pull the repository configured on `block`, recording into `stats`."""
+        self.block = block
+        self.stats = stats or PullStats(
+            repository=block._normalize_repo_url(block.repository),
+            reference=block.reference,
+            backend=self.name,
+        )
+
+    @classmethod
+    def is_available(cls) -> bool:
+        """Check whether this backend can run in the current environment."""
+        return True
+
+    async def resolve_references(self, references: List[str]) -> Dict[str, str]:
+        """Resolve branches and tags to commit SHAs, leaving out missing ones.
+
+        Backends that work without git override this; the default asks the
+        remote with a single `git ls-remote` call.
+        """
+        block = self.block
+        return await block._run_ls_remote(block._create_repo_url(), references)
+
+    @abc.abstractmethod
+    async def pull(
+        self,
+        from_path: Optional[str],
+        local_path: Optional[str],
+        sha: Optional[str] = None,
+    ) -> Optional[str]:
+        """Place the repository contents within `from_path` at `local_path`.
+
+        Args:
+            from_path: The sub-directory of the repository to pull, if any.
+            local_path: A local path to pull to; defaults to present working
+                directory.
+            sha: The commit the block's reference resolves to, if already known.
+
+        Returns:
+            The SHA of the commit that was pulled, if known.
+
+        """
+
+
+FETCH_BACKENDS: Dict[str, Type[FetchBackend]] = {}
+
+
+def register_fetch_backend(cls: Type[FetchBackend]) -> Type[FetchBackend]:
+    """Make a fetch backend selectable through `BitBucketRepository.backend`.
+
+    Examples:
+        Register a custom backend:
+        ```python
+        from prefect_bitbucket.repository import FetchBackend, register_fetch_backend
+
+        @register_fetch_backend
+        class MyBackend(FetchBackend):
+            name = "mine"
+
+            async def pull(self, from_path, local_path, sha=None):
+                ...
+        ```
+
+    """
+    if cls.name == "auto":
+        raise ValueError("'auto' is reserved for automatic backend selection.")
+    FETCH_BACKENDS[cls.name] = cls
+    return cls
+
+
+@register_fetch_backend
+class GitBackend(FetchBackend):
+    """Shallow clones the repository with the git CLI.
+
+    The clone is made in a temporary directory and the requested contents are
+    synced into place from there.
+    """
+
+    name = "git"
+
+    @classmethod
+    def is_available(cls) -> bool:
+        """Check whether git is installed."""
+        return shutil.which("git") is not None
+
+    async def pull(
+        self,
+        from_path: Optional[str],
+        local_path: Optional[str],
+        sha: Optional[str] = None,
+    ) -> Optional[str]:
+        """Clone the repository and copy `from_path` to `local_path`."""
+        block = self.block
+        if await block._can_checkout_in_place(
+            from_path=from_path, local_path=local_path
+        ):
+            with self.stats.phase("fetch"):
+                await block._checkout_in_place(block._create_repo_url(), local_path)
+            return sha
+
+        # Clone to a temporary directory and move the subdirectory over
+        with TemporaryDirectory(
+            suffix="prefect", dir=block._get_staging_dir(local_path)
+        ) as tmp_dir:
+            with self.stats.phase("fetch"):
+                await block._clone(
+                    block._create_repo_url(), tmp_dir, from_path=from_path
+                )
+            self.stats.add_bytes_transferred(_get_pack_size(Path(tmp_dir, ".git")))
+
+            content_source, content_destination = block._get_paths(
                 dst_dir=local_path, src_dir=tmp_dir, sub_directory=from_path
             )
 
-            copy_tree(src=content_source, dst=content_destination)
+            with self.stats.phase("materialize"):
+                report = await block._sync(content_source, content_destination)
+            self.stats.add_sync_report(report)
+        return sha
+
+
+@register_fetch_backend
+class MirrorBackend(FetchBackend):
+    """Keeps a bare mirror and commit-keyed snapshots in the block's `cache_dir`.
+
+    Pulls of a commit seen before are served from the snapshot cache without any
+    fetch or checkout; otherwise only new objects are fetched into the mirror.
+    """
+
+    name = "mirror"
+
+    async def pull(
+        self,
+        from_path: Optional[str],
+        local_path: Optional[str],
+        sha: Optional[str] = None,
+    ) -> Optional[str]:
+        """Pull through the mirror and snapshot cache."""
+        block = self.block
+        if block.cache_dir is None:
+            raise ValueError("The mirror backend requires `cache_dir` to be set.")
+
+        if await block._can_checkout_in_place(
+            from_path=from_path, local_path=local_path
+        ):
+            if sha is None:
+                with self.stats.phase("resolve"):
+                    sha = await block._resolve_reference()
+            with self.stats.phase("fetch"):
+                mirror_path = await block._update_mirror(sha)
+            with self.stats.phase("checkout"):
+                return await self._checkout_from_mirror(mirror_path, sha, local_path)
+
+        return await self._get_directory_from_cache(
+            from_path=from_path, local_path=local_path, sha=sha
+        )
+
+    async def _checkout_from_mirror(
+        self, mirror_path: Path, sha: str, local_path: Optional[str]
+    ) -> str:
+        """Check the commit `sha` out of the mirror at `local_path`.
+
+        The commit is checked out rather than the reference, as the mirror's HEAD
+        stays at the default branch the remote had when the mirror was created.
+        Returns the SHA of the commit that was checked out.
+        """
+        block = self.block
+        if sha == block._get_pinned_sha() or await block._has_commit(mirror_path, sha):
+            await block._checkout_in_place(mirror_path.as_uri(), local_path, sha=sha)
+            return sha
+
+        # The reference moved and its earlier commit is gone from the remote, so
+        # take the reference's current tip
+        sha = await block._get_mirror_tip(mirror_path)
+        await block._checkout_in_place(mirror_path.as_uri(), local_path, sha=sha)
+        return sha
+
+    async def _get_directory_from_cache(
+        self,
+        from_path: Optional[str],
+        local_path: Optional[str],
+        sha: Optional[str] = None,
+    ) -> str:
+        """Copy the requested tree out of the snapshot cache.
+
+        The cache is populated from the local mirror first if this commit has not
+        been pulled before, unless `max_staleness` allows serving the snapshot of
+        what the reference resolved to earlier. Returns the SHA of the commit that
+        was copied.
+        """
+        block = self.block
+        snapshots = block._get_snapshot_cache()
+        stale_sha = block._get_stale_sha() if sha is None else None
+        if stale_sha is not None:
+            async with snapshots.open_async(stale_sha, from_path) as snapshot:
+                if snapshot is not None:
+                    self.stats.cache_hit = True
+                    self.stats.bytes_transferred = 0
+                    await self._sync_snapshot(snapshot, from_path, local_path)
+            if snapshot is not None:
+                self.stats.stale = block._revalidate_in_background(from_path)
+                return stale_sha
+
+        if sha is None:
+            with self.stats.phase("resolve"):
+                sha = await block._resolve_reference()
+        async with snapshots.open_async(sha, from_path) as snapshot:
+            if snapshot is not None:
+                self.stats.cache_hit = True
+                self.stats.bytes_transferred = 0
+                await self._sync_snapshot(snapshot, from_path, local_path)
+                return sha
+
+        self.stats.cache_hit = False
+
+        # Only one task per process, and one process per cache directory, fetches
+        # a given reference at a time; everyone else reuses its snapshot
+        for _ in range(2):
+            sha = await _populate_snapshot_calls.do(
+                (
+                    block._normalize_repo_url(block.repository),
+                    block.reference,
+                    block._get_sparse_path(from_path),
+                    block.sparse_checkout,
+                    os.path.realpath(os.path.expanduser(block.cache_dir)),
+                ),
+                lambda: self._populate_snapshot(sha, from_path),
+            )
+            async with snapshots.open_async(sha, from_path) as snapshot:
+                if snapshot is not None:
+                    await self._sync_snapshot(snapshot, from_path, local_path)
+                    return sha
+
+        raise OSError(
+            f"Failed to pull from remote:\n snapshot of {sha} was evicted from the "
+            "cache before it could be copied; consider raising `cache_max_size`."
+        )
+
+    async def _sync_snapshot(
+        self, snapshot: Path, from_path: Optional[str], local_path: Optional[str]
+    ) -> None:
+        """Sync a snapshot from the cache into the local path."""
+        _, content_destination = self.block._get_paths(
+            dst_dir=local_path, src_dir=str(snapshot), sub_directory=from_path
+        )
+        with self.stats.phase("materialize"):
+            report = await self.block._sync(
+                str(snapshot), content_destination, shared=True
+            )
+        self.stats.add_sync_report(report)
+
+    async def _populate_snapshot(self, sha: str, from_path: Optional[str]) -> str:
+        """Store the tree of the configured reference in the snapshot cache.
+
+        `sha` is what the reference was last resolved to; if a snapshot of it
+        appeared while waiting for other processes, nothing is fetched. Returns the
+        SHA of the stored snapshot.
+        """
+        block = self.block
+        snapshots = block._get_snapshot_cache()
+        async with async_file_lock(block._get_lock_path("reference", block.reference)):
+            async with snapshots.open_async(sha, from_path) as snapshot:
+                if snapshot is not None:
+                    return sha
+
+            with self.stats.phase("fetch"):
+                mirror_path = await block._update_mirror(sha)
+            with TemporaryDirectory(suffix="prefect") as tmp_dir:
+                with self.stats.phase("checkout"):
+                    # Snapshots hold every file, whatever the ignore rules of
+                    # the pulls that later read them. The commit the reference
+                    # resolved to is checked out rather than the reference, as
+                    # the mirror's HEAD stays at the default branch the remote
+                    # had when the mirror was created.
+                    if sha == block._get_pinned_sha() or await block._has_commit(
+                        mirror_path, sha
+                    ):
+                        await block._clone_commit(
+                            mirror_path.as_uri(),
+                            tmp_dir,
+                            from_path=from_path,
+                            apply_ignore_rules=False,
+                            sha=sha,
+                        )
+                    else:
+                        # The reference moved and its earlier commit is gone
+                        # from the remote, so take the reference's current tip
+                        await block._clone(
+                            mirror_path.as_uri(),
+                            tmp_dir,
+                            from_path=from_path,
+                            apply_ignore_rules=False,
+                        )
+                        sha = (
+                            await block._run_git(
+                                ["git", "-C", tmp_dir, "rev-parse", "HEAD"],
+                                capture_stdout=True,
+                            )
+                        ).strip()
+
+                content_source, _ = block._get_paths(
+                    dst_dir=None, src_dir=tmp_dir, sub_directory=from_path
+                )
+                with self.stats.phase("snapshot"):
+                    await run_sync_in_worker_thread(
+                        snapshots.put, sha, from_path, Path(content_source)
+                    )
+        return sha
+
+
+@register_fetch_backend
+class ArchiveBackend(FetchBackend):
+    """Streams a tar.gz archive of the reference from the BitBucket REST API.
+
+    Works with BitBucket Cloud and Server and does not need git.
+    """
+
+    name = "archive"
+
+    def _get_auth(self) -> Tuple[Optional[httpx.Auth], Dict[str, str]]:
+        """Return the authentication and headers for REST API archive downloads.
+
+        Mirrors `_create_repo_url`: a token with a username is sent as basic
+        authentication, a token on its own as a bearer token.
+        """
+        credentials = self.block.bitbucket_credentials
+        if credentials is None:
+            return None, {}
+        if credentials.token is not None:
+            token = credentials.token.get_secret_value()
+            if credentials.username is not None:
+                return httpx.BasicAuth(credentials.username, token), {}
+            return None, {"Authorization": f"Bearer {token}"}
+        if credentials.password is not None and credentials.username is not None:
+            return (
+                httpx.BasicAuth(
+                    credentials.username, credentials.password.get_secret_value()
+                ),
+                {},
+            )
+        return None, {}
+
+    def _remove_ignored(
+        self, content_destination: str, extracted: Set[str]
+    ) -> Set[str]:
+        """Remove the extracted files that the ignore rules exclude.
+
+        Returns the paths that are excluded, relative to `content_destination`.
+        """
+        ignore = self.block._get_ignore_function(content_destination)
+        if ignore is None:
+            return set()
+
+        # Archives need not list the directories they contain
+        candidates = set(extracted)
+        for rel_path in extracted:
+            parent = posixpath.dirname(rel_path)
+            while parent:
+                candidates.add(parent)
+                parent = posixpath.dirname(parent)
+
+        ignored = set()
+        for rel_path in sorted(candidates):
+            path = os.path.join(content_destination, *rel_path.split("/"))
+            is_dir = os.path.isdir(path) and not os.path.islink(path)
+            if not os.path.lexists(path) or not ignore(rel_path, is_dir):
+                continue
+            if is_dir:
+                shutil.rmtree(path)
+                ignored.update(
+                    other
+                    for other in extracted
+                    if other == rel_path or other.startswith(f"{rel_path}/")
+                )
+            else:
+                os.unlink(path)
+                ignored.add(rel_path)
+        return ignored
+
+    async def resolve_references(self, references: List[str]) -> Dict[str, str]:
+        """Resolve branches and tags to commit SHAs through the REST API."""
+        auth, headers = self._get_auth()
+        return await run_sync_in_worker_thread(
+            resolve_revisions,
+            repository=self.block.repository,
+            references=references,
+            auth=auth,
+            headers=headers,
+        )
+
+    async def pull(
+        self,
+        from_path: Optional[str],
+        local_path: Optional[str],
+        sha: Optional[str] = None,
+    ) -> Optional[str]:
+        """Stream an archive of the reference straight into the local path."""
+        block = self.block
+        _, content_destination = block._get_paths(
+            dst_dir=local_path, src_dir=".", sub_directory=from_path
+        )
+        auth, headers = self._get_auth()
+        with self.stats.phase("fetch"):
+            extracted, num_bytes = await run_sync_in_worker_thread(
+                download_archive,
+                repository=block.repository,
+                reference=sha or block.reference,
+                destination=content_destination,
+                auth=auth,
+                headers=headers,
+                sub_directory=block._get_sparse_path(from_path),
+                ignore=compile_ignore_patterns(block.ignore_patterns),
+            )
+        self.stats.add_bytes_transferred(num_bytes)
+        if (
+            block.ignore_file is not None
+            and Path(block.ignore_file).as_posix() in extracted
+        ):
+            # The ignore file may come anywhere in the archive, so the files it
+            # excludes can only be removed once everything is extracted
+            extracted -= await run_sync_in_worker_thread(
+                self._remove_ignored, content_destination, extracted
+            )
+        self.stats.files_written += len(extracted)
+        if block.remove_stale_files:
+            with self.stats.phase("materialize"):
+                deleted = await run_sync_in_worker_thread(
+                    remove_unlisted,
+                    content_destination,
+                    extracted | {PULL_MARKER_FILENAME},
+                )
+            self.stats.files_deleted += len(deleted)
+        _get_logger().debug(
+            "Extracted %d files into %s", len(extracted), content_destination
+        )
+        return sha
+
+
+@register_fetch_backend
+class DulwichBackend(FetchBackend):
+    """Fetches over git's smart HTTP protocol inside the Python process.
+
+    Needs neither git nor a subprocess: the shallow pack of the reference is
+    fetched with `dulwich` over a connection pool shared by the pulls from the
+    same server with the same credentials, and written straight to the local
+    path.
+    """
+
+    name = "dulwich"
+
+    @classmethod
+    def is_available(cls) -> bool:
+        """Check whether dulwich is installed."""
+        return importlib.util.find_spec("dulwich") is not None
+
+    def _get_credentials(self) -> Tuple[Optional[str], Optional[str]]:
+        """Return the username and password to fetch with, like `_create_repo_url`."""
+        credentials = self.block.bitbucket_credentials
+        if credentials is None:
+            return None, None
+        if credentials.token is not None:
+            return (
+                credentials.username or "x-token-auth",
+                credentials.token.get_secret_value(),
+            )
+        if credentials.password is not None:
+            return credentials.username, credentials.password.get_secret_value()
+        return None, None
+
+    def _ensure_available(self) -> None:
+        """Raise an `ImportError` if dulwich is not installed."""
+        if not self.is_available():
+            raise ImportError(
+                "The dulwich backend requires the `dulwich` package; install it "
+                "with `pip install prefect-bitbucket[dulwich]`."
+            )
+
+    async def resolve_references(self, references: List[str]) -> Dict[str, str]:
+        """Resolve branches and tags to commit SHAs from the advertised refs."""
+        self._ensure_available()
+        from prefect_bitbucket._smart_http import resolve_references
+
+        username, password = self._get_credentials()
+        return await run_sync_in_worker_thread(
+            resolve_references,
+            url=self.block.repository,
+            references=references,
+            username=username,
+            password=password,
+        )
+
+    async def pull(
+        self,
+        from_path: Optional[str],
+        local_path: Optional[str],
+        sha: Optional[str] = None,
+    ) -> Optional[str]:
+        """Fetch the reference and write its files into the local path."""
+        self._ensure_available()
+        from prefect_bitbucket._smart_http import fetch_snapshot
+
+        block = self.block
+        _, content_destination = block._get_paths(
+            dst_dir=local_path, src_dir=".", sub_directory=from_path
+        )
+        username, password = self._get_credentials()
+        with self.stats.phase("fetch"):
+            sha, report = await run_sync_in_worker_thread(
+                fetch_snapshot,
+                url=block.repository,
+                reference=block.reference,
+                destination=content_destination,
+                sub_directory=block._get_sparse_path(from_path),
+                username=username,
+                password=password,
+                ignore_patterns=block.ignore_patterns,
+                ignore_file=block.ignore_file,
+            )
+        if block.remove_stale_files:
+            written = {*report.created, *report.updated, *report.unchanged}
+            with self.stats.phase("materialize"):
+                report.deleted = sorted(
+                    await run_sync_in_worker_thread(
+                        remove_unlisted,
+                        content_destination,
+                        written | {PULL_MARKER_FILENAME},
+                    )
+                )
+        self.stats.add_sync_report(report)
+        _get_logger().debug("Fetched %s into %s: %s", sha, content_destination, report)
+        return sha
+
+
+@dataclass
+class PullResult:
+    """The outcome of pulling one repository with `pull_many`.
+
+    Attributes:
+        repository: The repository URL, without credentials.
+        local_path: The local path the repository was pulled to.
+        from_path: The sub-directory of the repository that was pulled, if any.
+        duration: How long the pull took, in seconds.
+        exception: The exception the pull failed with, if it failed.
+        stats: The timings and counters returned by `get_directory`, if it
+            succeeded.
+
+    """
+
+    repository: str
+    local_path: Optional[str]
+    from_path: Optional[str]
+    duration: float
+    exception: Optional[BaseException] = None
+    stats: Optional[PullStats] = None
+
+    @property
+    def ok(self) -> bool:
+        """Whether the pull succeeded."""
+        return self.exception is None
+
+
+@sync_compatible
+async def pull_many(
+    blocks_and_paths: Iterable[
+        Union[
+            Tuple[BitBucketRepository, Optional[str]],
+            Tuple[BitBucketRepository, Optional[str], Optional[str]],
+        ]
+    ],
+    max_concurrency: int = 4,
+) -> List[PullResult]:
+    """Pull several BitBucket repositories concurrently.
+
+    Failures do not stop the other pulls; they are reported on the returned
+    results instead. Blocks with a `reference_cache_ttl` have the references of
+    each repository resolved together first, with a single call to the remote.
+
+    Args:
+        blocks_and_paths: `(block, local_path)` or `(block, local_path, from_path)`
+            tuples, passed on to `BitBucketRepository.get_directory`.
+        max_concurrency: The maximum number of pulls running at the same time.
+
+    Returns:
+        One result per pull, in the order the pulls were given.
+
+    Examples:
+        Pull flow code from two repositories at once:
+        ```python
+        from prefect_bitbucket.repository import BitBucketRepository, pull_many
+
+        results = pull_many(
+            [
+                (BitBucketRepository.load("flows"), "flows"),
+                (BitBucketRepository.load("shared"), "shared", "src/shared"),
+            ],
+            max_concurrency=2,
+        )
+        assert all(result.ok for result in results)
+        ```
+
+    """
+    if max_concurrency < 1:
+        raise ValueError("max_concurrency must be at least 1.")
+
+    pulls = [tuple(pull) + (None,) * (3 - len(pull)) for pull in blocks_and_paths]
+    results: List[Optional[PullResult]] = [None] * len(pulls)
+    limiter = anyio.Semaphore(max_concurrency)
+
+    async def pull(index: int, block: BitBucketRepository, local_path, from_path):
+        async with limiter:
+            start = time.monotonic()
+            exception = stats = None
+            try:
+                stats = await block.get_directory(
+                    from_path=from_path, local_path=local_path
+                )
+            except Exception as exc:
+                exception = exc
+            results[index] = PullResult(
+                repository=block._normalize_repo_url(block.repository),
+                local_path=local_path,
+                from_path=from_path,
+                duration=time.monotonic() - start,
+                exception=exception,
+                stats=stats,
+            )
+
+    async def resolve(block: BitBucketRepository, references: List[str]):
+        async with limiter:
+            try:
+                await block._resolve_references(references)
+            except OSError:
+                # Every pull resolves its own reference again and reports the error
+                _get_logger().debug("Could not resolve %s", references, exc_info=True)
+
+    references_by_url: Dict[str, Tuple[BitBucketRepository, List[str]]] = {}
+    for block, _, _ in pulls:
+        if block._resolves_through_cache():
+            _, references = references_by_url.setdefault(
+                block._create_repo_url(), (block, [])
+            )
+            references.append(block.reference or "HEAD")
+    async with anyio.create_task_group() as tg:
+        for block, references in references_by_url.values():
+            tg.start_soon(resolve, block, list(dict.fromkeys(references)))
+
+    async with anyio.create_task_group() as tg:
+        for index, (block, local_path, from_path) in enumerate(pulls):
+            tg.start_soon(pull, index, block, local_path, from_path)
+
+    return results
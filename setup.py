@@ -26,7 +26,7 @@ setup(
     packages=find_packages(exclude=("tests", "docs")),
     python_requires=">=3.7",
     install_requires=install_requires,
-    extras_require={"dev": dev_requires},
+    extras_require={"dev": dev_requires, "dulwich": ["dulwich>=0.21.0"]},
     entry_points={
         "prefect.collections": [
             "prefect_bitbucket = prefect_bitbucket",
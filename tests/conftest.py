@@ -1,3 +1,5 @@
+import subprocess
+
 import pytest
 from prefect.testing.utilities import prefect_test_harness
 
@@ -20,3 +22,43 @@ def reset_object_registry():
 
     with PrefectObjectRegistry():
         yield
+
+
+def _git(*args, cwd=None):
+    subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True, text=True)
+
+
+@pytest.fixture
+def git_remote(tmp_path):
+    """
+    Creates a local git repository to pull from and returns a helper for
+    committing files to it.
+    """
+    remote_path = tmp_path / "remote"
+    remote_path.mkdir()
+    _git("init", "--initial-branch=main", cwd=remote_path)
+    _git("config", "user.email", "test@example.com", cwd=remote_path)
+    _git("config", "user.name", "test", cwd=remote_path)
+
+    class Remote:
+        path = remote_path
+        url = remote_path.as_uri()
+
+        @staticmethod
+        def commit(files: dict, message: str = "commit") -> str:
+            for name, content in files.items():
+                file_path = remote_path / name
+                file_path.parent.mkdir(parents=True, exist_ok=True)
+                file_path.write_text(content)
+            _git("add", "-A", cwd=remote_path)
+            _git("commit", "-m", message, cwd=remote_path)
+            return subprocess.run(
+                ["git", "rev-parse", "HEAD"],
+                cwd=remote_path,
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout.strip()
+
+    Remote.commit({"flow.py": "print('hello')\n", "puppy/cat.txt": "meow\n"})
+    return Remote
@@ -0,0 +1,344 @@
+import functools
+import io
+import os
+import tarfile
+
+import httpx
+import pytest
+from pydantic import VERSION as PYDANTIC_VERSION
+
+if PYDANTIC_VERSION.startswith("2."):
+    from pydantic.v1 import SecretStr
+else:
+    from pydantic import SecretStr
+
+import prefect_bitbucket.repository
+from prefect_bitbucket import _archive
+from prefect_bitbucket._archive import (
+    extract_stream,
+    get_archive_request,
+    resolve_revisions,
+)
+from prefect_bitbucket.credentials import BitBucketCredentials
+from prefect_bitbucket.repository import (
+    PULL_MARKER_FILENAME,
+    ArchiveBackend,
+    BitBucketRepository,
+)
+
+
+def make_archive(files: dict, prefix: str = "", symlinks: dict = None) -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+        for name, content in files.items():
+            info = tarfile.TarInfo(prefix + name)
+            info.size = len(content)
+            info.mode = 0o755 if name.endswith(".sh") else 0o644
+            tar.addfile(info, io.BytesIO(content))
+        for name, target in (symlinks or {}).items():
+            info = tarfile.TarInfo(prefix + name)
+            info.type = tarfile.SYMTYPE
+            info.linkname = target
+            tar.addfile(info)
+    return buffer.getvalue()
+
+
+SHA = "0123456789abcdef0123456789abcdef01234567"
+
+
+def chunked(data: bytes, size: int = 7):
+    return iter([data[i : i + size] for i in range(0, len(data), size)])
+
+
+@pytest.fixture
+def mock_bitbucket(monkeypatch):
+    requests = []
+    files = {"flow.py": b"print('hello')\n", "puppy/cat.txt": b"meow\n", "run.sh": b""}
+    cloud_archive = make_archive(files, prefix="workspace-repo-0123456789ab/")
+    server_archive = make_archive(files)
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        if (
+            "missing" in request.url.path
+            or request.url.params.get("until") == "missing"
+        ):
+            return httpx.Response(404, text="Not found")
+        if request.url.path.endswith("/commits"):
+            return httpx.Response(200, json={"values": [{"id": SHA}]})
+        if "/commit/" in request.url.path:
+            return httpx.Response(200, json={"hash": SHA})
+        if request.url.host == "api.bitbucket.org":
+            return httpx.Response(200, json={"mainbranch": {"name": "trunk"}})
+        if request.url.host == "bitbucket.org":
+            return httpx.Response(200, content=cloud_archive)
+        return httpx.Response(200, content=server_archive)
+
+    monkeypatch.setattr(
+        _archive.httpx,
+        "Client",
+        functools.partial(httpx.Client, transport=httpx.MockTransport(handler)),
+    )
+    return requests
+
+
+class TestArchiveRequest:
+    @pytest.mark.parametrize(
+        "repository,reference,url,params",
+        [
+            (
+                "https://bitbucket.org/workspace/repo.git",
+                "feature/x",
+                "https://bitbucket.org/workspace/repo/get/feature%2Fx.tar.gz",
+                {},
+            ),
+            (
+                "https://bitbucket.example.com/scm/PROJ/repo.git",
+                "main",
+                "https://bitbucket.example.com/rest/api/latest/projects/PROJ/repos/"
+                "repo/archive",
+                {"format": "tgz", "at": "main"},
+            ),
+            (
+                "https://example.com:7990/bitbucket/scm/~me/repo.git",
+                None,
+                "https://example.com:7990/bitbucket/rest/api/latest/projects/~me/"
+                "repos/repo/archive",
+                {"format": "tgz"},
+            ),
+        ],
+    )
+    def test_archive_request(self, repository, reference, url, params):
+        request = get_archive_request(repository, reference, client=None)
+        assert request.url == url
+        assert request.params == params
+
+    def test_server_archives_only_sub_directory(self):
+        request = get_archive_request(
+            "https://bitbucket.example.com/scm/PROJ/repo.git",
+            "main",
+            client=None,
+            sub_directory="flows/etl",
+        )
+        assert request.params == {"format": "tgz", "at": "main", "path": "flows/etl"}
+
+    def test_cloud_archives_whole_repository(self):
+        request = get_archive_request(
+            "https://bitbucket.org/workspace/repo.git",
+            "main",
+            client=None,
+            sub_directory="flows/etl",
+        )
+        assert request.params == {}
+
+    def test_cloud_default_branch_is_looked_up(self, mock_bitbucket):
+        with _archive.httpx.Client() as client:
+            request = get_archive_request(
+                "https://bitbucket.org/workspace/repo.git", None, client
+            )
+        assert request.url.endswith("/get/trunk.tar.gz")
+        assert request.strip_components == 1
+
+    @pytest.mark.parametrize(
+        "repository", ["git@bitbucket.org:workspace/repo.git", "https://host/repo"]
+    )
+    def test_unsupported_repository_urls(self, repository):
+        with pytest.raises(ValueError):
+            get_archive_request(repository, "main", client=None)
+
+
+class TestResolveRevisions:
+    def test_cloud(self, mock_bitbucket):
+        resolved = resolve_revisions(
+            "https://bitbucket.org/workspace/repo.git",
+            ["feature/x", "HEAD", "missing"],
+        )
+
+        assert resolved == {"feature/x": SHA, "HEAD": SHA}
+        assert [request.url.raw_path.decode() for request in mock_bitbucket] == [
+            "/2.0/repositories/workspace/repo/commit/feature%2Fx",
+            "/2.0/repositories/workspace/repo",
+            "/2.0/repositories/workspace/repo/commit/trunk",
+            "/2.0/repositories/workspace/repo/commit/missing",
+        ]
+
+    def test_server(self, mock_bitbucket):
+        resolved = resolve_revisions(
+            "https://bitbucket.example.com/scm/PROJ/repo.git",
+            ["main", "HEAD", "missing"],
+        )
+
+        assert resolved == {"main": SHA, "HEAD": SHA}
+        assert [dict(request.url.params) for request in mock_bitbucket] == [
+            {"limit": "1", "until": "main"},
+            {"limit": "1"},
+            {"limit": "1", "until": "missing"},
+        ]
+
+
+class TestExtractStream:
+    def test_extracts_sub_directory(self, tmp_path):
+        archive = make_archive({"flow.py": b"flow", "puppy/cat.txt": b"meow"})
+        extracted = extract_stream(
+            chunked(archive), str(tmp_path), sub_directory="puppy"
+        )
+
+        assert extracted == {"cat.txt"}
+        assert os.listdir(tmp_path) == ["cat.txt"]
+
+    def test_rejects_paths_escaping_destination(self, tmp_path):
+        archive = make_archive(
+            {"../evil.txt": b"evil", "/etc/evil": b"evil", "ok.txt": b"ok"},
+            symlinks={"escape": "../../etc", "inside": "ok.txt"},
+        )
+        extracted = extract_stream(chunked(archive), str(tmp_path / "dst"))
+
+        assert extracted == {"ok.txt", "inside"}
+        assert not (tmp_path / "evil.txt").exists()
+        assert os.readlink(tmp_path / "dst" / "inside") == "ok.txt"
+
+    def test_rejects_writes_through_chained_links(self, tmp_path):
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+            for name, target in [("a/up", "."), ("a/esc", "up/../..")]:
+                info = tarfile.TarInfo(name)
+                info.type = tarfile.SYMTYPE
+                info.linkname = target
+                tar.addfile(info)
+            for name in ["a/esc/outside.txt", "a/up/inside.txt"]:
+                info = tarfile.TarInfo(name)
+                info.size = 4
+                tar.addfile(info, io.BytesIO(b"evil"))
+        extracted = extract_stream(chunked(buffer.getvalue()), str(tmp_path / "dst"))
+
+        # The escaping link is not created, so its members land inside
+        assert extracted == {"a/up", "a/esc/outside.txt"}
+        assert not (tmp_path / "outside.txt").exists()
+        assert not os.path.islink(tmp_path / "dst" / "a" / "esc")
+        # Members below a link are never written through it
+        assert not (tmp_path / "dst" / "a" / "inside.txt").exists()
+
+
+class TestArchiveBackend:
+    async def test_get_directory_streams_archive(self, mock_bitbucket, tmp_path):
+        (tmp_path / "stale.txt").write_text("stale")
+        (tmp_path / PULL_MARKER_FILENAME).write_text("{}")
+        b = BitBucketRepository(
+            repository="https://bitbucket.org/workspace/repo.git",
+            reference="main",
+            backend="archive",
+            remove_stale_files=True,
+            bitbucket_credentials=BitBucketCredentials(token=SecretStr("XYZ")),
+        )
+        stats = await b.get_directory(local_path=str(tmp_path))
+
+        assert set(os.listdir(tmp_path)) == {
+            "flow.py",
+            "puppy",
+            "run.sh",
+            PULL_MARKER_FILENAME,
+        }
+        assert os.access(tmp_path / "run.sh", os.X_OK)
+        assert stats.files_deleted == 1
+        assert stats.bytes_transferred > 0
+        assert mock_bitbucket[-1].headers["Authorization"] == "Bearer XYZ"
+
+    async def test_from_path_is_extracted(self, mock_bitbucket, tmp_path):
+        b = BitBucketRepository(
+            repository="https://bitbucket.org/workspace/repo.git",
+            backend="archive",
+        )
+        await b.get_directory(local_path=str(tmp_path), from_path="puppy")
+
+        assert os.listdir(tmp_path) == ["puppy"]
+        assert (tmp_path / "puppy" / "cat.txt").read_text() == "meow\n"
+
+    async def test_http_errors_are_surfaced(self, mock_bitbucket, tmp_path):
+        b = BitBucketRepository(
+            repository="https://bitbucket.org/workspace/repo.git",
+            reference="missing",
+            backend="archive",
+        )
+        with pytest.raises(OSError, match="Failed to pull from remote:\n HTTP 404"):
+            await b.get_directory(local_path=str(tmp_path))
+
+    async def test_skip_unchanged_resolves_without_git(
+        self, mock_bitbucket, tmp_path, monkeypatch
+    ):
+        async def no_git(cmd, **kwargs):
+            raise AssertionError(f"unexpected git call: {cmd}")
+
+        monkeypatch.setattr(prefect_bitbucket.repository, "run_process", no_git)
+        b = BitBucketRepository(
+            repository="https://bitbucket.org/workspace/repo.git",
+            reference="main",
+            backend="archive",
+            skip_unchanged=True,
+        )
+        stats = await b.get_directory(local_path=str(tmp_path))
+
+        assert stats.sha == SHA
+        assert mock_bitbucket[-1].url.path == f"/workspace/repo/get/{SHA}.tar.gz"
+
+        stats = await b.get_directory(local_path=str(tmp_path))
+        assert stats.skipped
+        assert "/commit/" in mock_bitbucket[-1].url.path
+
+    def test_basic_auth_with_username(self):
+        b = BitBucketRepository(
+            repository="https://bitbucket.example.com/scm/PROJ/repo.git",
+            backend="archive",
+            bitbucket_credentials=BitBucketCredentials(
+                token=SecretStr("XYZ"), username="me"
+            ),
+        )
+        auth, headers = ArchiveBackend(b)._get_auth()
+        assert isinstance(auth, httpx.BasicAuth)
+        assert headers == {}
+
+    def test_invalid_backend(self):
+        with pytest.raises(ValueError, match="Backend must be one of"):
+            BitBucketRepository(repository="prefect", backend="carrier-pigeon")
+
+    async def test_server_from_path_is_requested_from_server(
+        self, mock_bitbucket, tmp_path
+    ):
+        b = BitBucketRepository(
+            repository="https://bitbucket.example.com/scm/PROJ/repo.git",
+            backend="archive",
+        )
+        await b.get_directory(local_path=str(tmp_path), from_path="./puppy/")
+
+        assert mock_bitbucket[-1].url.params["path"] == "puppy"
+        assert (tmp_path / "puppy" / "cat.txt").read_text() == "meow\n"
+
+    async def test_ignore_rules(self, monkeypatch, tmp_path):
+        files = {
+            "flow.py": b"print('hello')\n",
+            "docs/index.md": b"# docs\n",
+            "notebook.ipynb": b"{}\n",
+            "z/.prefectignore": b"",
+            ".prefectignore": b"docs/\n",
+        }
+        archive = make_archive(files, prefix="workspace-repo-0123456789ab/")
+        monkeypatch.setattr(
+            _archive.httpx,
+            "Client",
+            functools.partial(
+                httpx.Client,
+                transport=httpx.MockTransport(
+                    lambda request: httpx.Response(200, content=archive)
+                ),
+            ),
+        )
+        b = BitBucketRepository(
+            repository="https://bitbucket.org/workspace/repo.git",
+            reference="main",
+            backend="archive",
+            ignore_file=".prefectignore",
+            ignore_patterns=["*.ipynb", "z/"],
+        )
+        stats = await b.get_directory(local_path=str(tmp_path))
+
+        assert sorted(os.listdir(tmp_path)) == [".prefectignore", "flow.py"]
+        assert stats.files_written == 2
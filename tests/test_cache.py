@@ -0,0 +1,186 @@
+from contextlib import ExitStack
+
+import anyio
+import pytest
+
+from prefect_bitbucket._cache import (
+    ReferenceCache,
+    SingleFlight,
+    SnapshotCache,
+    async_file_lock,
+    file_lock,
+)
+
+
+async def test_single_flight_shares_one_call():
+    calls = 0
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        await anyio.sleep(0.05)
+        return calls
+
+    single_flight = SingleFlight()
+    results = []
+
+    async def caller():
+        results.append(await single_flight.do("key", work))
+
+    async with anyio.create_task_group() as tg:
+        for _ in range(5):
+            tg.start_soon(caller)
+
+    assert calls == 1
+    assert results == [1] * 5
+
+    # Once finished, the next call does the work again
+    assert await single_flight.do("key", work) == 2
+
+
+async def test_single_flight_shares_exceptions():
+    async def work():
+        await anyio.sleep(0.05)
+        raise OSError("Failed to pull from remote")
+
+    single_flight = SingleFlight()
+    errors = []
+
+    async def caller():
+        try:
+            await single_flight.do("key", work)
+        except OSError as exc:
+            errors.append(exc)
+
+    async with anyio.create_task_group() as tg:
+        for _ in range(3):
+            tg.start_soon(caller)
+
+    assert len(errors) == 3
+    assert len({id(error) for error in errors}) == 1
+
+
+async def test_async_file_lock_excludes_other_holders(tmp_path):
+    holders = 0
+    max_holders = 0
+
+    async def hold():
+        nonlocal holders, max_holders
+        async with async_file_lock(tmp_path / "lock", poll_interval=0.01):
+            holders += 1
+            max_holders = max(max_holders, holders)
+            await anyio.sleep(0.02)
+            holders -= 1
+
+    async with anyio.create_task_group() as tg:
+        for _ in range(4):
+            tg.start_soon(hold)
+
+    assert max_holders == 1
+
+
+async def test_async_file_lock_waits_for_file_lock(tmp_path):
+    with file_lock(tmp_path / "lock", shared=True):
+        with pytest.raises(TimeoutError):
+            with anyio.fail_after(0.2):
+                async with async_file_lock(tmp_path / "lock", poll_interval=0.01):
+                    pass
+
+    with anyio.fail_after(1):
+        async with async_file_lock(tmp_path / "lock"):
+            pass
+
+
+async def test_snapshot_reads_wait_for_eviction_without_blocking(tmp_path):
+    source = tmp_path / "source"
+    source.mkdir()
+    (source / "flow.py").write_text("print('hello')")
+    cache = SnapshotCache(tmp_path / "snapshots", max_size=1024)
+    cache.put("a" * 40, None, source)
+
+    ticks = 0
+    trees = []
+
+    async def tick():
+        nonlocal ticks
+        while not trees:
+            ticks += 1
+            await anyio.sleep(0.01)
+
+    async def read():
+        async with cache.open_async("a" * 40, None) as tree:
+            trees.append(tree)
+
+    # Another process evicting holds the lock exclusively for a while
+    eviction = ExitStack()
+    eviction.enter_context(file_lock(cache.root / ".lock"))
+
+    async def evict():
+        await anyio.sleep(0.2)
+        assert not trees
+        eviction.close()
+
+    with anyio.fail_after(5):
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(tick)
+            tg.start_soon(read)
+            tg.start_soon(evict)
+
+    assert ticks > 5
+    assert trees == [cache.root / ("a" * 40) / "tree"]
+
+
+class TestReferenceCache:
+    def test_entries_expire(self):
+        now = [1000.0]
+        cache = ReferenceCache(clock=lambda: now[0])
+        cache.put("repo", "main", "a" * 40)
+
+        assert cache.get("repo", "main", max_age=60) == "a" * 40
+        assert cache.get("repo", "other", max_age=60) is None
+        now[0] += 30
+        assert cache.get("repo", "main", max_age=60) == "a" * 40
+        assert cache.get("repo", "main", max_age=10) is None
+        now[0] += 30
+        assert cache.get("repo", "main", max_age=60) is None
+
+    def test_entries_are_shared_through_root(self, tmp_path):
+        now = [1000.0]
+        ReferenceCache(clock=lambda: now[0]).put(
+            "repo", "main", "a" * 40, root=tmp_path
+        )
+
+        other_process = ReferenceCache(clock=lambda: now[0])
+        assert other_process.get("repo", "main", max_age=60) is None
+        assert other_process.get("repo", "main", max_age=60, root=tmp_path) == "a" * 40
+        now[0] += 60
+        assert other_process.get("repo", "main", max_age=60, root=tmp_path) is None
+
+    def test_newer_entries_from_root_win(self, tmp_path):
+        now = [1000.0]
+        cache = ReferenceCache(clock=lambda: now[0])
+        cache.put("repo", "main", "a" * 40)
+        now[0] += 10
+        ReferenceCache(clock=lambda: now[0]).put(
+            "repo", "main", "b" * 40, root=tmp_path
+        )
+        now[0] += 5
+
+        assert cache.get("repo", "main", max_age=12, root=tmp_path) == "b" * 40
+        assert cache.get("repo", "main", max_age=12) == "b" * 40
+
+    def test_unreadable_entries_are_misses(self, tmp_path):
+        cache = ReferenceCache()
+        cache.put("repo", "main", "a" * 40, root=tmp_path)
+        for path in tmp_path.iterdir():
+            path.write_text("{")
+
+        assert ReferenceCache().get("repo", "main", 60, root=tmp_path) is None
+
+    def test_failing_to_store_entries_is_no_error(self, tmp_path):
+        root = tmp_path / "file"
+        root.write_text("")
+        cache = ReferenceCache()
+        cache.put("repo", "main", "a" * 40, root=root)
+
+        assert cache.get("repo", "main", max_age=60, root=root) == "a" * 40
@@ -0,0 +1,78 @@
+import sys
+import tracemalloc
+
+import pytest
+
+from prefect_bitbucket._capture import TailBuffer
+from prefect_bitbucket.repository import BitBucketRepository
+
+
+class TestTailBuffer:
+    def test_keeps_everything_below_the_limit(self):
+        buffer = TailBuffer(max_chars=10)
+        buffer.write("abc")
+        buffer.write("def")
+
+        assert buffer.getvalue() == "abcdef"
+        assert not buffer.truncated
+
+    def test_keeps_only_the_tail(self):
+        buffer = TailBuffer(max_chars=10)
+        for chunk in ["0123", "4567", "89ab", "cdef"]:
+            buffer.write(chunk)
+
+        assert buffer.getvalue().endswith("\n6789abcdef")
+        assert buffer.getvalue().startswith("[... earlier output truncated ...]")
+
+    def test_single_large_write(self):
+        buffer = TailBuffer(max_chars=4)
+        buffer.write("x" * 100 + "tail")
+
+        assert buffer.getvalue().endswith("\ntail")
+
+    def test_invalid_size(self):
+        with pytest.raises(ValueError, match="max_chars"):
+            TailBuffer(max_chars=0)
+
+
+@pytest.mark.parametrize("progress_label", [None, "repo"])
+async def test_stderr_is_captured(progress_label):
+    command = [
+        sys.executable,
+        "-c",
+        "import sys\n"
+        "sys.stderr.write('Receiving objects:  50% (5/10)\\r')\n"
+        "sys.stderr.write('fatal: the actual error\\n')\n"
+        "sys.exit(1)\n",
+    ]
+    with pytest.raises(OSError, match="fatal: the actual error"):
+        await BitBucketRepository._run_git(command, progress_label=progress_label)
+
+
+async def test_memory_stays_flat_with_lots_of_output():
+    """
+    A command writing 32 MiB to stderr and stdout must not be buffered in full.
+    """
+    chatty_command = [
+        sys.executable,
+        "-c",
+        "import sys\n"
+        "line = 'x' * 1023 + '\\n'\n"
+        "for _ in range(16 * 1024):\n"
+        "    sys.stdout.write(line)\n"
+        "    sys.stderr.write(line)\n"
+        "sys.stderr.write('fatal: the actual error\\n')\n"
+        "sys.exit(1)\n",
+    ]
+    tracemalloc.start()
+    try:
+        with pytest.raises(OSError) as exc_info:
+            await BitBucketRepository._run_git(chatty_command)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert peak < 4 * 2**20
+    message = str(exc_info.value)
+    assert message.rstrip().endswith("fatal: the actual error")
+    assert len(message) < 128 * 1024
@@ -1,3 +1,6 @@
+import subprocess
+import sys
+
 import pytest
 from atlassian.bitbucket import Bitbucket, Cloud
 from prefect.blocks.core import Block
@@ -50,3 +53,15 @@ def test_bitbucket_get_client(client_type):
         assert isinstance(client, Bitbucket)
     else:
         assert isinstance(client, Cloud)
+
+
+def test_importing_package_does_not_import_atlassian():
+    """Ensure the API client is only imported when a client is requested."""
+    code = (
+        "import sys, prefect_bitbucket; "
+        "print(sorted({'atlassian', 'requests', 'oauthlib'} & set(sys.modules)))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], check=True, capture_output=True, text=True
+    ).stdout
+    assert output.strip() == "[]"
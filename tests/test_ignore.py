@@ -0,0 +1,69 @@
+import pytest
+
+from prefect_bitbucket._ignore import (
+    compile_ignore_patterns,
+    read_ignore_file,
+    to_sparse_patterns,
+)
+
+
+def test_no_patterns_ignore_nothing():
+    assert compile_ignore_patterns([]) is None
+    assert compile_ignore_patterns(["", "# just a comment"]) is None
+
+
+@pytest.mark.parametrize(
+    "rel_path, is_dir, expected",
+    [
+        ("docs", True, True),
+        ("docs/index.md", False, True),
+        ("flows/docs", True, True),
+        ("analysis.ipynb", False, True),
+        ("flows/analysis.ipynb", False, True),
+        ("flows/keep.ipynb", False, False),
+        ("fixtures", True, True),
+        ("flows/fixtures", True, False),
+        ("flows/flow.py", False, False),
+    ],
+)
+def test_gitignore_semantics(rel_path, is_dir, expected):
+    is_ignored = compile_ignore_patterns(
+        ["docs/", "*.ipynb", "!flows/keep.ipynb", "/fixtures"]
+    )
+    assert is_ignored(rel_path, is_dir) is expected
+
+
+def test_read_ignore_file(tmp_path):
+    (tmp_path / ".prefectignore").write_text("# comment\n*.ipynb\n\ndocs/\n")
+
+    assert read_ignore_file(str(tmp_path / ".prefectignore")) == [
+        "# comment",
+        "*.ipynb",
+        "",
+        "docs/",
+    ]
+    assert read_ignore_file(str(tmp_path / "missing")) == []
+
+
+@pytest.mark.parametrize(
+    "base, expected",
+    [
+        (
+            None,
+            ["/*", "!/**/docs/", "!/**/*.ipynb", "/flows/keep.ipynb", "!/fixtures"],
+        ),
+        (
+            "flows",
+            [
+                "/flows/",
+                "!/flows/**/docs/",
+                "!/flows/**/*.ipynb",
+                "/flows/flows/keep.ipynb",
+                "!/flows/fixtures",
+            ],
+        ),
+    ],
+)
+def test_to_sparse_patterns(base, expected):
+    patterns = ["docs/", "*.ipynb", "# comment", "!flows/keep.ipynb", "/fixtures"]
+    assert to_sparse_patterns(patterns, base) == expected
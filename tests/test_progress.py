@@ -0,0 +1,84 @@
+import logging
+
+import pytest
+
+import prefect_bitbucket
+from prefect_bitbucket._progress import GitProgress, ProgressStream, parse_progress
+from prefect_bitbucket.repository import BitBucketRepository
+
+
+@pytest.mark.parametrize(
+    "line, expected",
+    [
+        (
+            "Receiving objects:  45% (450/1000), 1.50 MiB | 512.00 KiB/s",
+            GitProgress("Receiving objects", 45, 450, 1000, 3 * 2**19, 2**19),
+        ),
+        (
+            "remote: Counting objects: 100% (12/12), done.",
+            GitProgress("Counting objects", 100, 12, 12),
+        ),
+        (
+            "Resolving deltas:   0% (0/3)",
+            GitProgress("Resolving deltas", 0, 0, 3),
+        ),
+        ("Cloning into 'prefect'...", None),
+        ("fatal: repository not found", None),
+    ],
+)
+def test_parse_progress(line, expected):
+    assert parse_progress(line) == expected
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_progress_is_throttled():
+    clock = FakeClock()
+    reports = []
+    stream = ProgressStream(
+        lambda progress, elapsed: reports.append((progress.percent, elapsed)),
+        interval=5,
+        clock=clock,
+    )
+    for percent in range(0, 101, 10):
+        clock.now = percent / 10 * 2
+        stream.write(f"Receiving objects: {percent}% ({percent}/100)\r")
+
+    assert reports == [(30, 6.0), (60, 12.0), (90, 18.0)]
+
+
+def test_rate_is_computed_when_missing():
+    clock = FakeClock()
+    reports = []
+    stream = ProgressStream(
+        lambda progress, elapsed: reports.append(progress), interval=0, clock=clock
+    )
+    clock.now = 2
+    stream.write("Receiving objects:  50% (5/10), 4.00 MiB\r")
+
+    assert reports[0].rate == 2 * 2**20
+
+
+def test_other_output_is_kept():
+    stream = ProgressStream(lambda progress, elapsed: None)
+    stream.write("Cloning into 'x'...\nReceiving objects:  50% (5/10)\rReceiv")
+    stream.write("ing objects: 100% (10/10), done.\nfatal: oh no")
+
+    assert stream.getvalue() == "Cloning into 'x'...\nfatal: oh no"
+
+
+async def test_clone_progress_is_logged(git_remote, tmp_path, monkeypatch, caplog):
+    monkeypatch.setattr(prefect_bitbucket.repository, "PROGRESS_LOG_INTERVAL", 0)
+    b = BitBucketRepository(repository=git_remote.url)
+    with caplog.at_level(logging.INFO, logger="prefect_bitbucket"):
+        await b.get_directory(local_path=str(tmp_path / "dst"))
+
+    progress = [r.git_progress for r in caplog.records if hasattr(r, "git_progress")]
+    assert progress
+    assert {"phase", "percent", "done", "total", "elapsed"} <= set(progress[0])
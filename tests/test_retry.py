@@ -0,0 +1,148 @@
+import httpx
+import pytest
+from prefect.testing.utilities import AsyncMock
+
+import prefect_bitbucket
+from prefect_bitbucket._retry import (
+    MAX_RETRY_DELAY,
+    get_retry_delay,
+    is_transient_error,
+)
+from prefect_bitbucket.repository import BitBucketRepository
+
+
+def _pull_error(message: str) -> OSError:
+    return OSError(f"Failed to pull from remote:\n {message}")
+
+
+def _http_error(status_code: int) -> OSError:
+    request = httpx.Request("GET", "https://bitbucket.org/org/repo/get/main.tar.gz")
+    response = httpx.Response(status_code, request=request)
+    try:
+        raise OSError("Failed to pull from remote") from httpx.HTTPStatusError(
+            "error", request=request, response=response
+        )
+    except OSError as exc:
+        return exc
+
+
+@pytest.mark.parametrize(
+    "exc",
+    [
+        _pull_error("fatal: unable to access '...': Could not resolve host: x"),
+        _pull_error("error: RPC failed; curl 56 Recv failure: Connection reset"),
+        _pull_error("fatal: early EOF\nfatal: index-pack failed"),
+        _pull_error("fatal: the requested URL returned error: 503"),
+        _pull_error("Failed to connect to bitbucket.org port 443: Timed out"),
+        _http_error(502),
+        _http_error(429),
+        ConnectionResetError("Connection reset by peer"),
+    ],
+)
+def test_transient_errors(exc):
+    assert is_transient_error(exc)
+
+
+@pytest.mark.parametrize(
+    "exc",
+    [
+        _pull_error("fatal: Authentication failed for 'https://bitbucket.org/x'"),
+        _pull_error("fatal: Remote branch nope not found in upstream origin"),
+        _pull_error(
+            "remote: Repository not found.\n"
+            "fatal: the remote end hung up unexpectedly"
+        ),
+        _pull_error("fatal: the requested URL returned error: 403"),
+        _pull_error("something else entirely"),
+        _http_error(404),
+    ],
+)
+def test_permanent_errors(exc):
+    assert not is_transient_error(exc)
+
+
+def test_retry_delay_backs_off_with_jitter():
+    assert get_retry_delay(0, 1.0, lambda: 0.5) == 1.0
+    assert get_retry_delay(3, 1.0, lambda: 0.5) == 8.0
+    assert get_retry_delay(2, 1.0, lambda: 0.0) == 2.0
+    assert get_retry_delay(2, 1.0, lambda: 0.99) == pytest.approx(5.96)
+    assert get_retry_delay(20, 1.0, lambda: 0.5) == MAX_RETRY_DELAY
+    assert get_retry_delay(20, 1.0, lambda: 0.99) == MAX_RETRY_DELAY
+    assert get_retry_delay(20, 1.0, lambda: 0.0) == MAX_RETRY_DELAY / 2
+    assert get_retry_delay(5, 1.0, lambda: 0.99) == pytest.approx(47.68)
+
+
+class TestRetries:
+    @pytest.fixture
+    def delays(self, monkeypatch):
+        """Record the delays between attempts, without waiting for them."""
+        delays = []
+
+        def recording_get_retry_delay(*args, **kwargs):
+            delays.append(get_retry_delay(*args, **kwargs))
+            return 0
+
+        monkeypatch.setattr(
+            prefect_bitbucket.repository, "get_retry_delay", recording_get_retry_delay
+        )
+        return delays
+
+    @staticmethod
+    def failing_run_process(monkeypatch, *messages):
+        """Fail with each of `messages` in turn, then succeed."""
+        messages = list(messages)
+
+        class Process:
+            def __init__(self, returncode):
+                self.returncode = returncode
+
+        async def run_process(cmd, stream_output, **kwargs):
+            if messages:
+                stream_output[1].write(messages.pop(0))
+                return Process(1)
+            return Process(0)
+
+        mock = AsyncMock(side_effect=run_process)
+        monkeypatch.setattr(prefect_bitbucket.repository, "run_process", mock)
+        return mock
+
+    async def test_transient_failures_are_retried(self, monkeypatch, delays):
+        mock = self.failing_run_process(
+            monkeypatch,
+            "fatal: unable to access: Could not resolve host: bitbucket.org",
+            "error: RPC failed; curl 18 transfer closed with outstanding read data",
+        )
+        b = BitBucketRepository(repository="prefect", retries=3)
+        stats = await b.get_directory()
+
+        assert mock.await_count == 3
+        assert stats.attempts == 3
+        assert len(delays) == 2
+        first_delay, second_delay = delays
+        assert 0.5 <= first_delay < 1.5
+        assert 1.0 <= second_delay < 3.0
+
+    async def test_permanent_failures_are_not_retried(self, monkeypatch, delays):
+        mock = self.failing_run_process(
+            monkeypatch, "fatal: Authentication failed for 'https://bitbucket.org'"
+        )
+        b = BitBucketRepository(repository="prefect", retries=3)
+        with pytest.raises(OSError, match="Authentication failed"):
+            await b.get_directory()
+
+        assert mock.await_count == 1
+        assert delays == []
+
+    async def test_gives_up_after_retries(self, monkeypatch, delays):
+        mock = self.failing_run_process(
+            monkeypatch, *["fatal: early EOF"] * 3, "never reached"
+        )
+        b = BitBucketRepository(repository="prefect", retries=2)
+        with pytest.raises(OSError, match="early EOF"):
+            await b.get_directory()
+
+        assert mock.await_count == 3
+
+    def test_retries_must_not_be_negative(self):
+        with pytest.raises(ValueError):
+            BitBucketRepository(repository="prefect", retries=-1)
@@ -0,0 +1,326 @@
+import json
+import os
+import subprocess
+import threading
+from contextlib import contextmanager
+from wsgiref.simple_server import WSGIRequestHandler, make_server
+
+import pytest
+
+pytest.importorskip("dulwich")
+
+from dulwich.objects import Blob, Commit, Tree  # noqa: E402
+from dulwich.repo import Repo  # noqa: E402
+from dulwich.server import DictBackend  # noqa: E402
+from dulwich.web import make_wsgi_chain  # noqa: E402
+
+import prefect_bitbucket.repository  # noqa: E402
+from prefect_bitbucket import _smart_http  # noqa: E402
+from prefect_bitbucket.repository import (  # noqa: E402
+    PULL_MARKER_FILENAME,
+    BitBucketRepository,
+)
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+@contextmanager
+def serve(repo_path, authorizations):
+    """
+    Serves the repository at `repo_path` over git's smart HTTP protocol, recording
+    the `Authorization` header of every request, and yields its URL.
+    """
+    git_app = make_wsgi_chain(DictBackend({"/repo.git": Repo(str(repo_path))}))
+
+    def app(environ, start_response):
+        authorizations.append(environ.get("HTTP_AUTHORIZATION"))
+        return git_app(environ, start_response)
+
+    server = make_server("127.0.0.1", 0, app, handler_class=QuietHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}/repo.git"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def http_remote(git_remote):
+    """
+    Serves `git_remote` over git's smart HTTP protocol.
+    """
+    git_remote.authorizations = []
+    with serve(git_remote.path, git_remote.authorizations) as url:
+        git_remote.http_url = url
+        yield git_remote
+
+
+def _git_output(cwd, *args):
+    return subprocess.run(
+        ["git", *args], cwd=cwd, check=True, capture_output=True, text=True
+    ).stdout.strip()
+
+
+def _commit_tree(repo_path, branch, entries):
+    """
+    Commits a tree holding `entries`, given as a name mapping to either the
+    target of a symbolic link or a mapping of file names to contents, to `branch`
+    without any of git's checks on the names.
+    """
+    repo = Repo(str(repo_path))
+
+    def add_tree(entries):
+        tree = Tree()
+        for name, value in entries.items():
+            if isinstance(value, dict):
+                sub_tree = Tree()
+                for file_name, contents in value.items():
+                    blob = Blob.from_string(contents.encode())
+                    repo.object_store.add_object(blob)
+                    sub_tree.add(file_name.encode(), 0o100644, blob.id)
+                repo.object_store.add_object(sub_tree)
+                tree.add(name.encode(), 0o040000, sub_tree.id)
+            else:
+                link = Blob.from_string(value.encode())
+                repo.object_store.add_object(link)
+                tree.add(name.encode(), 0o120000, link.id)
+        repo.object_store.add_object(tree)
+        return tree.id
+
+    commit = Commit()
+    commit.tree = add_tree(entries)
+    commit.author = commit.committer = b"test <test@example.com>"
+    commit.author_time = commit.commit_time = 0
+    commit.author_timezone = commit.commit_timezone = 0
+    commit.message = b"crafted"
+    repo.object_store.add_object(commit)
+    repo.refs[b"refs/heads/" + branch.encode()] = commit.id
+
+
+class TestResolveReferences:
+    def test_resolves_branches_and_tags(self, http_remote):
+        head = _git_output(http_remote.path, "rev-parse", "HEAD")
+        _git_output(http_remote.path, "tag", "-a", "v1", "-m", "release")
+        _git_output(http_remote.path, "tag", "light")
+        branch = _git_output(http_remote.path, "rev-parse", "--abbrev-ref", "HEAD")
+
+        resolved = _smart_http.resolve_references(
+            http_remote.http_url, [branch, "v1", "light", "HEAD", "nope"]
+        )
+
+        assert resolved == {branch: head, "v1": head, "light": head, "HEAD": head}
+
+
+class TestDulwichBackend:
+    async def test_get_directory(self, http_remote, tmp_path):
+        (http_remote.path / "run.sh").write_text("#!/bin/sh\n")
+        (http_remote.path / "run.sh").chmod(0o755)
+        os.symlink("flow.py", http_remote.path / "link.py")
+        sha = http_remote.commit({}, "add script and link")
+        dst = tmp_path / "dst"
+
+        b = BitBucketRepository(
+            repository=http_remote.http_url, backend="dulwich", skip_unchanged=True
+        )
+        await b.get_directory(local_path=str(dst))
+
+        assert (dst / "flow.py").read_text() == "print('hello')\n"
+        assert (dst / "puppy" / "cat.txt").read_text() == "meow\n"
+        assert os.access(dst / "run.sh", os.X_OK)
+        assert os.readlink(dst / "link.py") == "flow.py"
+        assert not (dst / ".git").exists()
+        marker = json.loads((dst / PULL_MARKER_FILENAME).read_text())
+        assert marker["sha"] == sha
+
+    async def test_unchanged_files_are_not_rewritten(self, http_remote, tmp_path):
+        dst = tmp_path / "dst"
+        b = BitBucketRepository(
+            repository=http_remote.http_url, backend="dulwich", remove_stale_files=True
+        )
+        await b.get_directory(local_path=str(dst))
+        inode = (dst / "flow.py").stat().st_ino
+
+        http_remote.commit({"puppy/dog.txt": "woof\n"})
+        subprocess.run(["git", "rm", "-q", "puppy/cat.txt"], cwd=http_remote.path)
+        http_remote.commit({}, "remove cat")
+        stats = await b.get_directory(local_path=str(dst))
+
+        assert (stats.files_written, stats.files_unchanged) == (1, 1)
+        assert stats.files_deleted == 1
+        assert (dst / "flow.py").stat().st_ino == inode
+        assert (dst / "puppy" / "dog.txt").read_text() == "woof\n"
+        assert not (dst / "puppy" / "cat.txt").exists()
+
+    async def test_from_path(self, http_remote, tmp_path):
+        dst = tmp_path / "dst"
+        b = BitBucketRepository(repository=http_remote.http_url, backend="dulwich")
+        await b.get_directory(from_path="puppy", local_path=str(dst))
+
+        assert sorted(os.listdir(dst)) == ["puppy"]
+        assert os.listdir(dst / "puppy") == ["cat.txt"]
+
+    async def test_ignore_rules(self, http_remote, tmp_path):
+        http_remote.commit(
+            {
+                "puppy/.prefectignore": "*.ipynb\n",
+                "puppy/analysis.ipynb": "{}\n",
+                "puppy/docs/index.md": "# docs\n",
+            }
+        )
+        dst = tmp_path / "dst"
+        b = BitBucketRepository(
+            repository=http_remote.http_url,
+            backend="dulwich",
+            ignore_file=".prefectignore",
+            ignore_patterns=["docs/"],
+        )
+        await b.get_directory(from_path="puppy", local_path=str(dst))
+
+        assert sorted(os.listdir(dst / "puppy")) == [".prefectignore", "cat.txt"]
+
+    async def test_annotated_tag(self, http_remote, tmp_path):
+        tagged = _git_output(http_remote.path, "rev-parse", "HEAD")
+        _git_output(http_remote.path, "tag", "-a", "v1", "-m", "release")
+        http_remote.commit({"flow.py": "print('goodbye')\n"})
+        dst = tmp_path / "dst"
+
+        b = BitBucketRepository(
+            repository=http_remote.http_url,
+            reference="v1",
+            backend="dulwich",
+            skip_unchanged=True,
+        )
+        await b.get_directory(local_path=str(dst))
+
+        assert (dst / "flow.py").read_text() == "print('hello')\n"
+        marker = json.loads((dst / PULL_MARKER_FILENAME).read_text())
+        assert marker["sha"] == tagged
+
+    async def test_skip_unchanged_resolves_without_git(
+        self, http_remote, tmp_path, monkeypatch
+    ):
+        async def no_git(cmd, **kwargs):
+            raise AssertionError(f"unexpected git call: {cmd}")
+
+        monkeypatch.setattr(prefect_bitbucket.repository, "run_process", no_git)
+        dst = tmp_path / "dst"
+        b = BitBucketRepository(
+            repository=http_remote.http_url,
+            backend="dulwich",
+            skip_unchanged=True,
+            reference_cache_ttl=60,
+        )
+        await b.get_directory(local_path=str(dst))
+        stats = await b.get_directory(local_path=str(dst))
+
+        assert stats.skipped
+
+    async def test_pinned_commit_in_upper_case(self, http_remote, tmp_path):
+        pinned = _git_output(http_remote.path, "rev-parse", "HEAD")
+        dst = tmp_path / "dst"
+
+        b = BitBucketRepository(
+            repository=http_remote.http_url,
+            reference=pinned.upper(),
+            backend="dulwich",
+            skip_unchanged=True,
+        )
+        await b.get_directory(local_path=str(dst))
+
+        assert (dst / "flow.py").read_text() == "print('hello')\n"
+        marker = json.loads((dst / PULL_MARKER_FILENAME).read_text())
+        assert marker["sha"] == pinned
+
+    async def test_missing_reference(self, http_remote, tmp_path):
+        b = BitBucketRepository(
+            repository=http_remote.http_url, reference="nope", backend="dulwich"
+        )
+        with pytest.raises(OSError, match="reference 'nope' not found"):
+            await b.get_directory(local_path=str(tmp_path / "dst"))
+
+    async def test_missing_repository(self, http_remote, tmp_path):
+        b = BitBucketRepository(
+            repository=http_remote.http_url.replace("repo", "other"),
+            backend="dulwich",
+        )
+        with pytest.raises(OSError, match="Failed to pull from remote"):
+            await b.get_directory(local_path=str(tmp_path / "dst"))
+
+    def test_connection_pool_is_shared(self):
+        url = "https://bitbucket.org/org/repo.git"
+        other_url = "https://bitbucket.org/org/other.git"
+        assert _smart_http._get_pool_manager(url) is _smart_http._get_pool_manager(
+            other_url
+        )
+        assert _smart_http._get_pool_manager(
+            url, "user", "secret"
+        ) is not _smart_http._get_pool_manager(url)
+        assert _smart_http._get_pool_manager(
+            "https://example.com/org/repo.git"
+        ) is not _smart_http._get_pool_manager(url)
+
+    def test_credentials_are_not_sent_to_other_servers(self, http_remote, tmp_path):
+        _smart_http.fetch_snapshot(
+            http_remote.http_url,
+            None,
+            str(tmp_path / "first"),
+            username="user",
+            password="secret",
+        )
+
+        authorizations = []
+        with serve(http_remote.path, authorizations) as url:
+            _smart_http.fetch_snapshot(url, None, str(tmp_path / "second"))
+
+        assert (tmp_path / "second" / "flow.py").read_text() == "print('hello')\n"
+        assert authorizations
+        assert authorizations == [None] * len(authorizations)
+
+    def test_rejects_paths_outside_destination(self, http_remote, tmp_path):
+        _commit_tree(
+            http_remote.path,
+            "evil",
+            {"..": {"outside.txt": "evil"}, "ok": {"inside.txt": "fine"}},
+        )
+        dst = tmp_path / "dst" / "nested"
+
+        _, report = _smart_http.fetch_snapshot(http_remote.http_url, "evil", str(dst))
+
+        assert report.created == ["ok/inside.txt"]
+        assert not (tmp_path / "dst" / "outside.txt").exists()
+
+    def test_rejects_links_pointing_through_other_links(self, http_remote, tmp_path):
+        _commit_tree(
+            http_remote.path,
+            "evil",
+            {"esc": "up/..", "up": ".", "ok": {"inside.txt": "fine"}},
+        )
+        dst = tmp_path / "dst"
+
+        _, report = _smart_http.fetch_snapshot(http_remote.http_url, "evil", str(dst))
+
+        assert sorted(report.created) == ["ok/inside.txt", "up"]
+        assert not os.path.lexists(dst / "esc")
+        assert os.readlink(dst / "up") == "."
+
+    def test_rejects_links_outside_destination(self, http_remote, tmp_path):
+        _commit_tree(
+            http_remote.path,
+            "evil",
+            {"parent": "..", "absolute": "/etc", "ok": {"inside.txt": "fine"}},
+        )
+        dst = tmp_path / "dst"
+
+        _, report = _smart_http.fetch_snapshot(http_remote.http_url, "evil", str(dst))
+
+        assert report.created == ["ok/inside.txt"]
+        assert sorted(os.listdir(dst)) == ["ok"]
+
+    def test_requires_http_url(self, tmp_path):
+        with pytest.raises(ValueError, match="HTTP"):
+            _smart_http.fetch_snapshot("file:///repo", None, str(tmp_path))
@@ -0,0 +1,210 @@
+import errno
+import os
+import shutil
+
+import pytest
+
+from prefect_bitbucket import _sync
+from prefect_bitbucket._sync import sync_tree
+
+
+@pytest.fixture
+def src(tmp_path):
+    src = tmp_path / "src"
+    (src / "puppy").mkdir(parents=True)
+    (src / "dog.txt").write_text("woof")
+    (src / "puppy" / "cat.txt").write_text("meow")
+    return src
+
+
+def test_sync_into_empty_destination(src, tmp_path):
+    dst = tmp_path / "dst"
+    report = sync_tree(str(src), str(dst))
+
+    assert sorted(report.created) == ["dog.txt", "puppy/cat.txt"]
+    assert report.bytes_written == 8
+    assert (dst / "puppy" / "cat.txt").read_text() == "meow"
+
+
+def test_only_changed_files_are_written(src, tmp_path):
+    dst = tmp_path / "dst"
+    sync_tree(str(src), str(dst))
+    dog_inode = os.stat(dst / "dog.txt").st_ino
+
+    # Same contents with a fresh modification time, as after a new clone
+    os.utime(src / "dog.txt", (0, 0))
+    (src / "puppy" / "cat.txt").write_text("purr")
+    report = sync_tree(str(src), str(dst))
+
+    assert report.unchanged == ["dog.txt"]
+    assert report.updated == ["puppy/cat.txt"]
+    assert os.stat(dst / "dog.txt").st_ino == dog_inode
+    assert (dst / "puppy" / "cat.txt").read_text() == "purr"
+
+
+@pytest.mark.parametrize("delete", [True, False])
+def test_delete_stale_files(src, tmp_path, delete):
+    dst = tmp_path / "dst"
+    (dst / "old").mkdir(parents=True)
+    (dst / "old" / "stale.txt").write_text("stale")
+    (dst / "marker").write_text("keep me")
+
+    report = sync_tree(str(src), str(dst), delete=delete, keep=["marker"])
+
+    assert (dst / "old").exists() is not delete
+    assert report.deleted == (["old"] if delete else [])
+    assert (dst / "marker").exists()
+
+
+def test_type_changes_are_replaced(src, tmp_path):
+    dst = tmp_path / "dst"
+    dst.mkdir()
+    (dst / "dog.txt").mkdir()
+    (dst / "puppy").write_text("not a directory")
+
+    report = sync_tree(str(src), str(dst))
+
+    assert report.updated == ["dog.txt"]
+    assert (dst / "dog.txt").read_text() == "woof"
+    assert (dst / "puppy" / "cat.txt").read_text() == "meow"
+
+
+def test_symlinks_are_preserved(src, tmp_path):
+    os.symlink("puppy/cat.txt", src / "link.txt")
+    os.symlink("puppy", src / "link_dir")
+    dst = tmp_path / "dst"
+
+    sync_tree(str(src), str(dst))
+    report = sync_tree(str(src), str(dst))
+
+    assert os.readlink(dst / "link.txt") == "puppy/cat.txt"
+    assert os.readlink(dst / "link_dir") == "puppy"
+    assert report.created == report.updated == []
+
+
+@pytest.mark.parametrize("strategy", ["hardlink", "auto"])
+def test_hardlinks_on_same_file_system(src, tmp_path, strategy):
+    dst = tmp_path / "dst"
+    report = sync_tree(str(src), str(dst), strategy=strategy)
+
+    assert sorted(report.created) == ["dog.txt", "puppy/cat.txt"]
+    # auto only falls back to hard links when reflinks are not supported
+    if strategy == "hardlink" or os.stat(dst / "dog.txt").st_nlink > 1:
+        assert os.stat(dst / "dog.txt").st_ino == os.stat(src / "dog.txt").st_ino
+
+    report = sync_tree(str(src), str(dst), strategy=strategy)
+    assert report.created == report.updated == []
+
+
+@pytest.mark.parametrize("strategy", ["copy", "reflink"])
+def test_strategies_without_shared_inodes(src, tmp_path, strategy):
+    dst = tmp_path / "dst"
+    sync_tree(str(src), str(dst), strategy=strategy)
+
+    assert os.stat(dst / "dog.txt").st_ino != os.stat(src / "dog.txt").st_ino
+    assert (dst / "dog.txt").read_text() == "woof"
+
+
+@pytest.mark.parametrize("strategy", ["copy", "reflink"])
+def test_hard_links_to_source_are_replaced(src, tmp_path, strategy):
+    dst = tmp_path / "dst"
+    sync_tree(str(src), str(dst), strategy="hardlink")
+
+    report = sync_tree(str(src), str(dst), strategy=strategy)
+    assert sorted(report.updated) == ["dog.txt", "puppy/cat.txt"]
+    assert os.stat(dst / "dog.txt").st_ino != os.stat(src / "dog.txt").st_ino
+    assert (dst / "dog.txt").read_text() == "woof"
+
+
+def test_links_fall_back_to_copies_across_devices(src, tmp_path, monkeypatch):
+    calls = []
+
+    def cross_device_link(src, dst):
+        calls.append(src)
+        raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+    monkeypatch.setattr(os, "link", cross_device_link)
+    dst = tmp_path / "dst"
+    report = sync_tree(str(src), str(dst), strategy="hardlink")
+
+    assert sorted(report.created) == ["dog.txt", "puppy/cat.txt"]
+    assert (dst / "puppy" / "cat.txt").read_text() == "meow"
+    # Only the first file tries to link
+    assert len(calls) == 1
+
+
+def test_unknown_strategy(src, tmp_path):
+    with pytest.raises(ValueError, match="Unknown materialization strategy"):
+        sync_tree(str(src), str(tmp_path / "dst"), strategy="teleport")
+
+
+def test_parallel_sync_matches_sequential_sync(tmp_path):
+    src = tmp_path / "src"
+    for i in range(20):
+        (src / f"dir-{i}" / "nested").mkdir(parents=True)
+        for j in range(20):
+            (src / f"dir-{i}" / "nested" / f"file-{j}.txt").write_text(f"{i}/{j}")
+    stale = tmp_path / "parallel" / "dir-3" / "stale.txt"
+    stale.parent.mkdir(parents=True)
+    stale.write_text("stale")
+
+    sequential = sync_tree(str(src), str(tmp_path / "sequential"), workers=1)
+    parallel = sync_tree(str(src), str(tmp_path / "parallel"), delete=True, workers=8)
+
+    assert len(parallel.created) == 400
+    assert parallel.created == sequential.created == sorted(sequential.created)
+    assert parallel.bytes_written == sequential.bytes_written
+    assert parallel.deleted == ["dir-3/stale.txt"]
+    assert (tmp_path / "parallel" / "dir-19" / "nested" / "file-7.txt").read_text() == (
+        "19/7"
+    )
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_write_errors_are_raised(src, tmp_path, monkeypatch, workers):
+    def failing_copy(src, dst, **kwargs):
+        raise OSError(errno.ENOSPC, "No space left on device")
+
+    monkeypatch.setattr(_sync, "_copy_file_range", failing_copy)
+    monkeypatch.setattr(shutil, "copy2", failing_copy)
+
+    with pytest.raises(OSError, match="No space left"):
+        sync_tree(str(src), str(tmp_path / "dst"), workers=workers)
+    assert not any(name.endswith(".tmp") for name in os.listdir(tmp_path / "dst"))
+
+
+@pytest.mark.skipif(
+    not hasattr(os, "copy_file_range"), reason="requires os.copy_file_range"
+)
+def test_copies_fall_back_without_copy_file_range(src, tmp_path, monkeypatch):
+    calls = []
+
+    def unsupported_copy_file_range(*args):
+        calls.append(args)
+        raise OSError(errno.ENOSYS, "Function not implemented")
+
+    monkeypatch.setattr(os, "copy_file_range", unsupported_copy_file_range)
+    dst = tmp_path / "dst"
+    report = sync_tree(str(src), str(dst), workers=4)
+
+    assert report.created == ["dog.txt", "puppy/cat.txt"]
+    assert (dst / "puppy" / "cat.txt").read_text() == "meow"
+    assert len(calls) == 1
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_ignored_files_are_not_synced(src, tmp_path, workers):
+    (src / "docs").mkdir()
+    (src / "docs" / "index.md").write_text("docs")
+    dst = tmp_path / "dst"
+    (dst / "docs").mkdir(parents=True)
+
+    def ignore(rel_path, is_dir):
+        return rel_path == "docs" or rel_path.endswith("cat.txt")
+
+    report = sync_tree(str(src), str(dst), delete=True, ignore=ignore, workers=workers)
+
+    assert report.created == ["dog.txt"]
+    assert report.deleted == ["docs"]
+    assert sorted(os.listdir(dst)) == ["dog.txt", "puppy"]
+    assert os.listdir(dst / "puppy") == []